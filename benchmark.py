@@ -0,0 +1,334 @@
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import time
+from multiprocessing import Pool, cpu_count
+from utils.catalog import open_catalog
+from utils.compact import STORAGE_LAYOUTS, packed_table
+from utils.dedup import RowDedup
+from utils.search import SearchPool
+from utils.synthetic import FIRST_NAMES, LAST_NAMES, write_csv, write_sqlite
+
+# Direction of every recorded metric: which way is better
+METRICS = {
+    'ingest.rows_per_s': 'higher',
+    'ingest_dedup.rows_per_s': 'higher',
+    'direct.rows_per_s': 'higher',
+    'fts_build.seconds': 'lower',
+    'export.mb_per_s': 'higher',
+    'classify.columns_per_s': 'higher',
+    'query.p50_ms': 'lower',
+    'query.p95_ms': 'lower',
+}
+RESULTS_FILE = 'benchmark_results.json'
+BASELINE_FILE = 'benchmark_baseline.json'
+THRESHOLD = 0.2  # Fail when a metric is more than 20% worse than the baseline
+DEDUP_OVERHEAD_TARGET = 0.15  # Share of load time dedup was meant to add; currently missed (see fts.migrate_csv_to_sqlite)
+STORAGE_COLUMNS = 23  # Column count of the storage comparison, the width of the production meta.db
+
+def generate_inputs(data_dir, rows, files, seed):
+    """Write the synthetic CSV inputs once per (rows, files, seed) and reuse them afterwards."""
+    os.makedirs(data_dir, exist_ok=True)
+    csv_paths = []
+    for i in range(files):
+        csv_path = os.path.join(data_dir, f"leak_{i:02d}.csv")
+        if not os.path.exists(csv_path):
+            write_csv(csv_path + '.tmp', rows // files, seed + i)
+            os.replace(csv_path + '.tmp', csv_path)
+        csv_paths.append(csv_path)
+    return csv_paths
+
+def bench_ingest(csv_paths, sqlite_db, table_name, fts_table_name, loader):
+    import fts
+    column_count = fts.get_max_columns(os.path.dirname(csv_paths[0]))
+    fts.create_sqlite_table(sqlite_db, table_name, column_count)
+    fts.create_fts5_table(sqlite_db, fts_table_name, table_name, column_count)
+    catalog = open_catalog()
+    started = time.perf_counter()
+    for csv_path in csv_paths:
+        fts.migrate_csv_to_sqlite(csv_path, sqlite_db, table_name, fts_table_name, column_count,
+                                  loader=loader, fts_mode='bulk', catalog=catalog)
+    elapsed = time.perf_counter() - started
+    catalog.close()
+    conn = sqlite3.connect(sqlite_db)
+    rows = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+    conn.close()
+    return {'ingest.rows': rows, 'ingest.seconds': elapsed, 'ingest.rows_per_s': rows / elapsed}
+
+def bench_ingest_dedup(csv_paths, work_dir, table_name, fts_table_name, loader):
+    """Ingest with dedup on: the files once (all rows new), then the first file again (all duplicates)."""
+    import fts
+    sqlite_db = os.path.join(work_dir, 'dedup.db')
+    catalog_db = os.path.join(work_dir, 'dedup_catalog.db')
+    for path in (sqlite_db, sqlite_db + '-wal', sqlite_db + '-shm', catalog_db):
+        if os.path.exists(path):
+            os.remove(path)
+    column_count = fts.get_max_columns(os.path.dirname(csv_paths[0]))
+    fts.create_sqlite_table(sqlite_db, table_name, column_count)
+    fts.create_fts5_table(sqlite_db, fts_table_name, table_name, column_count)
+    conn = sqlite3.connect(sqlite_db)
+    dedup = RowDedup(conn.cursor(), table_name)
+    conn.close()
+    catalog = open_catalog(catalog_db)
+    results = {}
+    for name, paths in (('ingest_dedup', csv_paths), ('ingest_dedup.repeat', csv_paths[:1])):
+        started = time.perf_counter()
+        kept_before, dropped_before = dedup.kept, dedup.dropped
+        for csv_path in paths:
+            fts.migrate_csv_to_sqlite(csv_path, sqlite_db, table_name, fts_table_name, column_count,
+                                      loader=loader, fts_mode='bulk', catalog=catalog, dedup=dedup)
+        elapsed = time.perf_counter() - started
+        kept, dropped = dedup.kept - kept_before, dedup.dropped - dropped_before
+        results.update({f'{name}.kept': kept, f'{name}.dropped': dropped,
+                        f'{name}.rows_per_s': (kept + dropped) / elapsed})
+    catalog.close()
+    return results
+
+def bench_direct(data_dir, work_dir, table_name, fts_table_name, rows, files, seed):
+    """Copy synthetic source databases with migrate_direct.py (load only, like bench_ingest)."""
+    import fts
+    import migrate_direct
+    db_paths = []
+    for i in range(files):
+        db_path = os.path.join(data_dir, f"leak_{i:02d}.db")
+        if not os.path.exists(db_path):
+            write_sqlite(db_path + '.tmp', migrate_direct.SOURCE_TABLE, rows // files, seed + i)
+            os.replace(db_path + '.tmp', db_path)
+        db_paths.append(db_path)
+    sqlite_db = os.path.join(work_dir, 'direct.db')
+    catalog_db = os.path.join(work_dir, 'direct_catalog.db')
+    for path in (sqlite_db, sqlite_db + '-wal', sqlite_db + '-shm', catalog_db):
+        if os.path.exists(path):
+            os.remove(path)
+    column_count = len(migrate_direct.read_source_info(db_paths[0])[1])
+    fts.create_content_tables(sqlite_db, table_name, fts_table_name, column_count)
+    catalog = open_catalog(catalog_db)
+    started = time.perf_counter()
+    copied = sum(migrate_direct.copy_database(db_path, sqlite_db, table_name, fts_table_name, catalog=catalog)
+                 for db_path in db_paths)
+    elapsed = time.perf_counter() - started
+    catalog.close()
+    return {'direct.rows': copied, 'direct.seconds': elapsed, 'direct.rows_per_s': copied / elapsed}
+
+def bench_fts_build(sqlite_db, table_name, fts_table_name):
+    import fts
+    started = time.perf_counter()
+    fts.build_fts_index(sqlite_db, fts_table_name, table_name)
+    return {'fts_build.seconds': time.perf_counter() - started}
+
+def bench_export(sqlite_db, table_name, csv_path, processes):
+    import dump_csv
+    conn = sqlite3.connect(sqlite_db)
+    column_names = [info[1] for info in conn.execute(f"PRAGMA table_info({table_name})")]
+    started = time.perf_counter()
+    with Pool(processes) as pool:
+        ranges = dump_csv.split_rowid_ranges(conn, sqlite_db, table_name)
+        size = dump_csv.export_chunks(ranges, csv_path, column_names, pool)
+    conn.close()
+    elapsed = time.perf_counter() - started
+    return {'export.bytes': size, 'export.seconds': elapsed, 'export.mb_per_s': size / elapsed / 1024 / 1024}
+
+def bench_classify(sqlite_db, table_name, repeats):
+    """Columns classified per second; the schema cache is bypassed, or every repeat after the first would be a lookup."""
+    import main
+    columns = 0
+    started = time.perf_counter()
+    for _ in range(repeats):
+        conn = sqlite3.connect(sqlite_db)
+        columns += len(conn.execute(f"PRAGMA table_info({table_name})").fetchall())
+        conn.close()
+        _, renames, error = main.classify_database(sqlite_db, table_name, use_cache=False)
+        if error:
+            raise RuntimeError(error)
+    elapsed = time.perf_counter() - started
+    return {'classify.columns_per_s': columns / elapsed, 'classify.renames': len(renames)}
+
+def bench_query(sqlite_db, table_name, fts_table_name, queries, seed):
+    """Latency of uncached name and email queries through SearchPool, first page of 20."""
+    rng = random.Random(seed)
+    pool = SearchPool(sqlite_db, fts_table_name, table_name, cache_size=0)
+    terms = [rng.choice(LAST_NAMES) if i % 3 else f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+             for i in range(queries)]
+    terms += [f"user{rng.randrange(1000)}" for _ in range(queries // 4)]
+    latencies = []
+    for term in terms:
+        started = time.perf_counter()
+        pool.search(term, 20, substring=False)
+        latencies.append((time.perf_counter() - started) * 1000)
+    pool.close()
+    latencies.sort()
+    return {'query.count': len(latencies),
+            'query.p50_ms': latencies[len(latencies) // 2],
+            'query.p95_ms': latencies[int(len(latencies) * 0.95)]}
+
+def read_bytes():
+    """Bytes this process has read through read() calls so far, or None where /proc is missing."""
+    try:
+        with open('/proc/self/io', 'r') as io_file:
+            return next(int(line.split()[1]) for line in io_file if line.startswith('rchar:'))
+    except OSError:
+        return None
+
+def page_reads(sqlite_db, sql, params):
+    """Run a query on a cold connection (no mmap) and return (pages read, milliseconds)."""
+    conn = sqlite3.connect(f"file:{sqlite_db}?mode=ro", uri=True)
+    conn.execute("PRAGMA mmap_size=0")
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    before = read_bytes()
+    started = time.perf_counter()
+    conn.execute(sql, params).fetchall()
+    elapsed = (time.perf_counter() - started) * 1000
+    after = read_bytes()
+    conn.close()
+    return (None if before is None else (after - before) / page_size), elapsed
+
+def bench_storage(csv_paths, work_dir, fts_table_name, queries, seed, column_count=STORAGE_COLUMNS):
+    """Compare the padded and compact layouts on the same files at a production-like column count.
+
+    For each layout: load plus FTS build time, database and content table size, and the
+    pages read by a cold first-page search and a column-filtered search.
+    """
+    import fts
+    rng = random.Random(seed)
+    terms = [rng.choice(LAST_NAMES) for _ in range(queries)]
+    results = {}
+    for layout in STORAGE_LAYOUTS:
+        sqlite_db = os.path.join(work_dir, f"storage_{layout}.db")
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(sqlite_db + suffix):
+                os.remove(sqlite_db + suffix)
+        table_name = 'main_content'
+        if layout == 'compact':
+            create_table, storage_table = fts.create_compact_table, packed_table(table_name)
+        else:
+            create_table, storage_table = fts.create_sqlite_table, table_name
+        create_table(sqlite_db, table_name, column_count)
+        fts.create_fts5_table(sqlite_db, fts_table_name, table_name, column_count)
+        catalog = open_catalog(os.path.join(work_dir, f"storage_{layout}_catalog.db"))
+        started = time.perf_counter()
+        for csv_path in csv_paths:
+            fts.migrate_csv_to_sqlite(csv_path, sqlite_db, table_name, fts_table_name, column_count,
+                                      loader='native', fts_mode='bulk', catalog=catalog)
+        fts.build_fts_index(sqlite_db, fts_table_name, table_name)
+        elapsed = time.perf_counter() - started
+        catalog.close()
+        os.remove(os.path.join(work_dir, f"storage_{layout}_catalog.db"))
+
+        conn = sqlite3.connect(sqlite_db)
+        content_size = conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = ?", (storage_table,)).fetchone()[0]
+        conn.close()
+        reads = {'search': [], 'column': []}
+        latencies = []
+        for term in terms:
+            for kind, match in (('search', f'"{term}"'), ('column', f'col_3 : "{term}"')):
+                # The query shape of SearchPool.search without snippets
+                pages, elapsed_ms = page_reads(sqlite_db, f"""
+                    SELECT c.*, f.rank, f.rowid FROM (
+                        SELECT rank, rowid FROM {fts_table_name} WHERE {fts_table_name} MATCH ? ORDER BY rank, rowid LIMIT 21
+                    ) f JOIN {table_name} c ON c.id = f.rowid ORDER BY f.rank, f.rowid
+                """, (match,))
+                reads[kind].append(pages)
+                latencies.append(elapsed_ms)
+        latencies.sort()
+        results.update({
+            f'storage.{layout}.ingest_seconds': elapsed,
+            f'storage.{layout}.db_mb': os.path.getsize(sqlite_db) / 1024 / 1024,
+            f'storage.{layout}.content_mb': content_size / 1024 / 1024,
+            f'storage.{layout}.query_p50_ms': latencies[len(latencies) // 2],
+        })
+        for kind, counts in reads.items():
+            if None not in counts:
+                results[f'storage.{layout}.{kind}_pages'] = sum(counts) / len(counts)
+    return results
+
+def compare_to_baseline(results, baseline, threshold=THRESHOLD):
+    """Return a message for every metric worse than the baseline by more than threshold."""
+    regressions = []
+    for metric, better in METRICS.items():
+        if metric not in results or not baseline.get(metric):
+            continue
+        change = (results[metric] - baseline[metric]) / baseline[metric]
+        if better == 'higher':
+            change = -change
+        if change > threshold:
+            regressions.append(f"{metric}: {results[metric]:.3f} vs baseline {baseline[metric]:.3f} ({change:.0%} worse)")
+    return regressions
+
+def run_benchmarks(work_dir, rows, files=4, seed=0, loader='native', processes=cpu_count(),
+                   classify_repeats=20, queries=200, compare_storage=False):
+    """Run every stage on synthetic data in work_dir and return the flat metric dict.
+
+    compare_storage adds the padded vs compact layout comparison (two more full loads).
+    """
+    work_dir = os.path.abspath(work_dir)
+    data_dir = os.path.join(work_dir, f"data_{rows}_{files}_{seed}")
+    csv_paths = generate_inputs(data_dir, rows, files, seed)
+    # Stages write their catalog and output next to the data, never into the repo
+    os.chdir(work_dir)
+    sqlite_db = os.path.join(work_dir, 'bench.db')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(sqlite_db + suffix):
+            os.remove(sqlite_db + suffix)
+    if os.path.exists('catalog.db'):
+        os.remove('catalog.db')
+    table_name, fts_table_name = 'main_content', 'main'
+
+    results = {'config.rows': rows, 'config.files': files, 'config.seed': seed, 'config.loader': loader,
+               'config.processes': processes, 'config.python': platform.python_version(),
+               'config.sqlite': sqlite3.sqlite_version, 'config.started': time.time()}
+    stages = [
+        ('ingest', lambda: bench_ingest(csv_paths, sqlite_db, table_name, fts_table_name, loader)),
+        ('ingest_dedup', lambda: bench_ingest_dedup(csv_paths, work_dir, table_name, fts_table_name, loader)),
+        ('direct', lambda: bench_direct(data_dir, work_dir, table_name, fts_table_name, rows, files, seed)),
+        ('fts_build', lambda: bench_fts_build(sqlite_db, table_name, fts_table_name)),
+        ('export', lambda: bench_export(sqlite_db, table_name, os.path.join(work_dir, 'export.csv'), processes)),
+        ('classify', lambda: bench_classify(sqlite_db, table_name, classify_repeats)),
+        ('query', lambda: bench_query(sqlite_db, table_name, fts_table_name, queries, seed)),
+    ]
+    if compare_storage:
+        stages.append(('storage', lambda: bench_storage(csv_paths, work_dir, fts_table_name, queries // 4, seed)))
+    for name, stage in stages:
+        print(f"Running {name}...")
+        results.update(stage())
+    results['ingest_dedup.overhead'] = 1 - results['ingest_dedup.rows_per_s'] / results['ingest.rows_per_s']
+    return results
+
+if __name__ == "__main__":
+    work_dir = 'bench_work'  # Synthetic inputs and stage outputs; reused between runs
+    rows = 1000000  # Total rows across the synthetic CSV files (1M to 50M)
+    files = 4
+    seed = 0
+    update_baseline = False  # Store this run as the new baseline instead of comparing
+    compare_storage = False  # Also load the data in the padded and compact layouts and compare them
+    repo_dir = os.path.abspath(os.path.dirname(__file__))
+    results_path = os.path.join(repo_dir, RESULTS_FILE)
+    baseline_path = os.path.join(repo_dir, BASELINE_FILE)
+
+    results = run_benchmarks(work_dir, rows, files, seed, compare_storage=compare_storage)
+    with open(results_path, 'w', encoding='utf-8') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+    for metric in METRICS:
+        print(f"{metric}: {results[metric]:.3f}")
+    for metric in sorted(name for name in results if name.startswith('storage.')):
+        print(f"{metric}: {results[metric]:.3f}")
+    overhead = results['ingest_dedup.overhead']
+    print(f"ingest_dedup.overhead: {overhead:.0%} "
+          f"({'meets' if overhead <= DEDUP_OVERHEAD_TARGET else 'MISSES'} the {DEDUP_OVERHEAD_TARGET:.0%} target)")
+    print(f"Results written to {results_path}.")
+
+    if update_baseline or not os.path.exists(baseline_path):
+        with open(baseline_path, 'w', encoding='utf-8') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+        print(f"Baseline written to {baseline_path}.")
+        sys.exit(0)
+    with open(baseline_path, 'r', encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline.get('config.rows') != rows:
+        print(f"Baseline was recorded with {baseline.get('config.rows')} rows; comparing anyway.")
+    regressions = compare_to_baseline(results, baseline)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    sys.exit(1 if regressions else 0)
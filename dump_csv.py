@@ -1,37 +1,132 @@
 import os
 import sqlite3
 import csv
+import io
+import time
+from collections import deque
 from multiprocessing import Pool, cpu_count
+from multiprocessing.pool import ThreadPool
+from utils.catalog import open_catalog, import_text_log, is_done, start_file, save_checkpoint, mark_done
+from utils.formats import EXPORT_FORMATS, PARQUET_ROW_GROUP_ROWS, ParquetSink, compress_chunk, encode_arrow_chunk, require_module
+from utils.metrics import NULL_TIMER, configure, timer, profile, print_summary
 
 # Define the directory where all the .db files are stored
 db_directory = './db'
 chunk_size = 3000  # Number of rows to fetch per chunk
-log_file = 'dumped_databases.txt'  # File to save the paths of successfully dumped databases
+log_file = 'dumped_databases.txt'  # Legacy log of dumped databases, imported into the catalog once
+catalog_stage = 'dump'
 csv_directory = './csv_output'
+max_in_flight = cpu_count() * 2  # Maximum number of chunks being encoded or waiting to be written
+range_rows = 100000  # Rows per range read by one worker
+db_concurrency = 4  # Number of databases exported at the same time
+export_format = 'csv'  # 'csv', 'csv.gz', 'csv.lz4', 'csv.zst' or 'parquet' (lz4, zstandard and pyarrow are optional modules)
+row_group_rows = PARQUET_ROW_GROUP_ROWS  # Rows per Parquet row group
 # Ensure the CSV output directory exists
 if not os.path.exists(csv_directory):
     os.makedirs(csv_directory)
-# Function to write a chunk of rows to CSV
-def write_chunk_to_csv(args):
-    chunk, csv_file_path, column_names, mode = args
-    
-    with open(csv_file_path, mode, newline='', encoding='utf-8') as csv_file:
-        csv_writer = csv.writer(csv_file)
-        
-        # Write the headers only if it's the first chunk
-        if mode == 'w':
-            csv_writer.writerow(column_names)  
-        
-        # Write the rows
-        csv_writer.writerows(chunk)
-
-# Function to dump main table to CSV if it has at least 100,000 rows, with chunking and multiprocessing
-def dump_table_if_large(db_path):
+# Function to name the export file of a database; the catalog tracks each database per export file
+def export_path(db_path):
+    return os.path.join(csv_directory, os.path.splitext(os.path.basename(db_path))[0] + EXPORT_FORMATS[export_format])
+
+# Function to encode a chunk of rows as CSV bytes (runs in the worker processes)
+def encode_chunk_to_csv(chunk):
+    buffer = io.StringIO()
+    csv_writer = csv.writer(buffer)
+    csv_writer.writerows(chunk)
+    return buffer.getvalue().encode('utf-8')
+
+# Function to read one rowid range on its own read-only connection and encode it (runs in the worker processes)
+def encode_rowid_range(args):
+    db_path, table_name, first_rowid, last_rowid, export_format = args
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        cursor = conn.execute(f"SELECT * FROM {table_name} WHERE rowid BETWEEN ? AND ? ORDER BY rowid", (first_rowid, last_rowid))
+        if export_format == 'parquet':
+            return encode_arrow_chunk(cursor.fetchall(), [column[0] for column in cursor.description])
+        buffer = io.StringIO()
+        csv_writer = csv.writer(buffer)
+        while True:
+            chunk = cursor.fetchmany(chunk_size)
+            if not chunk:
+                break
+            csv_writer.writerows(chunk)
+        # Each range is compressed on its own, in parallel; see utils.formats.compress_chunk
+        return compress_chunk(buffer.getvalue().encode('utf-8'), export_format)
+    finally:
+        conn.close()
+
+def split_rowid_ranges(conn, db_path, table_name, min_rowid=None, range_rows=range_rows, export_format='csv'):
+    """Split the rows from min_rowid on into consecutive rowid ranges of range_rows rows each.
+
+    Boundaries are the rowids found range_rows rows apart, so gaps left by deleted rows
+    do not make ranges uneven. The last range ends at the largest rowid.
+    """
+    if min_rowid is None:
+        min_rowid = conn.execute(f"SELECT MIN(rowid) FROM {table_name}").fetchone()[0]
+    max_rowid = conn.execute(f"SELECT MAX(rowid) FROM {table_name}").fetchone()[0]
+    ranges = []
+    first = min_rowid
+    while first is not None and first <= max_rowid:
+        boundary = conn.execute(f"SELECT rowid FROM {table_name} WHERE rowid >= ? ORDER BY rowid LIMIT 1 OFFSET ?",
+                                (first, range_rows)).fetchone()
+        last = max_rowid if boundary is None else boundary[0] - 1
+        ranges.append((db_path, table_name, first, last, export_format))
+        first = None if boundary is None else boundary[0]
+    return ranges
+
+# Function to write encoded chunks to one CSV file in sequence order
+def export_chunks(tasks, csv_file_path, column_names, pool, encode=encode_rowid_range, max_in_flight=max_in_flight,
+                  resume_offset=0, on_write=None, stage_timer=NULL_TIMER, export_format='csv', row_group_rows=row_group_rows):
+    """Encode tasks in the pool and write the results in order, with at most max_in_flight pending.
+
+    Returns the file size in bytes. The output is identical to writing the rows
+    serially with csv.writer on a file opened with newline='' (and compressing it for
+    the csv.* formats). With resume_offset the file is cut back to that offset and
+    appended to instead of rewritten; on_write(task, offset) is called once a task's
+    bytes are flushed to the file. Parquet files are written whole, in row groups of
+    row_group_rows, and never resumed. Time spent waiting for the workers is added to
+    stage_timer's wait time.
+    """
+    pending = deque()
+
+    def write_oldest(output):
+        task, result = pending.popleft()
+        with stage_timer.waiting():
+            data = result.get()
+        output.write(data)
+        if on_write is not None:
+            output.flush()
+            on_write(task, output.tell())
+
+    if export_format == 'parquet':
+        output = ParquetSink(csv_file_path, column_names, row_group_rows)
+        on_write = None
+    else:
+        mode = 'r+b' if resume_offset else 'wb'
+        output = open(csv_file_path, mode, buffering=8 * 1024 * 1024)
+        if resume_offset:
+            output.truncate(resume_offset)
+            output.seek(resume_offset)
+        else:
+            # Write the headers first
+            output.write(compress_chunk(encode_chunk_to_csv([column_names]), export_format))
+    with output:
+        for task in tasks:
+            # Backpressure: wait for the oldest chunk before submitting more work
+            if len(pending) >= max_in_flight:
+                write_oldest(output)
+            pending.append((task, pool.apply_async(encode, (task,))))
+        while pending:
+            write_oldest(output)
+    return os.path.getsize(csv_file_path)
+
+# Function to dump main table to CSV if it has at most 200,000 rows, split into rowid ranges read in parallel
+def dump_table_if_large(db_path, pool=None):
     # Connect to the SQLite database
-    conn = sqlite3.connect(db_path)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
     cursor = conn.cursor()
 
-    # Check if the main table has 100,000 or more rows
+    # Check if the main table has at most 200,000 rows; rowids can have gaps, so they are counted
     cursor.execute("SELECT COUNT(*) FROM main")  # Replace 'main' with the actual table name if different
     row_count = cursor.fetchone()[0]
 
@@ -41,53 +136,83 @@ def dump_table_if_large(db_path):
         column_names = [info[1] for info in cursor.fetchall()]
 
         # Generate the CSV file name based on the database file name
-        csv_file_name = os.path.splitext(os.path.basename(db_path))[0] + '.csv'
-        csv_file_path = os.path.join(csv_directory, csv_file_name)
+        csv_file_path = export_path(db_path)
+        csv_file_name = os.path.basename(csv_file_path)
+
+        # Resume an interrupted dump after the last range that reached the file
+        catalog = open_catalog()
+        checkpoint = start_file(catalog, catalog_stage, db_path, target=csv_file_path)
+        resume_offset = 0
+        min_rowid = None  # Start from the first row
+        # The checkpoint is the one of this export file, so the format matches
+        if checkpoint is not None and checkpoint['byte_offset'] and os.path.exists(csv_file_path):
+            resume_offset = checkpoint['byte_offset']
+            min_rowid = checkpoint['last_rowid'] + 1
+            print(f"Resuming {csv_file_name} after rowid {checkpoint['last_rowid']}.")
+
+        def checkpoint_range(task, offset):
+            save_checkpoint(catalog, catalog_stage, db_path, last_rowid=task[3], byte_offset=offset, target=csv_file_path)
 
         print(f"Dumping {csv_file_name} with {row_count} rows.")
 
-        # Use multiprocessing to handle writing chunks
-        pool = Pool(cpu_count())  # Create a pool of workers
-        
-        # Query and fetch the rows in chunks
-        cursor.execute("SELECT * FROM main")
-        chunk_counter = 0
-        while True:
-            chunk = cursor.fetchmany(chunk_size)
-            if not chunk:
-                break
-            
-            mode = 'w' if chunk_counter == 0 else 'a'  # Write mode for the first chunk, append mode for the rest
-            pool.apply_async(write_chunk_to_csv, [(chunk, csv_file_path, column_names, mode)])
-            chunk_counter += 1
+        # Workers read and encode rowid ranges in parallel; this thread writes them in order
+        own_pool = pool is None
+        if own_pool:
+            pool = Pool(cpu_count())  # Create a pool of workers
+        started = time.perf_counter()
+
+        export = timer('export', db_path)
+        ranges = [] if row_count == 0 else split_rowid_ranges(conn, db_path, 'main', min_rowid, range_rows, export_format)
+        with profile(db_path), export:
+            file_size = export_chunks(ranges, csv_file_path, column_names, pool,
+                                      resume_offset=resume_offset, on_write=checkpoint_range, stage_timer=export,
+                                      export_format=export_format)
+        bytes_written = file_size - resume_offset
+        export.add(rows=row_count, bytes=bytes_written)
+        export.close()
+
+        if own_pool:
+            pool.close()
+            pool.join()
 
-        pool.close()
-        pool.join()
-        
-        print(f"{csv_file_name} created in {csv_directory}.")
+        elapsed = time.perf_counter() - started
+        rate = bytes_written / elapsed / 1024 / 1024 if elapsed > 0 else 0.0
+        print(f"{csv_file_name} created in {csv_directory} ({bytes_written} bytes, {rate:.1f} MB/s).")
 
-        # Log the database path to the log file
-        with open(log_file, 'a',encoding='utf-8') as log:
-            log.write(f"{db_path}\n")
+        # Record the dumped database in the catalog
+        mark_done(catalog, catalog_stage, db_path, target=csv_file_path)
+        catalog.close()
 
     else:
-        print(f"{db_path} has less than 200,000 rows. Skipping.")
+        print(f"{db_path} has more than 200,000 rows. Skipping.")
     
     # Close the database connection
     conn.close()
 
-def is_file_migrated(filename):
-    """Check if the given filename is in the migrated files list."""
-    if not os.path.exists(log_file):
-        return False 
+def dump_databases(db_paths, processes=cpu_count(), concurrency=db_concurrency):
+    """Export several databases at once, largest files first, sharing one worker pool."""
+    require_module(export_format)  # Fail before any work when the format's module is missing
+    db_paths = sorted(db_paths, key=os.path.getsize, reverse=True)
+    with Pool(processes) as pool, ThreadPool(concurrency) as scheduler:
+        started = time.perf_counter()
+        for _ in scheduler.imap_unordered(lambda db_path: dump_table_if_large(db_path, pool), db_paths):
+            pass
+    print(f"Exported {len(db_paths)} databases in {time.perf_counter() - started:.1f}s.")
+
 # Loop through all .db files in the /db folder
 if __name__ == '__main__':
+    catalog = open_catalog()
+    import_text_log(catalog, catalog_stage, log_file)
     db_files = [f for f in os.listdir(db_directory) if f.endswith('.db')]
     tasks=[]
     for db_file in db_files:
-        if is_file_migrated (db_file):
+        db_path = os.path.join(db_directory, db_file)
+        if is_done(catalog, catalog_stage, db_path, target=export_path(db_path)):
             continue
         tasks.append(db_file)            
-    for db_file in tasks:
-        db_path = os.path.join(db_directory, db_file)
-        dump_table_if_large(db_path)
+    catalog.close()
+    metrics_file = None  # JSON lines of per-stage timings, e.g. 'metrics.jsonl'
+    profile_file = None  # Name of one database file to run under cProfile
+    configure(metrics_file, profile_file)
+    dump_databases([os.path.join(db_directory, db_file) for db_file in tasks])
+    print_summary()
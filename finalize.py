@@ -0,0 +1,159 @@
+import os
+import random
+import re
+import sqlite3
+import stat
+import time
+import fts
+from utils.metrics import configure, record, print_summary
+from utils.search import SearchPool, SERVING_TABLE, TRIGRAM_SUFFIX, open_reader
+from utils.sources import content_columns
+from utils.tables import rename_content_table
+
+PAGE_SIZE = 16384  # Page size of the finalized copy; see finalize()
+ANALYSIS_LIMIT = 1000  # Rows ANALYZE samples per index, as PRAGMA optimize does; 0 reads them all
+QUERIES = 200  # Benchmark searches run before and after
+MMAP_ROUNDING = 64 * 1024 * 1024  # The recommended mmap_size is the file size rounded up to this
+
+def get_fts_names(sqlite_db, fts_table_name):
+    """The FTS tables of a database: the main index and its trigram index if there is one."""
+    conn = open_reader(sqlite_db)
+    names = [name for name in (fts_table_name, fts_table_name + TRIGRAM_SUFFIX) if fts.get_fts_columns(conn.cursor(), name)]
+    conn.close()
+    return names
+
+def database_stats(sqlite_db, fts_names):
+    """File size (WAL included), page size, page and free page counts, and FTS segments per index."""
+    conn = open_reader(sqlite_db)
+    wal_path = sqlite_db + '-wal'
+    stats = {
+        'file_mb': (os.path.getsize(sqlite_db) + (os.path.getsize(wal_path) if os.path.exists(wal_path) else 0)) / 1024 / 1024,
+        'page_size': conn.execute("PRAGMA page_size").fetchone()[0],
+        'pages': conn.execute("PRAGMA page_count").fetchone()[0],
+        'free_pages': conn.execute("PRAGMA freelist_count").fetchone()[0],
+    }
+    for name in fts_names:
+        stats[f'{name}_segments'] = fts.get_segment_count(conn.cursor(), name)
+    conn.close()
+    return stats
+
+def sample_terms(sqlite_db, table_name, count=QUERIES, seed=0):
+    """Pick search terms from random content rows: one word of 3+ characters per row."""
+    rng = random.Random(seed)
+    conn = open_reader(sqlite_db)
+    column_list = ", ".join(content_columns(conn, table_name))
+    max_rowid = conn.execute(f"SELECT IFNULL(MAX(id), 0) FROM {table_name}").fetchone()[0]
+    terms = []
+    for _ in range(count * 10 if max_rowid else 0):
+        row = conn.execute(f"SELECT {column_list} FROM {table_name} WHERE id >= ? ORDER BY id LIMIT 1",
+                           (rng.randint(1, max_rowid),)).fetchone()
+        words = [word for value in row or () if value for word in re.findall(r'\w{3,}', str(value))]
+        if words:
+            terms.append(rng.choice(words))
+        if len(terms) == count:
+            break
+    conn.close()
+    return terms
+
+def query_latency(sqlite_db, table_name, fts_table_name, terms):
+    """p50 and p95 milliseconds of first-page searches through SearchPool, as served.
+
+    Every term is searched once to warm the page cache and timed on the second run, so
+    a freshly written copy and a database read long ago are compared on equal terms.
+    """
+    if not terms:
+        return {}
+    pool = SearchPool(sqlite_db, fts_table_name, table_name, size=1, cache_size=0)
+    for term in terms:
+        pool.search(term, 20, substring=False)
+    latencies = []
+    for term in terms:
+        started = time.perf_counter()
+        pool.search(term, 20, substring=False)
+        latencies.append((time.perf_counter() - started) * 1000)
+    pool.close()
+    latencies.sort()
+    return {'query_p50_ms': latencies[len(latencies) // 2], 'query_p95_ms': latencies[int(len(latencies) * 0.95)]}
+
+def mark_serving(sqlite_db, table_name):
+    """Record how a finalized copy is served, make the file read-only, and return the recommended mmap_size.
+
+    utils.search.open_reader reads these settings: the copy is opened immutable=1 (no
+    locking or change checks, safe because nothing writes it again) and mapped whole.
+    """
+    mmap_size = -(-os.path.getsize(sqlite_db) // MMAP_ROUNDING) * MMAP_ROUNDING
+    conn = sqlite3.connect(sqlite_db)
+    conn.execute(f"CREATE TABLE {SERVING_TABLE} (key TEXT PRIMARY KEY, value)")
+    conn.executemany(f"INSERT INTO {SERVING_TABLE} (key, value) VALUES (?, ?)", [
+        ('immutable', 1), ('mmap_size', mmap_size), ('table_name', table_name), ('finalized', time.time())])
+    conn.commit()
+    conn.close()
+    os.chmod(sqlite_db, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+    return mmap_size
+
+def finalize(sqlite_db, output_db, table_name='main_content', fts_table_name='main', new_table_name='data',
+             page_size=PAGE_SIZE, analysis_limit=ANALYSIS_LIMIT, queries=QUERIES, seed=0):
+    """Write a read-optimized copy of a loaded database for serving, in one copy pass.
+
+    sqlite_db itself is modified: its FTS5 indexes are merged into one segment each
+    ('optimize') and its statistics refreshed (ANALYZE) in place, so the copy inherits
+    both without a second pass. Neither changes its content or gets in the way of later
+    loads, but the merge rewrites the whole index. VACUUM INTO then writes output_db defragmented, without free pages, in rollback-journal mode
+    and at page_size: larger pages keep more of an FTS5 doclist in one read. With
+    new_table_name the copy's content table is renamed (see rename_content_table), which
+    is what rename.py did by hand. The copy is marked for immutable serving (see
+    mark_serving). Size, pages, segments and search latency before and after are printed.
+    """
+    if os.path.abspath(output_db) == os.path.abspath(sqlite_db):
+        raise ValueError("output_db must differ from sqlite_db: the copy is written next to the original")
+    fts_names = get_fts_names(sqlite_db, fts_table_name)
+    before = database_stats(sqlite_db, fts_names)
+    terms = sample_terms(sqlite_db, table_name, queries, seed)
+    before.update(query_latency(sqlite_db, table_name, fts_table_name, terms))
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(sqlite_db)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    for name in fts_names:
+        conn.execute(f"INSERT INTO {name} ({name}) VALUES ('optimize')")
+    conn.commit()
+    conn.execute(f"PRAGMA analysis_limit={int(analysis_limit)}")
+    conn.execute("ANALYZE")
+    conn.commit()
+    for path in (output_db, output_db + '-journal'):
+        if os.path.exists(path):
+            # An earlier finalized copy is read-only
+            os.chmod(path, stat.S_IRUSR | stat.S_IWUSR)
+            os.remove(path)
+    conn.execute(f"PRAGMA page_size={int(page_size)}")
+    conn.execute("VACUUM INTO ?", (output_db,))
+    conn.close()
+    if new_table_name and new_table_name != table_name:
+        rename_content_table(output_db, table_name, new_table_name)
+        table_name = new_table_name
+    mmap_size = mark_serving(output_db, table_name)
+    elapsed = time.perf_counter() - started
+
+    after = database_stats(output_db, fts_names)
+    after.update(query_latency(output_db, table_name, fts_table_name, terms))
+    record('finalize', sqlite_db, elapsed, bytes=os.path.getsize(output_db), pages=after['pages'], page_size=after['page_size'])
+    print(f"Finalized {sqlite_db} into {output_db} in {elapsed:.2f}s.")
+    print(f"{'':<24} {'before':>12} {'after':>12}")
+    for name in before:
+        if name in after:
+            print(f"{name:<24} {before[name]:>12,.1f} {after[name]:>12,.1f}")
+    print(f"Serve {output_db} read-only with immutable=1 and PRAGMA mmap_size={mmap_size} "
+          f"(utils.search.open_reader applies both; SQLite caps mmap_size at its compile-time maximum).")
+    return before, after
+
+if __name__ == "__main__":
+    sqlite_db = 'meta.db'  # Database loaded by fts.py; its FTS indexes are optimized and ANALYZEd in place
+    output_db = 'meta_serving.db'  # Read-only copy to serve searches from
+    table_name = 'main_content'
+    fts_table_name = 'main'
+    new_table_name = 'data'  # Content table name in the copy; None keeps table_name
+    page_size = PAGE_SIZE  # 4096 to 65536, a power of two
+    metrics_file = None  # JSON lines of per-stage timings, e.g. 'metrics.jsonl'
+    configure(metrics_file)
+    finalize(sqlite_db, output_db, table_name, fts_table_name, new_table_name, page_size)
+    print_summary()
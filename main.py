@@ -1,100 +1,164 @@
 import sqlite3
 import re
 import os
+import csv
+import pandas as pd
+from multiprocessing import Pool, cpu_count
+from utils.catalog import open_catalog, import_text_log, is_done, mark_done
+from utils.classify import name_pattern, email_pattern, phone_pattern, classify_frame, sample_table, is_phone
+from utils.metrics import configure, timer, print_summary
+from utils.schema_cache import schema_fingerprint, get_mapping, save_mapping, hit_counts, print_hit_rate
 # Usage
 sqlite_folder = 'z:/'
-TRACKING_FILE = 'rename.txt'
-# Regex patterns for different types
-name_pattern = re.compile(r'\b[AА][а-яА-ЯёЁ]+ [AА][а-яА-ЯёЁ]+\b')  # Basic name pattern
-email_pattern = re.compile(r'([A-Za-z0-9]+[.-_])*[A-Za-z0-9]+@[A-Za-z0-9-]+(\.[A-Z|a-z]{2,})+')  # Simple email regex
-phone_pattern = re.compile(r'\+?\d{1,3}[\s\-]?\(?\d{1,5}\)?[\s\-]?\d{1,4}[\s\-]?\d{1,4}[\s\-]?\d{1,4}')
+TRACKING_FILE = 'rename.txt'  # Legacy log of renamed databases, imported into the catalog once
+CATALOG_STAGE = 'rename'
+RENAME_REPORT = 'rename_plan.csv'  # Planned renames written by a dry run
+SAMPLE_SEED = 0  # Fixed, so an unchanged table samples the same rows, and fingerprints the same, on every run
+# Regex patterns for different types live in utils.classify
 # Function to detect column type using regex
 def detect_column_type(column_data): 
-    name_type = {'phone_number':0, 'email':0, 'full_name':0}
-    # Check the first few rows of data to detect the type
-    for item in column_data:
-        if email_pattern.match(str(item)):
-            name_type['email'] += 1        
-        elif name_pattern.match(str(item)):
-            name_type['full_name'] += 1
-        elif detect_phone(str(item)):
-            name_type['phone_number'] += 1
-    col_name = next((key for key, value in name_type.items() if value > 50), None)
-    return col_name
+    column = pd.DataFrame({'column': list(column_data)})
+    return classify_frame(column)['column']['type']
 
 def detect_phone(column_data):
-    if re.search(phone_pattern, str(column_data)):        
-        normalized_number = re.sub(r'[^a-zA-Zа-яА-Я0-9\s]', '', str(column_data))
-        if normalized_number.startswith('8') and len(normalized_number) == 11:
-            return True
-        elif normalized_number.startswith('7') and len(normalized_number) == 11:
-            return True        
-    return False
-# Function to rename columns in the SQLite database
-def rename_columns_based_on_data(db_path, table_name):
-    # Connect to the SQLite database
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    try:
-        # Get the column names from the specified table
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        columns_info = cursor.fetchall()
-        column_names = [col[1] for col in columns_info]
+    return is_phone(column_data)
 
-        print("Original Columns:", column_names)        
-        # Loop through each column and detect its type based on data
-        renamed_columns = {}
-        for column in column_names:
-            # Query to get the first 20 rows of data for each column
-            cursor.execute(f"SELECT {column} FROM {table_name} LIMIT 100")
-            column_data = [row[0] for row in cursor.fetchall()]
+def plan_renames(column_names, results):
+    """Turn classify_frame results into [(old_name, new_name, confidence), ...].
 
-            # Detect column type based on data using regex
-            detected_type = detect_column_type(column_data)
-            if detected_type:
-                renamed_columns[column] = detected_type
+    Repeated types get a numeric suffix (phone_number, phone_number_1, ...) so the
+    renames never collide.
+    """
+    taken = set(column_names)
+    renames = []
+    for column, result in results.items():
+        detected_type = result['type']
+        if not detected_type or column.startswith(detected_type):
+            continue
+        new_name, suffix = detected_type, 0
+        while new_name in taken:
+            suffix += 1
+            new_name = f"{detected_type}_{suffix}"
+        taken.add(new_name)
+        renames.append((column, new_name, result['confidence']))
+    return renames
 
-        # If there are columns to rename, proceed
-        if renamed_columns:
-            print("Columns to Rename:", renamed_columns)
+# Function to plan column renames for one database (runs in the worker processes)
+def classify_database(db_path, table_name, use_cache=True):
+    """Classify a database over a read-only connection and return its planned renames.
 
-            # Start building the ALTER TABLE SQL commands
-            alter_commands = []
-            for old_name, new_name in renamed_columns.items():
-                alter_commands.append(f"ALTER TABLE {table_name} RENAME COLUMN {old_name} TO {new_name}")
+    Returns (db_path, [(old_name, new_name, confidence), ...], error). A sample whose
+    header and value shapes match a database seen before reuses its renames from the
+    schema cache (utils.schema_cache) instead of being classified; use_cache=False
+    always classifies and leaves the cache alone.
+    """
+    classify = timer('classify', db_path)
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        catalog = open_catalog()
+        try:
+            with classify:
+                columns = conn.execute(f"PRAGMA table_info({table_name})").fetchall()
+                column_names = [col[1] for col in columns]
+                key_columns = [col[1] for col in columns if col[5] and col[2].upper() == 'INTEGER']
+                sample = sample_table(conn, table_name, column_names, seed=SAMPLE_SEED)
+                fingerprint = schema_fingerprint(sample, key_columns)
+                renames = get_mapping(catalog, CATALOG_STAGE, fingerprint) if use_cache else None
+                cache_hit = renames is not None
+                if not cache_hit:
+                    renames = plan_renames(column_names, classify_frame(sample))
+                    if use_cache:
+                        save_mapping(catalog, CATALOG_STAGE, fingerprint, column_names, renames)
+        finally:
+            catalog.close()
+            conn.close()
+    except sqlite3.Error as e:
+        return db_path, [], str(e)
+    classify.add(columns=len(column_names), cache_hits=int(cache_hit))
+    classify.close()
+    return db_path, [tuple(rename) for rename in renames], None
 
-            # Execute each rename command
-            for command in alter_commands:
-                cursor.execute(command)
+def apply_renames(db_path, table_name, renames):
+    """Apply planned renames in one short write transaction."""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            for old_name, new_name, _ in renames:
+                command = f'ALTER TABLE {table_name} RENAME COLUMN "{old_name}" TO "{new_name}"'
+                conn.execute(command)
                 print(f"Executed: {command}")
+    finally:
+        conn.close()
+
+def write_rename_report(plans, report_path=RENAME_REPORT):
+    """Write planned renames as CSV rows: database, column, new name, confidence, error."""
+    with open(report_path, 'w', newline='', encoding='utf-8') as report:
+        writer = csv.writer(report)
+        writer.writerow(['db_path', 'column', 'new_name', 'confidence', 'error'])
+        for db_path, renames, error in plans:
+            if error:
+                writer.writerow([db_path, '', '', '', error])
+            for old_name, new_name, confidence in renames:
+                writer.writerow([db_path, old_name, new_name, f"{confidence:.3f}", ''])
+    print(f"Planned renames written to {report_path}.")
 
-            # Commit the changes to the database
-            conn.commit()
+# Function to rename columns in the SQLite database
+def rename_columns_based_on_data(db_path, table_name):
+    _, renames, error = classify_database(db_path, table_name)
+    try:
+        if error:
+            print(f"Error: {error}")
+        elif renames:
+            print("Columns to Rename:", {old_name: new_name for old_name, new_name, _ in renames})
+            apply_renames(db_path, table_name, renames)
             print("Column renaming completed and saved to the database.")
         else:
             print("No columns matched the patterns.")
-
     except Exception as e:
         print(f"Error: {e}")
     finally:
-        # Close the connection
-        conn.close()
-        with open(TRACKING_FILE, 'a', encoding="utf-8") as f:
-            f.write(f"{db_path}\n")
-def is_file_migrated(filename):
-    """Check if the given filename is in the migrated files list."""
-    if not os.path.exists(TRACKING_FILE):
-        return False  
+        catalog = open_catalog()
+        mark_done(catalog, CATALOG_STAGE, db_path, target=db_path)
+        catalog.close()
+
+def scan_databases(db_paths, table_name, processes=cpu_count(), dry_run=False, report_path=RENAME_REPORT):
+    """Classify many databases concurrently, then apply the renames in a short write phase.
+
+    With dry_run the planned renames are only written to report_path and no database is touched.
+    """
+    catalog = open_catalog()
+    cache_counts = hit_counts(catalog, CATALOG_STAGE)
+    catalog.close()
+    with Pool(processes) as pool:
+        plans = pool.starmap(classify_database, [(db_path, table_name) for db_path in db_paths], chunksize=8)
+    catalog = open_catalog()
+    print_hit_rate(catalog, CATALOG_STAGE, cache_counts)
+    if dry_run:
+        catalog.close()
+        write_rename_report(plans, report_path)
+        return plans
 
-    with open(TRACKING_FILE, 'r', encoding="utf-8") as f:
-        migrated_files = f.read().splitlines() 
+    for db_path, renames, error in plans:
+        if error:
+            print(f"Error in {db_path}: {error}")
+        elif renames:
+            try:
+                apply_renames(db_path, table_name, renames)
+            except sqlite3.Error as e:
+                print(f"Error in {db_path}: {e}")
+        mark_done(catalog, CATALOG_STAGE, db_path, target=db_path)
+    catalog.close()
+    return plans
 
-    return filename in migrated_files 
 if __name__ == "__main__": 
     sqlite_files = [os.path.join(sqlite_folder, file) for file in os.listdir(sqlite_folder) if file.endswith('.db')]
     table_name = 'main_content'      # The table you want to modify
-    for db_path in sqlite_files:
-        if is_file_migrated (db_path):
-                continue
-        rename_columns_based_on_data(db_path, table_name)
+    dry_run = False  # Only write the planned renames to RENAME_REPORT
+    metrics_file = None  # JSON lines of per-stage timings, e.g. 'metrics.jsonl'
+    configure(metrics_file)
+    catalog = open_catalog()
+    import_text_log(catalog, CATALOG_STAGE, TRACKING_FILE)
+    pending = [db_path for db_path in sqlite_files if not is_done(catalog, CATALOG_STAGE, db_path)]
+    catalog.close()
+    scan_databases(pending, table_name, dry_run=dry_run)
+    print_summary()
@@ -2,18 +2,24 @@ import os
 import pandas as pd
 import sqlite3
 from utils.rename import rename_func
-import chardet
-from io import TextIOWrapper
-MIGRATED_FILES_LOG = 'migrated_files.txt'
-def migrate_csv_to_sqlite(csv_file, sqlite_db, table_name, chunk_size=5000):
+import time
+from itertools import islice
+from utils.bulk_load import apply_ingest_pragmas, read_csv_header, stream_csv_rows, load_rows, report_throughput, BATCH_SIZE
+from utils.catalog import open_catalog, import_text_log, is_done, start_file, save_checkpoint, mark_done, get_in_progress, catalog_path
+from utils.encoding import get_encoding, open_text, record_decode_stats
+from utils.metrics import configure, record, timer, timed, profile, print_summary
+MIGRATED_FILES_LOG = 'migrated_files.txt'  # Legacy log, imported into the catalog once
+CATALOG_STAGE = 'migrate'
+def migrate_csv_to_sqlite(csv_file, sqlite_db, table_name, chunk_size=5000, loader='pandas', batch_size=BATCH_SIZE, catalog=None):
     # Connect to SQLite database (create if not exists)
     conn = sqlite3.connect(sqlite_db)
     cursor = conn.cursor()
+    own_catalog = catalog is None
+    if own_catalog:
+        catalog = open_catalog()
     
-    # Detect encoding
-    with open(csv_file, 'rb') as f:
-        result = chardet.detect(f.read(1000))
-        encoding = result['encoding']
+    # Detect encoding (cached in the catalog); mixed files fall back per bad byte run instead of per file
+    verdict = get_encoding(csv_file, catalog)
 
     # Check if the table exists, if not create it
     cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table_name}';")
@@ -30,24 +36,60 @@ def migrate_csv_to_sqlite(csv_file, sqlite_db, table_name, chunk_size=5000):
         cursor.execute(create_table_query)
         conn.commit()  # Commit after table creation
 
-    # Read the first 20 rows to get column names
-    try:
-        df = pd.read_csv(csv_file, skiprows=range(5), nrows=25, encoding=encoding)
-    except UnicodeDecodeError:
-        print(f"Failed with encoding {encoding}. Retrying with 'ISO-8859-1'.")
-        encoding = 'ISO-8859-1'  # Fallback encoding
-        df = pd.read_csv(csv_file, skiprows=range(5), nrows=25, encoding=encoding)
+    # Resume an interrupted file from its last checkpoint, dropping rows committed after it
+    last_rowid = cursor.execute(f"SELECT IFNULL(MAX(id), 0) FROM {table_name}").fetchone()[0]
+    checkpoint = start_file(catalog, CATALOG_STAGE, csv_file, target=sqlite_db, last_rowid=last_rowid)
+    rows_done = 0
+    if checkpoint is not None:
+        rows_done = checkpoint['rows_done']
+        cursor.execute(f"DELETE FROM {table_name} WHERE id > ?", (checkpoint['last_rowid'],))
+        conn.commit()
+        print(f"Resuming {csv_file} after {rows_done} rows (discarded {cursor.rowcount} uncheckpointed rows).")
 
-    column_names = rename_func(df)
-    print("Renamed columns:", column_names)
-    with open(csv_file, "rb") as f:
-        text_file = TextIOWrapper(f, encoding="utf-8", errors="replace")
-    # Read CSV in chunks with error handling
-        for chunk in pd.read_csv(text_file, chunksize=chunk_size, on_bad_lines='skip'):
-            print("Processing chunk columns:", chunk.columns)        
+    def checkpoint_rows(total_rows):
+        committed_rowid = cursor.execute(f"SELECT IFNULL(MAX(id), 0) FROM {table_name}").fetchone()[0]
+        save_checkpoint(catalog, CATALOG_STAGE, csv_file, rows_done=rows_done + total_rows, last_rowid=committed_rowid, target=sqlite_db)
+
+    started = time.perf_counter()
+    row_count = 0
+    # One decoded stream per file: the column names come from its header, read by the loader
+    text_file, decode_stats = open_text(csv_file, verdict)
+    if loader == 'native':
+        header = read_csv_header(text_file) or []
+        column_names = rename_func(pd.DataFrame(columns=header))
+        print("Renamed columns:", column_names)
+        # Add any missing columns once, then stream rows from the csv module into a prepared INSERT
+        existing_columns = [col[1] for col in cursor.execute(f"PRAGMA table_info({table_name})").fetchall()]
+        for column in column_names:
+            quoted_column = f'"{column}"'
+            if column not in existing_columns:
+                try:
+                    cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {quoted_column} TEXT")
+                    print(f"Added column: {quoted_column}")
+                except sqlite3.OperationalError as e:
+                    print(f"Error adding column {quoted_column}: {e}")
+        conn.commit()
+        apply_ingest_pragmas(conn)
+        rows = islice(stream_csv_rows(text_file, len(header), len(column_names)), rows_done, None)
+        row_count = load_rows(conn, table_name, column_names, rows, batch_size, on_commit=checkpoint_rows, source=csv_file)
+    else:
+        # Read CSV in chunks with error handling
+        rows_to_skip = rows_done
+        column_names = None
+        parse, insert, commit = (timer(stage, csv_file) for stage in ('parse', 'insert', 'commit'))
+        for chunk in timed(pd.read_csv(text_file, chunksize=chunk_size, on_bad_lines='skip'), parse):
+            if column_names is None:
+                column_names = rename_func(chunk)
+                print("Renamed columns:", column_names)
+            if rows_to_skip:
+                # Rows up to the checkpoint are already in the table
+                skipped = min(rows_to_skip, len(chunk))
+                chunk = chunk.iloc[skipped:]
+                rows_to_skip -= skipped
+                if chunk.empty:
+                    continue
             # Get existing columns in the SQLite table
             existing_columns = [col[1] for col in cursor.execute(f"PRAGMA table_info({table_name})").fetchall()]
-            print(column_names)
             chunk.columns = column_names            
             # Add any missing columns to the SQLite table
             for column in column_names:
@@ -62,38 +104,54 @@ def migrate_csv_to_sqlite(csv_file, sqlite_db, table_name, chunk_size=5000):
             # Rename chunk columns
             chunk.columns = column_names  # Rename chunk columns to match the final structure
             # Insert data into SQLite table
-            chunk.to_sql(table_name, conn, if_exists='append', index=False)
+            with insert:
+                chunk.to_sql(table_name, conn, if_exists='append', index=False)
+            with commit:
+                conn.commit()
+            row_count += len(chunk)
+            checkpoint_rows(row_count)
+        parse.add(rows=row_count)
+        insert.add(rows=row_count)
+        for stage_timer in (parse, insert, commit):
+            stage_timer.close()
     # Commit and close the connection
     conn.commit()
     conn.close()   
-    with open(MIGRATED_FILES_LOG, 'a', encoding='utf-8') as log_file:
-        log_file.write(f"{csv_file}\n")
-
-def is_file_migrated(filename):
-    """Check if the given filename is in the migrated files list."""
-    if not os.path.exists(MIGRATED_FILES_LOG):
-        return False  
-
-    with open(MIGRATED_FILES_LOG, 'r', encoding="utf-8") as f:
-        migrated_files = f.read().splitlines() 
-
-    return filename in migrated_files 
+    text_file.close()
+    record('load', csv_file, time.perf_counter() - started, rows=row_count, bytes=os.path.getsize(csv_file))
+    report_throughput(loader, csv_file, row_count, started)
+    record_decode_stats(catalog, csv_file, decode_stats)
+    mark_done(catalog, CATALOG_STAGE, csv_file, target=sqlite_db)
+    if own_catalog:
+        catalog.close()
 
-def process_csv_folder(folder_path, sqlite_db, table_name, chunk_size=500):
+def process_csv_folder(folder_path, sqlite_db, table_name, chunk_size=500, loader='pandas'):
     # Get list of all CSV files in the folder
     csv_files = [f for f in os.listdir(folder_path) if f.endswith('.csv')]
     if not csv_files:
         print("No CSV files found in the specified folder.")
         return
+    catalog = open_catalog()
+    import_text_log(catalog, CATALOG_STAGE, MIGRATED_FILES_LOG)
+    # Interrupted files go first so their uncheckpointed rows are still the newest in the table
+    in_progress = set(get_in_progress(catalog, CATALOG_STAGE, target=sqlite_db))
+    csv_files.sort(key=lambda csv_file: catalog_path(os.path.join(folder_path, csv_file)) not in in_progress)
     # Process each CSV file
     for csv_file in csv_files:
         file_path = os.path.join(folder_path, csv_file)
-        if is_file_migrated(file_path):
+        if is_done(catalog, CATALOG_STAGE, file_path, target=sqlite_db):
             continue
         print(f"Processing file: {file_path}")
-        migrate_csv_to_sqlite(file_path, sqlite_db, table_name, chunk_size)
+        with profile(file_path):
+            migrate_csv_to_sqlite(file_path, sqlite_db, table_name, chunk_size, loader, catalog=catalog)
+    catalog.close()
 if __name__ == "__main__":
     csv_folder = 'csv_output'  # Folder containing the CSV files
     sqlite_db = 'metadata.db'
     table_name = 'main_content'
-    process_csv_folder(csv_folder, sqlite_db, table_name)
\ No newline at end of file
+    loader = 'pandas'  # 'pandas' (DataFrame.to_sql) or 'native' (csv module + executemany)
+    metrics_file = None  # JSON lines of per-stage timings, e.g. 'metrics.jsonl'
+    profile_file = None  # Name of one CSV file to run under cProfile
+    configure(metrics_file, profile_file)
+    process_csv_folder(csv_folder, sqlite_db, table_name, loader=loader)
+    print_summary()
\ No newline at end of file
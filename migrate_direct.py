@@ -0,0 +1,231 @@
+import os
+import sqlite3
+import time
+from urllib.request import pathname2url
+import fts
+from migrate_sqlite import open_writer_connection
+from utils.bulk_load import apply_ingest_pragmas, report_throughput
+from utils.catalog import open_catalog, is_done, start_file, save_checkpoint, mark_done, get_in_progress, get_target, catalog_path
+from utils.classify import classify_table
+from utils.compact import storage_table
+from utils.metrics import configure, record, timer, profile, print_summary
+from utils.sources import SOURCE_COLUMN, content_columns, register_source, open_source_range, close_source_range
+
+CATALOG_STAGE = 'direct'
+DUMP_STAGE = 'dump'  # Stage of dump_csv.py, whose CSV files fts.py may already have loaded
+SOURCE_TABLE = 'main'  # Table copied from every source database, as in dump_csv.py
+MAX_ROWS = 200000  # Same size filter as dump_csv.py: databases with more rows are skipped
+COPY_ROWS = 500000  # Source rows copied per INSERT ... SELECT transaction
+DETECTED_COLUMNS = {'email': 'email', 'phone_number': 'phone', 'full_name': 'full_name'}  # Detected type -> target column with columns='detected'
+
+def source_uri(db_path):
+    """Read-only URI of a source database, for ATTACH."""
+    return 'file:' + pathname2url(os.path.abspath(db_path)) + '?mode=ro'
+
+def read_source_info(db_path):
+    """Return (rows, column names) of a source table, or None if it has none.
+
+    Rows are counted, as dump_csv.py does: rowids can have gaps.
+    """
+    conn = sqlite3.connect(source_uri(db_path), uri=True)
+    try:
+        rows = conn.execute(f"SELECT COUNT(*) FROM {SOURCE_TABLE}").fetchone()[0]
+        column_names = [info[1] for info in conn.execute(f"PRAGMA table_info({SOURCE_TABLE})")]
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+    return rows, column_names
+
+def map_columns(conn, source_columns, columns='position'):
+    """Pair every source column with a target column: [(source, target), ...].
+
+    'position' sends the i-th column to col_i, as the CSV round trip does. 'detected'
+    sends email, phone and full-name columns (utils.classify) to the email, phone and
+    full_name columns of a migrate_sqlite.py table and the rest to col_i.
+    """
+    detected = {}
+    if columns == 'detected':
+        results = classify_table(conn, f"src.{SOURCE_TABLE}", source_columns)
+        detected = {column: DETECTED_COLUMNS.get(result['type']) for column, result in results.items()}
+    pairs, used = [], set()
+    for i, column in enumerate(source_columns):
+        target = detected.get(column)
+        if target is None or target in used:
+            target = f'col_{i+1}'
+        used.add(target)
+        pairs.append((column, target))
+    return pairs
+
+def copy_database(db_path, sqlite_db, table_name, fts_table_name=None, columns='position', catalog=None, batch_rows=COPY_ROWS):
+    """Copy the main table of one source database into sqlite_db with set-based INSERT ... SELECT.
+
+    The source is attached read-only; rows never pass through Python. Every rowid range
+    of batch_rows rows (bounded like dump_csv.split_rowid_ranges, so rowid gaps cost
+    nothing) is one transaction, checkpointed in the catalog, and an interrupted copy
+    resumes after its last checkpoint. FTS indexing is left to fts.build_indexes. In a fts.py
+    content table the rows are tagged with the database's source_id and their rowid
+    range is recorded, as fts.py does for a file (see fts.purge_source).
+    """
+    conn = sqlite3.connect(sqlite_db)
+    apply_ingest_pragmas(conn)
+    cursor = conn.cursor()
+    own_catalog = catalog is None
+    if own_catalog:
+        catalog = open_catalog()
+    cursor.execute("ATTACH DATABASE ? AS src", (source_uri(db_path),))
+    source_columns = [info[1] for info in cursor.execute(f"PRAGMA src.table_info({SOURCE_TABLE})")]
+    target_columns = content_columns(conn, table_name)
+    pairs = map_columns(conn, source_columns, columns)
+    if columns == 'detected':
+        # Named tables grow like migrate_sqlite.py's
+        for _, target in pairs:
+            if target not in target_columns:
+                cursor.execute(f'ALTER TABLE {table_name} ADD COLUMN "{target}" TEXT')
+                target_columns.append(target)
+                print(f"Added column: {target}")
+    elif len(pairs) > len(target_columns):
+        print(f"{db_path} has {len(pairs)} columns, {table_name} only {len(target_columns)}; extra columns are dropped.")
+        pairs = pairs[:len(target_columns)]
+    select_list = ", ".join(f'"{source}"' for source, _ in pairs)
+    target_table = storage_table(cursor, table_name)
+    # Packed tables always carry source_id; padded ones since provenance was added
+    tagged = SOURCE_COLUMN in [info[1] for info in cursor.execute(f"PRAGMA table_info({target_table})")]
+    source_id = register_source(cursor, table_name, db_path, source_columns) if tagged else None
+    if target_table != table_name:
+        # Compact layout: pack the row in SQL; json_extract reads trailing NULLs and missing fields alike
+        insert_query = f"""
+            INSERT INTO {target_table} (source_id, data)
+            SELECT {source_id}, json_array({", ".join(f'CAST("{source}" AS TEXT)' for source, _ in pairs)})
+            FROM src.{SOURCE_TABLE} WHERE rowid > ? AND rowid <= ? ORDER BY rowid
+        """
+    elif tagged:
+        insert_query = f"""
+            INSERT INTO {table_name} ({", ".join(f'"{target}"' for _, target in pairs)}, {SOURCE_COLUMN})
+            SELECT {select_list}, {source_id} FROM src.{SOURCE_TABLE} WHERE rowid > ? AND rowid <= ? ORDER BY rowid
+        """
+    else:
+        insert_query = f"""
+            INSERT INTO {table_name} ({", ".join(f'"{target}"' for _, target in pairs)})
+            SELECT {select_list} FROM src.{SOURCE_TABLE} WHERE rowid > ? AND rowid <= ? ORDER BY rowid
+        """
+    conn.commit()
+
+    # Resume an interrupted copy, dropping rows committed after its last checkpoint
+    last_rowid = cursor.execute(f"SELECT IFNULL(MAX(id), 0) FROM {table_name}").fetchone()[0]
+    checkpoint = start_file(catalog, CATALOG_STAGE, db_path, target=sqlite_db, last_rowid=last_rowid)
+    rows_done = 0
+    source_rowid = cursor.execute(f"SELECT IFNULL(MIN(rowid), 1) - 1 FROM src.{SOURCE_TABLE}").fetchone()[0]
+    if checkpoint is not None:
+        rows_done = checkpoint['rows_done']
+        fts_columns = fts.get_fts_columns(cursor, fts_table_name) if fts_table_name else None
+        if fts_columns:
+            discarded = fts.discard_rows_after(conn, table_name, fts_table_name, ", ".join(fts_columns), checkpoint['last_rowid'])
+        else:
+            discarded = cursor.execute(f"DELETE FROM {table_name} WHERE id > ?", (checkpoint['last_rowid'],)).rowcount
+            conn.commit()
+        if rows_done:
+            source_rowid = cursor.execute(f"SELECT rowid FROM src.{SOURCE_TABLE} ORDER BY rowid LIMIT 1 OFFSET ?",
+                                          (rows_done - 1,)).fetchone()[0]
+        print(f"Resuming {db_path} after {rows_done} rows (discarded {discarded} uncheckpointed rows).")
+    if source_id is not None:
+        open_source_range(cursor, table_name, target_table, source_id, resume=checkpoint is not None)
+
+    started = time.perf_counter()
+    max_rowid = cursor.execute(f"SELECT IFNULL(MAX(rowid), 0) FROM src.{SOURCE_TABLE}").fetchone()[0]
+    insert, commit = timer('insert', db_path), timer('commit', db_path)
+    row_count = 0
+    first_rowid = source_rowid
+    while first_rowid < max_rowid:
+        # The range ends at the batch_rows-th rowid after first_rowid
+        boundary = cursor.execute(f"SELECT rowid FROM src.{SOURCE_TABLE} WHERE rowid > ? ORDER BY rowid LIMIT 1 OFFSET ?",
+                                  (first_rowid, batch_rows - 1)).fetchone()
+        upper_rowid = max_rowid if boundary is None else boundary[0]
+        with insert:
+            cursor.execute(insert_query, (first_rowid, upper_rowid))
+        row_count += cursor.rowcount
+        first_rowid = upper_rowid
+        with commit:
+            conn.commit()
+        committed_rowid = cursor.execute(f"SELECT IFNULL(MAX(id), 0) FROM {table_name}").fetchone()[0]
+        save_checkpoint(catalog, CATALOG_STAGE, db_path, rows_done=rows_done + row_count, last_rowid=committed_rowid, target=sqlite_db)
+    if source_id is not None:
+        close_source_range(cursor, table_name, target_table, source_id)
+        conn.commit()
+    insert.add(rows=row_count)
+    insert.close()
+    commit.close()
+    cursor.execute("DETACH DATABASE src")
+    conn.close()
+    record('load', db_path, time.perf_counter() - started, rows=row_count, bytes=os.path.getsize(db_path))
+    report_throughput('direct', db_path, row_count, started)
+
+    mark_done(catalog, CATALOG_STAGE, db_path, target=sqlite_db)
+    if own_catalog:
+        catalog.close()
+    return row_count
+
+def select_databases(db_paths, sqlite_db, catalog, max_rows=MAX_ROWS):
+    """Return {db_path: column names} of the databases to copy into sqlite_db, printing why others are skipped."""
+    selected = {}
+    for db_path in db_paths:
+        if is_done(catalog, CATALOG_STAGE, db_path, target=sqlite_db):
+            continue
+        csv_path = get_target(catalog, DUMP_STAGE, db_path)
+        if csv_path and is_done(catalog, fts.CATALOG_STAGE, csv_path, target=sqlite_db):
+            print(f"{db_path} was already loaded from {csv_path}. Skipping.")
+            continue
+        info = read_source_info(db_path)
+        if info is None:
+            print(f"{db_path} has no {SOURCE_TABLE} table. Skipping.")
+            continue
+        rows, column_names = info
+        if max_rows is not None and rows > max_rows:
+            print(f"{db_path} has more than {max_rows:,} rows. Skipping.")
+            continue
+        selected[db_path] = column_names
+    return selected
+
+def process_db_folder(db_folder, sqlite_db, table_name, fts_table_name='main', columns='position', trigram_columns=None,
+                      normalized_columns=None, storage='padded', max_rows=MAX_ROWS):
+    """Copy every source database of a folder straight into sqlite_db, without CSV files in between.
+
+    columns='position' fills a fts.py content table (col_N, padded or compact) and then
+    builds its FTS indexes and lookup tables; columns='detected' fills a
+    migrate_sqlite.py table with named columns and builds no index.
+    """
+    catalog = open_catalog()
+    db_paths = sorted(os.path.join(db_folder, f) for f in os.listdir(db_folder) if f.endswith('.db'))
+    selected = select_databases(db_paths, sqlite_db, catalog, max_rows)
+    if columns == 'position':
+        max_columns = max([10] + [len(column_names) for column_names in selected.values()])
+        fts.create_content_tables(sqlite_db, table_name, fts_table_name, max_columns, storage, trigram_columns, normalized_columns)
+    else:
+        open_writer_connection(sqlite_db, table_name).close()
+    if not selected:
+        print(f"All databases have already been copied to {sqlite_db}.")
+    # Interrupted copies go first so their uncheckpointed rows are still the newest in the table
+    in_progress = set(get_in_progress(catalog, CATALOG_STAGE, target=sqlite_db))
+    for db_path in sorted(selected, key=lambda db_path: catalog_path(db_path) not in in_progress):
+        print(f"Starting copy of: {db_path}")
+        with profile(db_path):
+            copy_database(db_path, sqlite_db, table_name, fts_table_name if columns == 'position' else None, columns, catalog)
+    catalog.close()
+    if columns == 'position':
+        fts.build_indexes(sqlite_db, table_name, fts_table_name, max_columns, 'bulk', trigram_columns, normalized_columns)
+
+if __name__ == "__main__":
+    db_folder = './db'  # Source databases, each with a 'main' table
+    sqlite_db = 'meta.db'
+    table_name = 'main_content'
+    fts_table_name = 'main'
+    columns = 'position'  # 'position' (col_N, searchable meta.db) or 'detected' (named columns, like migrate_sqlite.py)
+    trigram_columns = None  # Substring index: list of column names, 'auto' (by detected type) or None
+    normalized_columns = 'auto'  # Exact phone/email lookup tables: {column: 'phone' or 'email'}, 'auto' or None
+    storage = 'padded'  # 'padded' (one col_N per column) or 'compact' (populated fields packed per row)
+    max_rows = MAX_ROWS  # None copies every database regardless of size
+    metrics_file = None  # JSON lines of per-stage timings, e.g. 'metrics.jsonl'
+    profile_file = None  # Name of one database file to run under cProfile
+    configure(metrics_file, profile_file)
+    process_db_folder(db_folder, sqlite_db, table_name, fts_table_name, columns, trigram_columns, normalized_columns, storage, max_rows)
+    print_summary()
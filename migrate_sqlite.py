@@ -1,28 +1,84 @@
 import os
 import pandas as pd
+import queue
 import sqlite3
 from utils.rename import rename_func
-import chardet
-from io import TextIOWrapper
-from multiprocessing import Pool, current_process
-MIGRATED_FILES_LOG = 'migrated_files.txt'
-def migrate_csv_to_sqlite(csv_file, sqlite_db, table_name, chunk_size=5000):
-    # Connect to SQLite database (create if not exists)
+from multiprocessing import Process, Queue, current_process
+from utils.catalog import open_catalog, import_text_log, is_done, start_file, save_checkpoint, mark_done, get_in_progress, get_committed_rowid
+from utils.encoding import get_encoding, open_text, record_decode_stats
+from utils.metrics import configure, timer, timed, profile, print_summary
+MIGRATED_FILES_LOG = 'migrated_files.txt'  # Legacy log, imported into the catalog once
+CATALOG_STAGE = 'migrate_sqlite'
+WORKERS = os.cpu_count() or 2  # Number of parser processes
+QUEUE_SIZE = 16  # Maximum number of row batches waiting for the writer
+COMMIT_ROWS = 200000  # Rows per write transaction
+PARSER_POLL_SECONDS = 5  # How long the writer waits on an empty queue before checking that the parsers are alive
+
+def parse_csv_file(csv_file, batch_queue, chunk_size=5000, rows_done=0, catalog=None):
+    """Parse one CSV file and send its row batches to the writer, skipping the first rows_done rows."""
+    # Detect encoding (cached in the catalog); mixed files fall back per bad byte run instead of per file
+    verdict = get_encoding(csv_file, catalog)
+
+    # One decoded stream per file: the column names come from the header of its first chunk
+    text_file, decode_stats = open_text(csv_file, verdict)
+    column_names = None
+    parse = timer('parse', csv_file)
+    with text_file:
+        # Read CSV in chunks with error handling
+        for chunk in timed(pd.read_csv(text_file, chunksize=chunk_size, on_bad_lines='skip'), parse):
+            if column_names is None:
+                column_names = rename_func(chunk)
+                print(f"[{current_process().name}] Renamed columns:", column_names)
+            if rows_done:
+                # Rows up to the checkpoint are already in the table
+                skipped = min(rows_done, len(chunk))
+                chunk = chunk.iloc[skipped:]
+                rows_done -= skipped
+                if chunk.empty:
+                    continue
+            chunk.columns = column_names
+            with parse:
+                rows = list(chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None))
+            parse.add(rows=len(rows))
+            # Blocks while the queue is full, so parsers never run ahead of the writer
+            with parse.waiting():
+                batch_queue.put(('rows', csv_file, column_names, rows))
+    parse.add(bytes=os.path.getsize(csv_file))
+    parse.close()
+    record_decode_stats(catalog, csv_file, decode_stats)
+    batch_queue.put(('done', csv_file, None, None))
+
+def parse_worker(file_queue, batch_queue, chunk_size):
+    """Parser process: take files from the file queue until a None sentinel arrives."""
+    catalog = open_catalog()  # Only for the cached encoding verdicts; checkpoints belong to the writer
+    while True:
+        task = file_queue.get()
+        if task is None:
+            break
+        csv_file, rows_done = task
+        print(f"[{current_process().name}] Starting process for: {csv_file}")
+        try:
+            with profile(csv_file):
+                parse_csv_file(csv_file, batch_queue, chunk_size, rows_done, catalog)
+        except Exception as e:
+            print(f"[{current_process().name}] Error processing {csv_file}: {e}")
+            batch_queue.put(('failed', csv_file, None, None))
+    catalog.close()
+    batch_queue.put(('exit', None, None, None))
+
+def open_writer_connection(sqlite_db, table_name):
+    """Open the single writer connection in WAL mode and make sure the table exists."""
     conn = sqlite3.connect(sqlite_db)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
     cursor = conn.cursor()
-    
-    # Detect encoding
-    with open(csv_file, 'rb') as f:
-        result = chardet.detect(f.read(1000))
-        encoding = result['encoding']
-
     # Check if the table exists, if not create it
     cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table_name}';")
     if cursor.fetchone() is None:
         print(f"Table '{table_name}' does not exist. Creating table...")
         create_table_query = f"""
         CREATE TABLE {table_name} (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,            
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
             email TEXT,
             phone TEXT,
             full_name TEXT
@@ -30,82 +86,187 @@ def migrate_csv_to_sqlite(csv_file, sqlite_db, table_name, chunk_size=5000):
         """
         cursor.execute(create_table_query)
         conn.commit()  # Commit after table creation
+    return conn
 
-    # Read the first 20 rows to get column names
+def write_batches(batch_queue, sqlite_db, table_name, parsers, catalog, rows_done, commit_rows=COMMIT_ROWS):
+    """Writer: drain the batch queue into SQLite over one connection, committing in large transactions.
+
+    rows_done maps each file to the rows already committed by earlier runs; after every
+    commit the catalog checkpoints each touched file with its committed row count.
+    Returns once every parser process has sent its 'exit' or died without one (killed
+    by a signal or the OOM killer); a dead parser's file stays in progress and resumes
+    from its checkpoint on the next run.
+    """
+    conn = open_writer_connection(sqlite_db, table_name)
+    cursor = conn.cursor()
+    rows_done = dict(rows_done)
+    touched_files = set()
+    existing_columns = set(col[1] for col in cursor.execute(f"PRAGMA table_info({table_name})").fetchall())
+    insert_queries = {}
+    pending_rows = 0
+    finished_files = []  # Files whose rows are written but not yet committed
+    failed_files = set()
+    exited = 0
+    lost = set()  # Parsers that died without sending 'exit'
+    insert, commit_timer = timer('insert', sqlite_db), timer('commit', sqlite_db)
+
+    def commit():
+        with commit_timer:
+            conn.commit()
+        committed_rowid = cursor.execute(f"SELECT IFNULL(MAX(id), 0) FROM {table_name}").fetchone()[0]
+        for csv_file in touched_files:
+            save_checkpoint(catalog, CATALOG_STAGE, csv_file, rows_done=rows_done[csv_file], last_rowid=committed_rowid, target=sqlite_db)
+        touched_files.clear()
+        for csv_file in finished_files:
+            mark_done(catalog, CATALOG_STAGE, csv_file, target=sqlite_db)
+            print(f"Finished processing {csv_file}")
+        finished_files.clear()
+
+    while exited + len(lost) < len(parsers):
+        # Time blocked here means the parsers are the bottleneck
+        try:
+            with insert.waiting():
+                kind, csv_file, column_names, rows = batch_queue.get(timeout=PARSER_POLL_SECONDS)
+        except queue.Empty:
+            # A parser that returns sends 'exit' before it ends (exit code 0); any other ending never will
+            for parser in parsers:
+                if parser.exitcode not in (None, 0) and parser.pid not in lost:
+                    lost.add(parser.pid)
+                    print(f"Parser {parser.name} died (exit code {parser.exitcode}); "
+                          f"its file stays in progress and resumes on the next run.")
+            continue
+        if kind == 'exit':
+            exited += 1
+        elif kind == 'failed':
+            failed_files.add(csv_file)
+        elif kind == 'done':
+            if csv_file not in failed_files:
+                finished_files.append(csv_file)
+        else:
+            key = tuple(column_names)
+            if key not in insert_queries:
+                # Add any missing columns to the SQLite table
+                for column in column_names:
+                    quoted_column = f'"{column}"'
+                    if column not in existing_columns:
+                        try:
+                            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {quoted_column} TEXT")
+                            print(f"Added column: {quoted_column}")
+                        except sqlite3.OperationalError as e:
+                            print(f"Error adding column {quoted_column}: {e}")
+                        existing_columns.add(column)
+                quoted_columns = ", ".join(f'"{column}"' for column in column_names)
+                placeholders = ", ".join("?" for _ in column_names)
+                insert_queries[key] = f"INSERT INTO {table_name} ({quoted_columns}) VALUES ({placeholders})"
+            with insert:
+                cursor.executemany(insert_queries[key], rows)
+            insert.add(rows=len(rows))
+            pending_rows += len(rows)
+            rows_done[csv_file] += len(rows)
+            touched_files.add(csv_file)
+        if pending_rows >= commit_rows:
+            commit()
+            pending_rows = 0
+
+    commit()
+    conn.close()
+    insert.close()
+    commit_timer.close()
+
+def get_max_rowid(sqlite_db, table_name):
+    """Return the highest id in the target table (0 if the database or table does not exist yet)."""
+    if not os.path.exists(sqlite_db):
+        return 0
+    conn = sqlite3.connect(sqlite_db)
     try:
-        df = pd.read_csv(csv_file, skiprows=range(5), nrows=25, encoding=encoding)
-    except UnicodeDecodeError:
-        print(f"Failed with encoding {encoding}. Retrying with 'ISO-8859-1'.")
-        encoding = 'ISO-8859-1'  # Fallback encoding
-        df = pd.read_csv(csv_file, skiprows=range(5), nrows=25, encoding=encoding)
-
-    column_names = rename_func(df)
-    print(f"[{current_process().name}] Renamed columns:", column_names)
-    
-    with open(csv_file, "rb") as f:
-        text_file = TextIOWrapper(f, encoding="utf-8", errors="replace")
-        # Read CSV in chunks with error handling
-        for chunk in pd.read_csv(text_file, chunksize=chunk_size, on_bad_lines='skip'):
-            print(f"[{current_process().name}] Processing chunk columns:", chunk.columns)        
-            # Get existing columns in the SQLite table
-            existing_columns = [col[1] for col in cursor.execute(f"PRAGMA table_info({table_name})").fetchall()]
-            print(f"[{current_process().name}] Existing columns:", existing_columns)            
-            chunk.columns = column_names            
-            # Add any missing columns to the SQLite table
-            for column in column_names:
-                quoted_column = f'"{column}"'
-                if column not in existing_columns:
-                    try:
-                        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {quoted_column} TEXT")
-                        print(f"[{current_process().name}] Added column: {quoted_column}")
-                    except sqlite3.OperationalError as e:
-                        print(f"[{current_process().name}] Error adding column {quoted_column}: {e}")
-
-            # Insert data into SQLite table
-            chunk.to_sql(table_name, conn, if_exists='append', index=False)
-    
-    # Commit and close the connection
+        return conn.execute(f"SELECT IFNULL(MAX(id), 0) FROM {table_name}").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        conn.close()
+
+def discard_uncheckpointed_rows(catalog, sqlite_db, table_name):
+    """Delete rows an interrupted run committed after its last catalog checkpoint."""
+    if not get_in_progress(catalog, CATALOG_STAGE, target=sqlite_db) or get_max_rowid(sqlite_db, table_name) == 0:
+        return 0
+    conn = sqlite3.connect(sqlite_db)
+    discarded = conn.execute(f"DELETE FROM {table_name} WHERE id > ?", (get_committed_rowid(catalog, sqlite_db),)).rowcount
     conn.commit()
     conn.close()
-    print(f"[{current_process().name}] Finished processing {csv_file}")
-    # Log the migrated file
-    log_migrated_file(csv_file)
+    if discarded:
+        print(f"Discarded {discarded} uncheckpointed rows from an interrupted run.")
+    return discarded
+
+def migrate_files(file_paths, sqlite_db, table_name, catalog, workers=WORKERS, chunk_size=5000, queue_size=QUEUE_SIZE):
+    """Load files through parser processes feeding one writer (this process), resuming interrupted files."""
+    # Resume interrupted files from their checkpoints
+    rows_done = {}
+    last_rowid = get_max_rowid(sqlite_db, table_name)
+    for file_path in file_paths:
+        checkpoint = start_file(catalog, CATALOG_STAGE, file_path, target=sqlite_db, last_rowid=last_rowid)
+        rows_done[file_path] = checkpoint['rows_done'] if checkpoint else 0
 
-def log_migrated_file(csv_file):    
-    with open(MIGRATED_FILES_LOG, 'a', encoding='utf-8') as log_file:
-        log_file.write(f"{csv_file}\n")
+    # N parser processes feed one writer (this process) through a bounded queue
+    workers = max(1, min(workers, len(file_paths)))
+    file_queue = Queue()
+    batch_queue = Queue(maxsize=queue_size)
+    for file_path in file_paths:
+        file_queue.put((file_path, rows_done[file_path]))
+    for _ in range(workers):
+        file_queue.put(None)
+    parsers = [Process(target=parse_worker, args=(file_queue, batch_queue, chunk_size)) for _ in range(workers)]
+    for parser in parsers:
+        parser.start()
+    try:
+        write_batches(batch_queue, sqlite_db, table_name, parsers, catalog, rows_done)
+    except BaseException:
+        # Parsers would block forever on the full queue once the writer is gone
+        for parser in parsers:
+            parser.terminate()
+        raise
+    for parser in parsers:
+        parser.join()
+
+def migrate_csv_to_sqlite(csv_file, sqlite_db, table_name, chunk_size=5000):
+    """Load one CSV file into sqlite_db, through one parser process and the writer.
+
+    Kept with its signature from before the pipeline; the parsing half is parse_csv_file.
+    """
+    catalog = open_catalog()
+    discard_uncheckpointed_rows(catalog, sqlite_db, table_name)
+    migrate_files([csv_file], sqlite_db, table_name, catalog, workers=1, chunk_size=chunk_size)
+    catalog.close()
 
 def process_csv_file(file_path, sqlite_db, table_name):
     print(f"Starting process for: {file_path}")
     migrate_csv_to_sqlite(file_path, sqlite_db, table_name)
 
-
-def get_migrated_files():    
-    if os.path.exists(MIGRATED_FILES_LOG):
-        with open(MIGRATED_FILES_LOG, 'r',encoding='utf-8') as log_file:
-            return set(line.strip() for line in log_file)
-    return set()
-
-def process_csv_folder(folder_path, sqlite_db, table_name):
+def process_csv_folder(folder_path, sqlite_db, table_name, workers=WORKERS, chunk_size=5000, queue_size=QUEUE_SIZE):
     # Get list of all CSV files in the folder
     csv_files = [f for f in os.listdir(folder_path) if f.endswith('.csv')]
     if not csv_files:
         print("No CSV files found in the specified folder.")
         return
-    migrated_files = get_migrated_files()   
-    files_to_process = [os.path.join(folder_path, f) for f in csv_files if os.path.join(folder_path, f) not in migrated_files]
+    catalog = open_catalog()
+    import_text_log(catalog, CATALOG_STAGE, MIGRATED_FILES_LOG)
+    discard_uncheckpointed_rows(catalog, sqlite_db, table_name)
+    files_to_process = [os.path.join(folder_path, f) for f in csv_files if not is_done(catalog, CATALOG_STAGE, os.path.join(folder_path, f), target=sqlite_db)]
     # Process each CSV file
     if not files_to_process:
         print("All files have already been migrated.")
+        catalog.close()
         return
+    migrate_files(files_to_process, sqlite_db, table_name, catalog, workers, chunk_size, queue_size)
+    catalog.close()
 
-    with Pool(processes=2) as pool:
-        pool.starmap(process_csv_file, [(file_path, sqlite_db, table_name) for file_path in files_to_process])
-    
     print("All files have been processed.")
 
 if __name__ == "__main__":
     csv_folder = 'csv_output'  # Folder containing the CSV files
     sqlite_db = 'metadata.db'
     table_name = 'main_content'
-    process_csv_folder(csv_folder, sqlite_db, table_name)
+    metrics_file = None  # JSON lines of per-stage timings, e.g. 'metrics.jsonl'
+    profile_file = None  # Name of one CSV file to run under cProfile
+    configure(metrics_file, profile_file)
+    process_csv_folder(csv_folder, sqlite_db, table_name, workers=WORKERS)
+    print_summary()
@@ -1,14 +1,6 @@
-import sqlite3
+from utils.tables import rename_content_table
 
-# Connect to the SQLite database
-conn = sqlite3.connect('metadata.db')
-cursor = conn.cursor()
-
-# Rename the table
-cursor.execute("ALTER TABLE main_content RENAME TO data;")
-
-# Commit the changes and close the connection
-conn.commit()
-conn.close()
+# Rename the content table; its FTS indexes, lookup and bookkeeping tables follow it
+rename_content_table('metadata.db', 'main_content', 'data')
 
 print("Table renamed successfully!")
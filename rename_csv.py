@@ -1,30 +1,79 @@
 import pandas as pd
 import spacy
 import os
-import chardet
+import re
+import sqlite3
+from utils.catalog import open_catalog
+from utils.encoding import get_encoding, open_text
+from utils.schema_cache import schema_fingerprint, get_mapping, save_mapping, hit_counts, print_hit_rate
 
-# Load spaCy models for English and Russian
-nlp_en = spacy.load("en_core_web_sm")
-nlp_ru = spacy.load("ru_core_news_sm")
+# spaCy models for English and Russian, loaded on first use
+MODEL_NAMES = {'en': "en_core_web_sm", 'ru': "ru_core_news_sm"}
+NAME_CACHE_DB = 'name_cache.db'  # Persistent value -> PERSON cache shared across runs
+PIPE_BATCH_SIZE = 512
+# Components of the en/ru pipelines that NER does not use; excluded ones are never loaded
+NON_NER_COMPONENTS = ['tagger', 'morphologizer', 'parser', 'senter', 'attribute_ruler', 'lemmatizer']
+SCHEMA_KIND = 'rename_csv'  # Schema cache entries of this script (see utils.schema_cache)
+cyrillic_pattern = re.compile(r'[а-яА-ЯёЁ]')
+models = {}
+cache_conn = None
 
-# Function to detect if a column contains names using both English and Russian models
-def detect_name_spacy(col_data):
-    name_count = 0
-    entities = []
+def get_nlp(lang):
+    """Load a spaCy model lazily with only NER, plus the shared tok2vec when NER listens to it."""
+    if lang not in models:
+        nlp = spacy.load(MODEL_NAMES[lang], exclude=NON_NER_COMPONENTS)
+        # In the sm pipelines NER embeds its own tok2vec; the shared one only fed the excluded components
+        if 'tok2vec' in nlp.pipe_names and 'ner' not in nlp.get_pipe('tok2vec').listening_components:
+            nlp.remove_pipe('tok2vec')
+        models[lang] = nlp
+    return models[lang]
+
+def get_cache():
+    global cache_conn
+    if cache_conn is None:
+        cache_conn = sqlite3.connect(NAME_CACHE_DB)
+        cache_conn.execute("CREATE TABLE IF NOT EXISTS names (value TEXT PRIMARY KEY, is_person INTEGER NOT NULL)")
+    return cache_conn
+
+def detect_person_values(values):
+    """Return {value: True/False} telling whether spaCy finds a PERSON entity in each distinct value.
+
+    Values are looked up in the persistent cache first; the rest are run through
+    nlp.pipe in batches, with the Russian model for Cyrillic text and the English one otherwise.
+    """
+    values = set(values)
+    cache = get_cache()
+    results = {}
+    distinct = list(values)
+    for start in range(0, len(distinct), 500):
+        batch = distinct[start:start + 500]
+        placeholders = ", ".join("?" for _ in batch)
+        for value, is_person in cache.execute(f"SELECT value, is_person FROM names WHERE value IN ({placeholders})", batch):
+            results[value] = bool(is_person)
+
+    missing = [value for value in values if value not in results]
+    by_lang = {'ru': [], 'en': []}
+    for value in missing:
+        by_lang['ru' if cyrillic_pattern.search(value) else 'en'].append(value)
+    for lang, texts in by_lang.items():
+        if not texts:
+            continue
+        for text, doc in zip(texts, get_nlp(lang).pipe(texts, batch_size=PIPE_BATCH_SIZE)):
+            results[text] = any(ent.label_ in ('PERSON', 'PER') for ent in doc.ents)
+    if missing:
+        cache.executemany("INSERT OR REPLACE INTO names (value, is_person) VALUES (?, ?)",
+                          [(value, int(results[value])) for value in missing])
+        cache.commit()
+    return results
 
-    for text in col_data.dropna().astype(str):
-        doc_en = nlp_en(text)
-        doc_ru = nlp_ru(text)        
-        # Check for entities in both languages
-        entities.extend([(ent.text, ent.label_) for ent in doc_en.ents])
-        entities.extend([(ent.text, ent.label_) for ent in doc_ru.ents])
-    # Count the detected entities for PERSON (which refers to names)
-    for ent_text, ent_label in entities:
-        if ent_label == 'PERSON':
-            name_count += 1
+# Function to detect if a column contains names using both English and Russian models
+def detect_name_spacy(col_data, person_values=None):
+    texts = col_data.dropna().astype(str)
+    if person_values is None:
+        person_values = detect_person_values(texts)
 
     # Decide column type based on detected entity counts
-    if name_count > 0:
+    if any(person_values.get(text) for text in texts):
         return 'name'
     else:
         return 'unknown'
@@ -36,7 +85,29 @@ def detect_name_spacy(col_data):
 #     result = chardet.detect(rawdata)
 #     return result['encoding']
 
+def map_name_columns(df):
+    """Map each column of a sample to name, name_1, ... when spaCy finds people in it, else to itself."""
+    # Run spaCy once over the distinct values of all columns, then decide per column
+    person_values = detect_person_values(df.stack().dropna().astype(str))
+    column_mappings = {}
+    name_column_count = 0  # To track the number of name-related columns
+
+    for col in df.columns:
+        column_type = detect_name_spacy(df[col], person_values)
+
+        if column_type == 'name':
+            # If it's a name column, rename sequentially (name, name_1, name_2, etc.)
+            new_col_name = f"name" if name_column_count == 0 else f"name_{name_column_count}"
+            name_column_count += 1
+            column_mappings[col] = new_col_name
+        else:
+            column_mappings[col] = col  # Keep original name if it's not recognized
+    return column_mappings
+
 def process_csv_files(folder_path):
+    # Files laid out like one seen before take its mapping from the schema cache, skipping spaCy
+    catalog = open_catalog()
+    cache_counts = hit_counts(catalog, SCHEMA_KIND)
     # Loop through all files in the directory
     for filename in os.listdir(folder_path):
         if filename.endswith(".csv"):
@@ -44,23 +115,15 @@ def process_csv_files(folder_path):
             file_path = os.path.join(folder_path, filename)
             
             try:
-                # Automatically detect the file encoding
-                detected_encoding = 'utf-8'                
-                df = pd.read_csv(file_path, nrows=100, encoding=detected_encoding)                
-                # Apply spaCy-based name detection to each column
-                column_mappings = {}
-                name_column_count = 0  # To track the number of name-related columns
-
-                for col in df.columns:
-                    column_type = detect_name_spacy(df[col])
-                    
-                    if column_type == 'name':                      
-                        # If it's a name column, rename sequentially (name, name_1, name_2, etc.)
-                        new_col_name = f"name" if name_column_count == 0 else f"name_{name_column_count}"
-                        name_column_count += 1                        
-                        column_mappings[col] = new_col_name
-                    else:
-                        column_mappings[col] = col  # Keep original name if it's not recognized
+                # Detect the file encoding, or reuse the verdict cached in the catalog
+                text_file, _ = open_text(file_path, get_encoding(file_path, catalog))
+                with text_file:
+                    df = pd.read_csv(text_file, nrows=100)
+                fingerprint = schema_fingerprint(df)
+                column_mappings = get_mapping(catalog, SCHEMA_KIND, fingerprint)
+                if column_mappings is None:
+                    column_mappings = map_name_columns(df)
+                    save_mapping(catalog, SCHEMA_KIND, fingerprint, df.columns, column_mappings)
 
                 # Rename columns based on the detected names (without modifying the data)
                 df.rename(columns=column_mappings, inplace=True)
@@ -70,6 +133,8 @@ def process_csv_files(folder_path):
                 print(f"Columns have been renamed and saved for '{filename}' (only headers saved)")
             except Exception as e:
                 print(f"Error processing {filename}: {str(e)}")
+    print_hit_rate(catalog, SCHEMA_KIND, cache_counts)
+    catalog.close()
 if __name__ == "__main__":
     folder_path = 'csv_output'  # Define the path to the folder containing the CSV files
     process_csv_files(folder_path)
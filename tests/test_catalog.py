@@ -0,0 +1,74 @@
+import os
+import sqlite3
+from utils.catalog import (open_catalog, start_file, save_checkpoint, get_checkpoint, mark_done, is_done,
+                           get_in_progress, get_target)
+
+def write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+def test_resume_from_checkpoint(tmp_path):
+    catalog = open_catalog(str(tmp_path / 'catalog.db'))
+    path = write_file(tmp_path / 'a.csv', b'id,name\n1,Ivan\n2,Anna\n')
+    assert start_file(catalog, 'fts', path, 'meta.db', last_rowid=10) is None
+    save_checkpoint(catalog, 'fts', path, rows_done=1, last_rowid=11, byte_offset=16, target='meta.db')
+    checkpoint = start_file(catalog, 'fts', path, 'meta.db')
+    assert (checkpoint['rows_done'], checkpoint['last_rowid'], checkpoint['byte_offset']) == (1, 11, 16)
+    assert get_in_progress(catalog, 'fts', 'meta.db') == [os.path.normpath(path)]
+    assert get_checkpoint(catalog, 'fts', path, 'other.db') is None
+    mark_done(catalog, 'fts', path, 'meta.db')
+    assert is_done(catalog, 'fts', path, 'meta.db')
+    assert not is_done(catalog, 'fts', path, 'other.db')
+    assert get_checkpoint(catalog, 'fts', path, 'meta.db') is None
+    assert get_in_progress(catalog, 'fts', 'meta.db') == []
+
+def test_changed_file_starts_over(tmp_path):
+    catalog = open_catalog(str(tmp_path / 'catalog.db'))
+    path = write_file(tmp_path / 'a.csv', b'id,name\n1,Ivan\n')
+    start_file(catalog, 'fts', path, 'meta.db')
+    save_checkpoint(catalog, 'fts', path, rows_done=1, last_rowid=1, byte_offset=8, target='meta.db')
+    write_file(path, b'id,name\n1,Ivan\n2,Anna\n')
+    assert get_checkpoint(catalog, 'fts', path, 'meta.db') is None
+    assert start_file(catalog, 'fts', path, 'meta.db') is None
+
+def test_touched_file_keeps_its_entry(tmp_path):
+    catalog = open_catalog(str(tmp_path / 'catalog.db'))
+    path = write_file(tmp_path / 'a.csv', b'id,name\n1,Ivan\n')
+    mark_done(catalog, 'fts', path, 'meta.db')
+    os.utime(path, (1, 1))
+    assert is_done(catalog, 'fts', path, 'meta.db')
+
+def test_done_after_rewriting_the_file(tmp_path):
+    # main.py marks a database done after renaming its columns, without start_file
+    catalog = open_catalog(str(tmp_path / 'catalog.db'))
+    db_path = str(tmp_path / 'a.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE main_content (id INTEGER PRIMARY KEY, col_1 TEXT)")
+    conn.commit()
+    mark_done(catalog, 'rename', db_path, target=db_path)
+    conn.execute("ALTER TABLE main_content RENAME COLUMN col_1 TO phone_number")
+    conn.execute("INSERT INTO main_content (phone_number) VALUES (?)", ('x' * 10000,))
+    conn.commit()
+    conn.close()
+    assert not is_done(catalog, 'rename', db_path, db_path)
+    mark_done(catalog, 'rename', db_path, target=db_path)
+    assert is_done(catalog, 'rename', db_path, db_path)
+    assert get_target(catalog, 'rename', db_path) == db_path
+
+def test_legacy_catalog_is_migrated(tmp_path):
+    catalog_db = str(tmp_path / 'catalog.db')
+    path = write_file(tmp_path / 'a.csv', b'id\n1\n')
+    old = sqlite3.connect(catalog_db)
+    old.execute("""CREATE TABLE files (stage TEXT NOT NULL, path TEXT NOT NULL, target TEXT, size INTEGER, mtime REAL,
+                   fingerprint TEXT, status TEXT NOT NULL, rows_done INTEGER NOT NULL DEFAULT 0,
+                   last_rowid INTEGER NOT NULL DEFAULT 0, byte_offset INTEGER NOT NULL DEFAULT 0, updated REAL,
+                   PRIMARY KEY (stage, path))""")
+    stat = os.stat(path)
+    old.execute("INSERT INTO files (stage, path, size, mtime, status) VALUES ('fts', ?, ?, ?, 'done')",
+                (os.path.normpath(path), stat.st_size, stat.st_mtime))
+    old.commit()
+    old.close()
+    catalog = open_catalog(catalog_db)
+    assert is_done(catalog, 'fts', path, 'meta.db')
+    assert is_done(catalog, 'fts', path, 'other.db')
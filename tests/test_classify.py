@@ -0,0 +1,24 @@
+import pandas as pd
+import pytest
+from utils.classify import classify_frame, is_phone, normalize_phone
+
+@pytest.mark.parametrize('value', ['+79001234567', '89001234567', '8(900)1234567', '8-900-123-45-67', '+7(900)123-45-67'])
+def test_phones_accepted(value):
+    assert is_phone(value)
+    assert normalize_phone(value) == '79001234567'
+
+@pytest.mark.parametrize('value', ['tel 8 (900) 123-45-67', 'tel 8 (900) abc 123 45 67', '+7 900 123 45 67', '89001234567 доб', '9001234567'])
+def test_letters_and_spaces_count_towards_the_length(value):
+    assert not is_phone(value)
+
+def test_normalize_phone_is_looser_than_is_phone():
+    assert normalize_phone('tel 8 (900) abc 123 45 67') == '79001234567'
+    assert normalize_phone('+7 900 123 45 67') == '79001234567'
+    assert normalize_phone('12345') is None
+
+def test_prefixed_values_do_not_make_a_phone_column():
+    df = pd.DataFrame({'tel': [f'tel 8 (900) abc 123 45 {i:02d}' for i in range(10)],
+                       'phone': [f'8900123456{i}' for i in range(10)]})
+    results = classify_frame(df)
+    assert results['tel']['type'] is None
+    assert results['phone']['type'] == 'phone_number'
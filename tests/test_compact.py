@@ -0,0 +1,49 @@
+import json
+import sqlite3
+import pytest
+import fts
+from utils.compact import is_compact, pack_row, packed_table
+
+CSV = ('name,phone,email,note\n'
+       'Иван Петров,+79001234567,ivan@mail.ru,"line one\nline two"\n'
+       'Short row\n'
+       ',,only@mail.ru\n'
+       '"O""Brien, Pat",0791,,\n'
+       'null,[1],1e5,"{""a"": 1}"\n'
+       'Анна,,,\\N\n')
+
+def test_pack_row_drops_trailing_empty_fields():
+    assert pack_row(('a', None, 'b', None, '')) == '["a",null,"b"]'
+    assert pack_row(('', None)) == '[]'
+    assert pack_row(('Жук', 7, 'a"b\n')) == json.dumps(['Жук', '7', 'a"b\n'], ensure_ascii=False, separators=(',', ':'))
+
+def load(db_name, storage, loader):
+    fts.ingest_files(['a.csv'], db_name, 'main_content', 'main', 6, loader=loader, storage=storage)
+    conn = sqlite3.connect(db_name)
+    rows = conn.execute("SELECT * FROM main_content ORDER BY id").fetchall()
+    hits = conn.execute("SELECT rowid FROM main WHERE main MATCH '\"mail\"' ORDER BY rowid").fetchall()
+    conn.close()
+    return rows, hits
+
+@pytest.mark.parametrize('loader', ['native', 'pandas'])
+def test_compact_view_matches_padded_table(tmp_path, monkeypatch, loader):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'a.csv').write_text(CSV, encoding='utf-8')
+    padded = load('padded.db', 'padded', loader)
+    compact = load('compact.db', 'compact', loader)
+    assert compact == padded
+    rows, hits = compact
+    assert rows[0][1:5] == ('Иван Петров', '+79001234567', 'ivan@mail.ru', 'line one\nline two')
+    assert rows[3][1:3] == ('O"Brien, Pat', '0791')
+    assert [row[1:5] for row in rows[4:]] == [('null', '[1]', '1e5', '{"a": 1}'), ('Анна', None, None, '\\N')]
+    assert len(hits) == 2
+
+def test_packed_rows_store_only_populated_fields(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'a.csv').write_text(CSV, encoding='utf-8')
+    load('compact.db', 'compact', 'native')
+    conn = sqlite3.connect('compact.db')
+    assert is_compact(conn.cursor(), 'main_content')
+    data = [row[0] for row in conn.execute(f"SELECT data FROM {packed_table('main_content')} ORDER BY id")]
+    conn.close()
+    assert data[1] == '["Short row"]' and data[2] == '[null,null,"only@mail.ru"]'
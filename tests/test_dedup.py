@@ -0,0 +1,54 @@
+import sqlite3
+import pytest
+import fts
+from utils.catalog import open_catalog
+from utils.dedup import RowDedup, row_hashes
+
+HEADER = 'name,phone,email\n'
+ROWS = ''.join(f'Ivan Petrov {i},+7900{i:07d},user{i}@mail.ru\n' for i in range(40))
+
+@pytest.fixture
+def load(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fts.create_sqlite_table('meta.db', 'main_content', 3)
+    fts.create_fts5_table('meta.db', 'main', 'main_content', 3)
+    conn = sqlite3.connect('meta.db')
+    dedup = RowDedup(conn.cursor(), 'main_content')
+    conn.close()
+    catalog = open_catalog()
+
+    def load(name, text, loader='native'):
+        (tmp_path / name).write_text(HEADER + text, encoding='utf-8')
+        kept, dropped = dedup.kept, dedup.dropped
+        fts.migrate_csv_to_sqlite(name, 'meta.db', 'main_content', 'main', 3, chunk_size=16, loader=loader,
+                                  fts_mode='bulk', catalog=catalog, dedup=dedup)
+        return dedup.kept - kept, dedup.dropped - dropped
+
+    yield load
+    catalog.close()
+
+def stored_rows():
+    conn = sqlite3.connect('meta.db')
+    count = conn.execute("SELECT COUNT(*) FROM main_content").fetchone()[0]
+    conn.close()
+    return count
+
+def test_duplicate_file_is_dropped(load):
+    assert load('a.csv', ROWS) == (40, 0)
+    assert load('b.csv', ROWS) == (0, 40)
+    assert load('c.csv', ROWS, loader='pandas') == (0, 40)
+    assert stored_rows() == 40
+
+def test_near_duplicate_rows_are_kept(load):
+    load('a.csv', ROWS)
+    near = ROWS.replace('user7@mail.ru', 'user7@mail.com').replace('Ivan Petrov 8,', 'ivan petrov 8,')
+    assert load('b.csv', near, loader='pandas') == (2, 38)
+    assert stored_rows() == 42
+
+def test_repeats_within_a_file_are_dropped(load):
+    assert load('a.csv', ROWS + ROWS[:ROWS.index('\n') + 1]) == (40, 1)
+
+def test_row_hashes_ignore_padding():
+    assert row_hashes([('a', None, 'b')])[0] == row_hashes([('a', '', 'b', None, '')])[0]
+    assert row_hashes([('a', 'b', None)])[0] != row_hashes([('a', None, 'b')])[0]
+    assert row_hashes([('Ivan',)], fold_case=True)[0] == row_hashes([('IVAN',)], fold_case=True)[0]
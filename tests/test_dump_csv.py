@@ -0,0 +1,75 @@
+import csv
+import gzip
+import sqlite3
+from multiprocessing import Pool
+import pytest
+
+VALUES = ['Ivan', 'O"Brien', 'line one\nline two', 'a,b', '', None, 'Жук', 12, 3.5, ' padded ']
+
+@pytest.fixture
+def dump_csv(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # dump_csv makes its output directory on import
+    import dump_csv
+    monkeypatch.setattr(dump_csv, 'csv_directory', str(tmp_path / 'csv_output'))
+    (tmp_path / 'csv_output').mkdir(exist_ok=True)
+    return dump_csv
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A main table whose rowids have gaps: deleted runs and a jump past a million."""
+    path = str(tmp_path / 'leak.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE main (id INTEGER PRIMARY KEY, name TEXT, note TEXT, extra)")
+    rows = [(i, VALUES[i % len(VALUES)], VALUES[(i * 3) % len(VALUES)], VALUES[(i * 7) % len(VALUES)]) for i in range(1, 400)]
+    conn.executemany("INSERT INTO main VALUES (?, ?, ?, ?)", rows)
+    conn.execute("DELETE FROM main WHERE id BETWEEN 50 AND 180 OR id % 11 = 0")
+    conn.executemany("INSERT INTO main VALUES (?, ?, ?, ?)", [(1000000 + i, f'late {i}', None, i) for i in range(25)])
+    conn.commit()
+    conn.close()
+    return path
+
+def serial_export(db_path, csv_path):
+    """The export as the original loop wrote it: csv.writer over SELECT * on a newline='' file."""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.execute("SELECT * FROM main")
+    with open(csv_path, 'w', newline='', encoding='utf-8') as output:
+        writer = csv.writer(output)
+        writer.writerow([column[0] for column in cursor.description])
+        writer.writerows(cursor)
+    conn.close()
+    with open(csv_path, 'rb') as f:
+        return f.read()
+
+def test_ranges_hold_range_rows_rows(dump_csv, db_path):
+    conn = sqlite3.connect(db_path)
+    ranges = dump_csv.split_rowid_ranges(conn, db_path, 'main', range_rows=40)
+    counts = [conn.execute("SELECT COUNT(*) FROM main WHERE rowid BETWEEN ? AND ?", task[2:4]).fetchone()[0]
+              for task in ranges]
+    total = conn.execute("SELECT COUNT(*) FROM main").fetchone()[0]
+    conn.close()
+    assert sum(counts) == total
+    assert counts[:-1] == [40] * (len(ranges) - 1) and 0 < counts[-1] <= 40
+    assert all(ranges[i][3] + 1 == ranges[i + 1][2] for i in range(len(ranges) - 1))
+
+@pytest.mark.parametrize('range_rows', [1, 7, 40, 100000])
+def test_parallel_export_matches_serial(dump_csv, db_path, tmp_path, range_rows):
+    expected = serial_export(db_path, str(tmp_path / 'serial.csv'))
+    conn = sqlite3.connect(db_path)
+    column_names = [info[1] for info in conn.execute("PRAGMA table_info(main)")]
+    with Pool(2) as pool:
+        for export_format in ('csv', 'csv.gz'):
+            ranges = dump_csv.split_rowid_ranges(conn, db_path, 'main', range_rows=range_rows, export_format=export_format)
+            path = str(tmp_path / f'parallel.{export_format}')
+            dump_csv.export_chunks(ranges, path, column_names, pool, max_in_flight=3, export_format=export_format)
+            with open(path, 'rb') as f:
+                data = f.read()
+            assert (gzip.decompress(data) if export_format == 'csv.gz' else data) == expected
+    conn.close()
+
+def test_dump_table_matches_serial(dump_csv, db_path, tmp_path, monkeypatch):
+    monkeypatch.setattr(dump_csv, 'range_rows', 16)
+    expected = serial_export(db_path, str(tmp_path / 'serial.csv'))
+    with Pool(2) as pool:
+        dump_csv.dump_table_if_large(db_path, pool)
+    with open(dump_csv.export_path(db_path), 'rb') as f:
+        assert f.read() == expected
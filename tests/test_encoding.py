@@ -0,0 +1,48 @@
+import codecs
+import io
+import threading
+from utils.encoding import ERROR_HANDLER, decode_stream, handle_decode_error
+
+MIXED = 'Иван\n'.encode('utf-8') + 'Жук\n'.encode('cp1251') + 'Анна\n'.encode('utf-8')
+
+def test_fallback_and_replacement_are_counted_per_stream():
+    fallback_file, fallback_stats = decode_stream(io.BytesIO(MIXED * 3), {'encoding': 'utf-8', 'fallback': 'cp1251'})
+    replace_file, replace_stats = decode_stream(io.BytesIO(MIXED * 2), {'encoding': 'utf-8', 'fallback': None})
+    fallback_lines, replace_lines = [], []
+    # Interleaved reads: each stream's errors still land in its own stats
+    for _ in range(9):
+        fallback_lines.append(fallback_file.readline())
+        replace_lines.append(replace_file.readline())
+    assert ''.join(fallback_lines) == 'Иван\nЖук\nАнна\n' * 3
+    assert ''.join(replace_lines).count('�') == 2 * len('Жук')
+    assert (fallback_stats.fallback_bytes, fallback_stats.replaced_bytes) == (3 * len('Жук'), 0)
+    assert (replace_stats.fallback_bytes, replace_stats.replaced_bytes) == (0, 2 * len('Жук'))
+
+def test_one_handler_for_every_stream():
+    for _ in range(100):
+        text_file, _ = decode_stream(io.BytesIO(MIXED), {'encoding': 'utf-8', 'fallback': 'cp1251'})
+        assert text_file.errors == ERROR_HANDLER
+        text_file.close()
+    assert codecs.lookup_error(ERROR_HANDLER) is handle_decode_error
+
+def test_threads_keep_their_own_stats():
+    results = {}
+
+    def decode(name, copies):
+        text_file, stats = decode_stream(io.BytesIO(MIXED * copies), {'encoding': 'utf-8', 'fallback': 'cp1251'})
+        while text_file.read(7):
+            pass
+        results[name] = stats.fallback_bytes
+
+    threads = [threading.Thread(target=decode, args=(i, 200 * (i + 1))) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {i: 200 * (i + 1) * len('Жук') for i in range(4)}
+
+def test_closing_the_text_closes_the_file():
+    binary_file = io.BytesIO(MIXED)
+    text_file, _ = decode_stream(binary_file, {'encoding': 'utf-8', 'fallback': None})
+    text_file.close()
+    assert binary_file.closed
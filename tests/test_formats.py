@@ -0,0 +1,79 @@
+import sqlite3
+from multiprocessing import Pool
+import pytest
+import fts
+from utils.formats import EXPORT_FORMATS, OPTIONAL_MODULES, export_path, format_of, open_binary
+
+ROWS = [(i, f'Иван Петров{i}', f'+7900{i:07d}' if i % 3 else None, 'a "quoted",\nnote' if i % 5 == 0 else '0791')
+        for i in range(1, 60)]
+COLUMNS = ['id', 'name', 'phone', 'note']
+
+@pytest.fixture
+def dump_csv(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # dump_csv makes its output directory on import
+    import dump_csv
+    conn = sqlite3.connect('leak.db')
+    conn.execute("CREATE TABLE main (id INTEGER PRIMARY KEY, name TEXT, phone TEXT, note TEXT)")
+    conn.executemany("INSERT INTO main VALUES (?, ?, ?, ?)", ROWS)
+    conn.commit()
+    conn.close()
+    return dump_csv
+
+def export(dump_csv, export_format, path, tasks=None, **kwargs):
+    conn = sqlite3.connect('leak.db')
+    ranges = dump_csv.split_rowid_ranges(conn, 'leak.db', 'main', range_rows=7, export_format=export_format)
+    conn.close()
+    with Pool(2) as pool:
+        dump_csv.export_chunks(ranges if tasks is None else tasks(ranges), path, COLUMNS, pool,
+                               export_format=export_format, row_group_rows=16, **kwargs)
+    return ranges
+
+def loaded_rows(path, loader):
+    db_name = path + f'.{loader}.db'
+    fts.ingest_files([path], db_name, 'main_content', 'main', 4, loader=loader)
+    conn = sqlite3.connect(db_name)
+    rows = conn.execute("SELECT col_1, col_2, col_3, col_4 FROM main_content ORDER BY id").fetchall()
+    conn.close()
+    return rows
+
+def test_format_of_and_export_path():
+    assert [format_of('a' + suffix) for suffix in EXPORT_FORMATS.values()] == list(EXPORT_FORMATS)
+    assert format_of('a.txt') is None
+    assert export_path('out/leak.csv', 'csv.zst') == 'out/leak.csv.zst'
+
+@pytest.mark.parametrize('export_format', sorted(EXPORT_FORMATS))
+@pytest.mark.parametrize('loader', ['native', 'pandas'])
+def test_every_format_loads_like_csv(dump_csv, export_format, loader):
+    if export_format in OPTIONAL_MODULES:
+        pytest.importorskip(OPTIONAL_MODULES[export_format])
+    export(dump_csv, 'csv', 'leak.csv')
+    path = export_path('leak.csv', export_format)
+    export(dump_csv, export_format, path)
+    expected = [tuple(None if value is None else str(value) for value in row) for row in ROWS]
+    for loaded_path in sorted({'leak.csv', path}):
+        assert loaded_rows(loaded_path, loader) == expected
+
+@pytest.mark.parametrize('export_format', ['csv', 'csv.gz', 'csv.lz4', 'csv.zst'])
+def test_resumed_export_matches_full_export(dump_csv, export_format):
+    if export_format in OPTIONAL_MODULES:
+        pytest.importorskip(OPTIONAL_MODULES[export_format])
+    path = export_path('leak.csv', export_format)
+    offsets = []
+    ranges = export(dump_csv, export_format, path, on_write=lambda task, offset: offsets.append(offset))
+    with open(path, 'rb') as f:
+        full = f.read()
+    with open_binary(path) as f:
+        text = f.read()
+    # Cut back after the third range and finish from there, as dump_table_if_large resumes
+    with open(path, 'ab') as f:
+        f.write(b'partial range')
+    export(dump_csv, export_format, path, tasks=lambda ranges: ranges[3:], resume_offset=offsets[2])
+    with open(path, 'rb') as f:
+        assert f.read() == full
+    assert len(offsets) == len(ranges) and text.count(b'\n') > len(ROWS)
+
+def test_parquet_row_groups(dump_csv):
+    pq = pytest.importorskip('pyarrow.parquet')
+    export(dump_csv, 'parquet', 'leak.parquet')
+    metadata = pq.ParquetFile('leak.parquet').metadata
+    assert [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)] == [16, 16, 16, 11]
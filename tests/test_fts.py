@@ -0,0 +1,72 @@
+import sqlite3
+import pytest
+import fts
+from utils.normalize import lookup_rows
+from utils.sources import get_source_id
+from utils.tables import lookup_table
+
+HEADER = 'name,phone,email\n'
+A = ''.join(f'Ivan Petrov{i},+7900{i:07d},ivan{i}@mail.ru\n' for i in range(30))
+B = ''.join(f'Anna Smirnova{i},+7901{i:07d},anna{i}@mail.ru\n' for i in range(20))
+NORMALIZED = {'col_2': 'phone', 'col_3': 'email'}
+
+@pytest.fixture(params=['padded', 'compact'])
+def loaded(request, tmp_path, monkeypatch):
+    """meta.db with a.csv and b.csv loaded, indexed, normalized and deduplicated."""
+    monkeypatch.chdir(tmp_path)
+    for name, rows in (('a.csv', A), ('b.csv', B)):
+        (tmp_path / name).write_text(HEADER + rows, encoding='utf-8')
+    fts.ingest_files(['a.csv', 'b.csv'], 'meta.db', 'main_content', 'main', 3, loader='native',
+                     trigram_columns=['col_3'], normalized_columns=NORMALIZED, storage=request.param, dedup=True)
+    return tmp_path
+
+def matches(conn, index_name, query):
+    return conn.execute(f"SELECT COUNT(*) FROM {index_name} WHERE {index_name} MATCH ?", (query,)).fetchone()[0]
+
+def check_indexes(conn):
+    # Every index entry has a row with the same values and every row is indexed
+    for index_name in ('main', 'main_trigram'):
+        conn.execute(f"INSERT INTO {index_name} ({index_name}) VALUES ('integrity-check')")
+    # and every lookup entry has its row
+    for kind in ('phone', 'email'):
+        assert conn.execute(f"SELECT COUNT(*) FROM {lookup_table('main_content', kind)} "
+                            "WHERE id NOT IN (SELECT id FROM main_content)").fetchone()[0] == 0
+
+def counts(word, mailbox, phone):
+    """Rows in the table, and hits for a name word, an email substring, a phone and mailbox+'5@MAIL.RU'."""
+    conn = sqlite3.connect('meta.db')
+    check_indexes(conn)
+    result = {
+        'rows': conn.execute("SELECT COUNT(*) FROM main_content").fetchone()[0],
+        'word': matches(conn, 'main', f'"{word}"'),
+        'trigram': matches(conn, 'main_trigram', f'"{mailbox}"'),
+        'phone': len(lookup_rows(conn, 'main_content', phone=phone)),
+        'email': len(lookup_rows(conn, 'main_content', email=f'{mailbox}5@MAIL.RU')),
+    }
+    conn.close()
+    return result
+
+def test_purge_removes_rows_and_index_entries(loaded):
+    assert counts('Petrov5', 'ivan', '8 (900) 000-00-05') == {'rows': 50, 'word': 1, 'trigram': 30, 'phone': 1, 'email': 1}
+    assert fts.purge_source('a.csv', 'meta.db', 'main_content', 'main') == 30
+    assert counts('Petrov5', 'ivan', '8 (900) 000-00-05') == {'rows': 20, 'word': 0, 'trigram': 0, 'phone': 0, 'email': 0}
+    assert counts('Smirnova5', 'anna', '+79010000005') == {'rows': 20, 'word': 1, 'trigram': 20, 'phone': 1, 'email': 1}
+    assert fts.purge_source('a.csv', 'meta.db', 'main_content', 'main') == 0
+
+def test_purged_rows_are_not_duplicates(loaded):
+    fts.purge_source('a.csv', 'meta.db', 'main_content', 'main')
+    (loaded / 'c.csv').write_text(HEADER + A, encoding='utf-8')
+    fts.ingest_files(['c.csv'], 'meta.db', 'main_content', 'main', 3, loader='native', dedup=True)
+    assert counts('Petrov5', 'ivan', '+79000000005') == {'rows': 50, 'word': 1, 'trigram': 30, 'phone': 1, 'email': 1}
+
+def test_reload_replaces_rows_in_place(loaded):
+    conn = sqlite3.connect('meta.db')
+    source_id = get_source_id(conn, 'main_content', 'a.csv')
+    conn.close()
+    (loaded / 'a.csv').write_text(HEADER + A.replace('Petrov', 'Sidorov').replace('ivan', 'sido'), encoding='utf-8')
+    fts.reload_source('a.csv', 'meta.db', 'main_content', 'main')
+    assert counts('Petrov5', 'ivan', '+79000000005') == {'rows': 50, 'word': 0, 'trigram': 0, 'phone': 1, 'email': 0}
+    assert counts('Sidorov5', 'sido', '+79000000005') == {'rows': 50, 'word': 1, 'trigram': 30, 'phone': 1, 'email': 1}
+    conn = sqlite3.connect('meta.db')
+    assert get_source_id(conn, 'main_content', 'a.csv') == source_id
+    conn.close()
@@ -0,0 +1,24 @@
+import sqlite3
+import pytest
+import migrate
+
+CSV = 'email,phone,name\n' + ''.join(f'user{i}@mail.ru,+7900{i:07d},Ivan {i}\n' for i in range(30))
+
+@pytest.mark.parametrize('loader', ['pandas', 'native'])
+def test_each_file_is_decoded_once(tmp_path, monkeypatch, loader):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'a.csv').write_text(CSV, encoding='utf-8')
+    opened = []
+
+    def open_text(path, verdict):
+        opened.append(path)
+        return real_open_text(path, verdict)
+
+    real_open_text = migrate.open_text
+    monkeypatch.setattr(migrate, 'open_text', open_text)
+    migrate.migrate_csv_to_sqlite('a.csv', 'meta.db', 'main_content', chunk_size=7, loader=loader)
+    assert opened == ['a.csv']
+    conn = sqlite3.connect('meta.db')
+    assert conn.execute("SELECT col_1, col_3 FROM main_content ORDER BY id LIMIT 1").fetchone() == ('user0@mail.ru', 'Ivan 0')
+    assert conn.execute("SELECT COUNT(*) FROM main_content").fetchone()[0] == 30
+    conn.close()
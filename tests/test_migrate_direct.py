@@ -0,0 +1,76 @@
+import sqlite3
+from multiprocessing import Pool
+import pytest
+import fts
+import migrate_direct
+
+ROWS = [(1, 'Иван Петров', '+79001234567', 'ivan@mail.ru', 12),
+        (2, 'O"Brien, Pat', None, 'pat@mail.ru', 3.5),
+        (5, 'line one\nline two', '89001234568', None, None),
+        (1000000, 'Анна', '+79001234569', 'anna@mail.ru', 'x')]
+
+@pytest.fixture
+def db_folder(tmp_path, monkeypatch):
+    """Two source databases with a main table; leak.db has rowid gaps."""
+    monkeypatch.chdir(tmp_path)
+    folder = tmp_path / 'db'
+    folder.mkdir()
+    for name, rows in (('leak.db', ROWS), ('small.db', [(1, 'Пётр', '+79001234570', 'petr@mail.ru', None)])):
+        conn = sqlite3.connect(folder / name)
+        conn.execute("CREATE TABLE main (id INTEGER PRIMARY KEY, name TEXT, tel TEXT, mail TEXT, extra)")
+        conn.executemany("INSERT INTO main VALUES (?, ?, ?, ?, ?)", rows)
+        conn.commit()
+        conn.close()
+    return folder
+
+def content_rows(sqlite_db, column_count):
+    conn = sqlite3.connect(sqlite_db)
+    columns = ", ".join(f'col_{i+1}' for i in range(column_count))
+    rows = conn.execute(f"SELECT {columns} FROM main_content ORDER BY id").fetchall()
+    conn.close()
+    return rows
+
+@pytest.mark.parametrize('storage', ['padded', 'compact'])
+def test_direct_copy_matches_the_csv_round_trip(db_folder, storage):
+    migrate_direct.process_db_folder(str(db_folder), 'direct.db', 'main_content', storage=storage)
+    # The same sources through dump_csv.py's CSV files and fts.py
+    import dump_csv
+    (db_folder.parent / 'csv').mkdir()
+    csv_paths = []
+    with Pool(1) as pool:
+        for name in ('leak.db', 'small.db'):
+            db_path, csv_path = str(db_folder / name), str(db_folder.parent / 'csv' / name.replace('.db', '.csv'))
+            conn = sqlite3.connect(db_path)
+            dump_csv.export_chunks(dump_csv.split_rowid_ranges(conn, db_path, 'main'), csv_path,
+                                   ['id', 'name', 'tel', 'mail', 'extra'], pool)
+            conn.close()
+            csv_paths.append(csv_path)
+    fts.ingest_files(csv_paths, 'csv.db', 'main_content', 'main', 10, loader='native', fts_mode='bulk')
+    direct = content_rows('direct.db', 10)
+    assert direct == content_rows('csv.db', 10)
+    assert direct[1][:5] == ('2', 'O"Brien, Pat', None, 'pat@mail.ru', '3.5')
+    conn = sqlite3.connect('direct.db')
+    conn.execute("INSERT INTO main (main) VALUES ('integrity-check')")
+    assert conn.execute("SELECT col_2 FROM main WHERE main MATCH '\"Анна\"'").fetchall() == [('Анна',)]
+    conn.close()
+
+def test_copy_in_small_batches_across_rowid_gaps(db_folder):
+    fts.create_content_tables('direct.db', 'main_content', 'main', 5)
+    assert migrate_direct.copy_database(str(db_folder / 'leak.db'), 'direct.db', 'main_content', 'main', batch_rows=2) == 4
+    assert [row[0] for row in content_rows('direct.db', 1)] == ['1', '2', '5', '1000000']
+    # Copied databases are done in the catalog; only small.db is left
+    migrate_direct.process_db_folder(str(db_folder), 'direct.db', 'main_content')
+    assert len(content_rows('direct.db', 1)) == 5
+
+def test_size_filter_counts_rows(db_folder):
+    assert migrate_direct.read_source_info(str(db_folder / 'leak.db')) == (4, ['id', 'name', 'tel', 'mail', 'extra'])
+    migrate_direct.process_db_folder(str(db_folder), 'direct.db', 'main_content', max_rows=3)
+    assert [row[1] for row in content_rows('direct.db', 2)] == ['Пётр']
+
+def test_detected_columns(db_folder):
+    migrate_direct.process_db_folder(str(db_folder), 'named.db', 'users', columns='detected')
+    conn = sqlite3.connect('named.db')
+    rows = conn.execute("SELECT email, phone, col_2 FROM users ORDER BY id").fetchall()
+    conn.close()
+    assert rows[0] == ('ivan@mail.ru', '+79001234567', 'Иван Петров')
+    assert len(rows) == 5
@@ -0,0 +1,35 @@
+import os
+import signal
+import sqlite3
+import pytest
+import migrate_sqlite
+from utils.catalog import open_catalog, is_done, get_in_progress
+
+CSV = 'email,phone,name\n' + ''.join(f'user{i}@mail.ru,+7900{i:07d},Ivan {i}\n' for i in range(30))
+
+@pytest.fixture
+def csv_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'a.csv').write_text(CSV, encoding='utf-8')
+    return 'a.csv'
+
+def test_migrate_csv_to_sqlite_keeps_its_signature(csv_file):
+    migrate_sqlite.migrate_csv_to_sqlite(csv_file, 'meta.db', 'main_content', chunk_size=7)
+    conn = sqlite3.connect('meta.db')
+    assert conn.execute("SELECT COUNT(*) FROM main_content").fetchone()[0] == 30
+    conn.close()
+    catalog = open_catalog()
+    assert is_done(catalog, migrate_sqlite.CATALOG_STAGE, csv_file, 'meta.db')
+    catalog.close()
+
+def killed_parser(file_queue, batch_queue, chunk_size):
+    os.kill(os.getpid(), signal.SIGKILL)
+
+def test_writer_returns_when_a_parser_dies(csv_file, monkeypatch):
+    # Parsers are forked, so they run the patched worker
+    monkeypatch.setattr(migrate_sqlite, 'parse_worker', killed_parser)
+    monkeypatch.setattr(migrate_sqlite, 'PARSER_POLL_SECONDS', 0.1)
+    migrate_sqlite.migrate_csv_to_sqlite(csv_file, 'meta.db', 'main_content')
+    catalog = open_catalog()
+    assert get_in_progress(catalog, migrate_sqlite.CATALOG_STAGE, 'meta.db') == [csv_file]
+    catalog.close()
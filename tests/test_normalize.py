@@ -0,0 +1,55 @@
+import sqlite3
+import pytest
+import fts
+from utils.normalize import lookup_rows, normalize_email
+from utils.search import SearchPool
+from utils.tables import get_normalized_columns
+
+HEADER = 'name,phone,email\n'
+A = ''.join(f'Ivan {i},{"8-900-" if i % 2 else "+7900"}{i:07d},Ivan{i}@Mail.RU\n' for i in range(30))
+B = 'Пётр,+79015550000,  ПЁТР@Почта.РФ\t\nАнна,89015550001,anna@mail.ru\n'
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'a.csv').write_text(HEADER + A, encoding='utf-8')
+    (tmp_path / 'b.csv').write_text(HEADER + B, encoding='utf-8')
+    fts.ingest_files(['a.csv'], 'meta.db', 'main_content', 'main', 3, loader='native', normalized_columns='auto')
+    return 'meta.db'
+
+def names(rows):
+    return [row[1] for row in rows]
+
+def test_normalize_email():
+    assert normalize_email('  ПЁТР@Почта.РФ\t') == 'пётр@почта.рф'
+    assert normalize_email('Ivan@Mail.RU') == 'ivan@mail.ru'
+    assert normalize_email('not an email') is None
+
+def test_columns_detected_and_filled(db):
+    conn = sqlite3.connect(db)
+    assert sorted(get_normalized_columns(conn.cursor(), 'main_content')) == [('col_2', 'phone', 30), ('col_3', 'email', 30)]
+    conn.close()
+
+@pytest.mark.parametrize('phone', ['+79000000007', '8 (900) 000-00-07', '+7 900 000 00 07', '89000000007'])
+def test_phone_lookup_ignores_format(db, phone):
+    conn = sqlite3.connect(db)
+    assert names(lookup_rows(conn, 'main_content', phone=phone)) == ['Ivan 7']
+    conn.close()
+
+def test_email_lookup_and_either_match(db):
+    conn = sqlite3.connect(db)
+    assert names(lookup_rows(conn, 'main_content', email=' IVAN8@mail.ru')) == ['Ivan 8']
+    assert names(lookup_rows(conn, 'main_content', phone='+79000000003', email='ivan8@mail.ru')) == ['Ivan 3', 'Ivan 8']
+    assert lookup_rows(conn, 'main_content', phone='12345', email='nobody') == []
+    assert len(lookup_rows(conn, 'main_content', email='ivan8@mail.ru', phone='+79000000003', limit=1)) == 1
+    conn.close()
+
+def test_later_files_are_filled_as_they_load(db):
+    fts.ingest_files(['b.csv'], db, 'main_content', 'main', 3, loader='native', normalized_columns='auto')
+    pool = SearchPool(db, size=1)
+    assert names(pool.lookup(email='пётр@почта.рф')) == ['Пётр']
+    assert names(pool.lookup(phone='+7 901 555 00 01')) == ['Анна']
+    pool.close()
+    conn = sqlite3.connect(db)
+    assert {filled for _, _, filled in get_normalized_columns(conn.cursor(), 'main_content')} == {32}
+    conn.close()
@@ -0,0 +1,37 @@
+import csv
+import io
+import pytest
+from utils.parallel_csv import open_csv_ranges, stream_csv_rows_parallel
+
+VERDICT = {'encoding': 'utf-8', 'fallback': None}
+CASES = {
+    'quoted_newlines': b'id,name,note\n1,"Ivan\nPetrov","a ""quoted"" note"\n2,Anna,"line one\nline two\n"\n3,,\n4,"",x\n',
+    'stray_quotes': b'id,name,note\n1,O"Brien,x\n2,"multi\nline",y\n3,5" disk,"Smith, J"\n4,a,b,c\n5,"x\n""y""",z\n',
+    'crlf': b'id,name,note\r\n1,"Ivan\r\nPetrov",x\r\n2,Anna,\r\n3,"a,b","c\r\n"\r\n4,a,b,c\r\n5\r\n',
+}
+
+def reader_rows(data):
+    """Header and rows as csv.reader reads the whole file, shaped like stream_csv_rows."""
+    header, *rows = csv.reader(io.StringIO(data.decode('utf-8'), newline=''))
+    width = len(header)
+    return header, [tuple(value or None for value in row) + (None,) * (width - len(row))
+                     for row in rows if row and len(row) <= width]
+
+@pytest.mark.parametrize('name', sorted(CASES))
+@pytest.mark.parametrize('range_bytes', [1, 3, 7, 16, 1000])
+def test_ranges_match_csv_reader(tmp_path, name, range_bytes):
+    path = tmp_path / f'{name}.csv'
+    path.write_bytes(CASES[name])
+    header, ranges = open_csv_ranges(str(path), VERDICT, range_bytes)
+    expected_header, expected_rows = reader_rows(CASES[name])
+    assert header == expected_header
+    rows = list(stream_csv_rows_parallel(str(path), VERDICT, ranges, len(header), processes=1))
+    assert rows == expected_rows
+
+def test_skipped_lines_reported_only_when_some(tmp_path, capsys):
+    for name, skipped in (('quoted_newlines', False), ('crlf', True)):
+        path = tmp_path / f'{name}.csv'
+        path.write_bytes(CASES[name])
+        header, ranges = open_csv_ranges(str(path), VERDICT, 16)
+        list(stream_csv_rows_parallel(str(path), VERDICT, ranges, len(header), processes=1))
+        assert ('skipped' in capsys.readouterr().out) == skipped
@@ -0,0 +1,84 @@
+import importlib.util
+import sys
+import types
+from types import SimpleNamespace
+import pytest
+
+@pytest.fixture
+def rename_csv(monkeypatch):
+    """A fresh rename_csv module for one test, kept out of sys.modules.
+
+    When spaCy is not installed an empty spacy module stands in while the test runs;
+    only the nlp objects below are used.
+    """
+    try:
+        import spacy
+    except ImportError:
+        monkeypatch.setitem(sys.modules, 'spacy', types.ModuleType('spacy'))
+    spec = importlib.util.find_spec('rename_csv')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class StubNlp:
+    """Stands in for a loaded pipeline: PERSON/PER for known first names, ORG otherwise."""
+    def __init__(self, label, pipe_names=('tok2vec', 'ner'), listeners=()):
+        self.label = label
+        self.pipe_names = list(pipe_names)
+        self.listeners = list(listeners)
+        self.calls = []
+
+    def pipe(self, texts, batch_size):
+        texts = list(texts)
+        self.calls.append((texts, batch_size))
+        for text in texts:
+            label = self.label if text.split()[0] in ('Иван', 'John') else 'ORG'
+            yield SimpleNamespace(ents=[SimpleNamespace(label_=label)])
+
+    def get_pipe(self, name):
+        return SimpleNamespace(listening_components=self.listeners)
+
+    def remove_pipe(self, name):
+        self.pipe_names.remove(name)
+
+def use_stubs(rename_csv, monkeypatch, tmp_path, models):
+    monkeypatch.setattr(rename_csv, 'models', models)
+    monkeypatch.setattr(rename_csv, 'NAME_CACHE_DB', str(tmp_path / 'names.db'))
+    monkeypatch.setattr(rename_csv, 'cache_conn', None)
+
+def test_person_labels_and_batching(rename_csv, monkeypatch, tmp_path):
+    models = {'ru': StubNlp('PER'), 'en': StubNlp('PERSON')}
+    use_stubs(rename_csv, monkeypatch, tmp_path, models)
+    values = ['Иван Петров', 'John Smith', 'ACME Ltd', 'ООО Ромашка', 'Иван Петров']
+    assert rename_csv.detect_person_values(values) == {
+        'Иван Петров': True, 'John Smith': True, 'ACME Ltd': False, 'ООО Ромашка': False}
+    # Distinct values only, Cyrillic to the Russian model, one pipe call per language
+    (ru_texts, ru_batch), = models['ru'].calls
+    (en_texts, en_batch), = models['en'].calls
+    assert sorted(ru_texts) == ['Иван Петров', 'ООО Ромашка'] and sorted(en_texts) == ['ACME Ltd', 'John Smith']
+    assert ru_batch == en_batch == rename_csv.PIPE_BATCH_SIZE
+
+    # Known values come from the cache without running the models again
+    assert rename_csv.detect_person_values(['John Smith', 'ACME Ltd']) == {'John Smith': True, 'ACME Ltd': False}
+    assert len(models['en'].calls) == 1
+    rename_csv.cache_conn.close()
+
+def test_map_name_columns(rename_csv, monkeypatch, tmp_path):
+    import pandas as pd
+    use_stubs(rename_csv, monkeypatch, tmp_path, {'ru': StubNlp('PER'), 'en': StubNlp('PERSON')})
+    df = pd.DataFrame({'a': ['Иван Петров', None], 'b': ['ACME Ltd', '1'], 'c': ['John Smith', 'x']})
+    assert rename_csv.map_name_columns(df) == {'a': 'name', 'b': 'b', 'c': 'name_1'}
+    rename_csv.cache_conn.close()
+
+def test_get_nlp_loads_ner_only(rename_csv, monkeypatch):
+    loaded = {}
+    def load(name, exclude=()):
+        loaded[name] = list(exclude)
+        return StubNlp('PERSON', listeners=['ner'] if name == MODEL_NAMES['ru'] else [])
+    MODEL_NAMES = rename_csv.MODEL_NAMES
+    monkeypatch.setattr(rename_csv, 'spacy', SimpleNamespace(load=load))
+    monkeypatch.setattr(rename_csv, 'models', {})
+    # A tok2vec only the excluded components listened to is dropped; one NER listens to is kept
+    assert rename_csv.get_nlp('en').pipe_names == ['ner']
+    assert rename_csv.get_nlp('ru').pipe_names == ['tok2vec', 'ner']
+    assert all(loaded[name] == rename_csv.NON_NER_COMPONENTS for name in MODEL_NAMES.values())
@@ -0,0 +1,50 @@
+import random
+import sqlite3
+import pandas as pd
+import main
+from utils.catalog import open_catalog
+from utils.schema_cache import schema_fingerprint
+
+def people(count, seed):
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        'id': range(1, count + 1),
+        'fio': [rng.choice(['Иван Петров', 'Анна Смирнова', 'Olga Ivanova']) for _ in range(count)],
+        'tel': [f"+7 9{rng.randrange(10**8, 10**9)}" for _ in range(count)],
+    })
+
+def test_same_layout_same_fingerprint():
+    assert schema_fingerprint(people(200, 1), ['id']) == schema_fingerprint(people(200, 2), ['id'])
+    other = people(200, 1).rename(columns={'tel': 'phone'})
+    assert schema_fingerprint(other, ['id']) != schema_fingerprint(people(200, 1), ['id'])
+
+def write_table(sqlite_db, count):
+    rng = random.Random(0)
+    conn = sqlite3.connect(sqlite_db)
+    conn.execute("CREATE TABLE main_content (id INTEGER PRIMARY KEY, col_1 TEXT, col_2 TEXT)")
+    # Digits make up about 1/8 of col_2, right between two rounded shares: two different samples rarely agree
+    conn.executemany("INSERT INTO main_content (col_1, col_2) VALUES (?, ?)",
+                     [('Иван Петров', '1234567' if rng.random() < 0.125 else 'abcdefg') for _ in range(count)])
+    conn.commit()
+    conn.close()
+
+def schema_rows(kind):
+    catalog = open_catalog()
+    rows = catalog.execute("SELECT fingerprint, hits, misses FROM schemas WHERE kind = ?", (kind,)).fetchall()
+    catalog.close()
+    return rows
+
+def test_unchanged_table_fingerprints_the_same_twice(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_table('a.db', 20000)
+    plans = [main.classify_database('a.db', 'main_content') for _ in range(5)]
+    assert all(plan == plans[0] for plan in plans)
+    assert [row[1:] for row in schema_rows(main.CATALOG_STAGE)] == [(4, 1)]
+
+def test_cache_bypass(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_table('a.db', 1000)
+    for _ in range(3):
+        _, _, error = main.classify_database('a.db', 'main_content', use_cache=False)
+        assert error is None
+    assert schema_rows(main.CATALOG_STAGE) == []
@@ -0,0 +1,92 @@
+import sqlite3
+import pytest
+from utils.search import SearchPool, is_substring_query, match_expression
+
+ROWS = [
+    (1, 'Иван Петров', 'Санкт-Петербург'),
+    (2, "Patrick O'Brien", 'ivan.petrov@gmail.com'),
+    (3, 'Andrew And Sons', '+7 900 123-45-67'),
+    (4, 'Андрей Иванов', 'Москва'),
+    (5, 'Анна Римская-Корсакова', '8 900 555-12-34'),
+]
+
+@pytest.fixture
+def pool(tmp_path):
+    sqlite_db = str(tmp_path / 'search.db')
+    conn = sqlite3.connect(sqlite_db)
+    conn.execute("CREATE TABLE main_content (id INTEGER PRIMARY KEY, col_1 TEXT, col_2 TEXT)")
+    conn.execute("CREATE VIRTUAL TABLE main USING fts5(col_1, col_2, content='main_content', content_rowid='id')")
+    conn.execute("CREATE VIRTUAL TABLE main_trigram USING fts5(col_2, content='main_content', content_rowid='id', tokenize='trigram')")
+    conn.executemany("INSERT INTO main_content VALUES (?, ?, ?)", ROWS)
+    conn.execute("INSERT INTO main (main) VALUES ('rebuild')")
+    conn.execute("INSERT INTO main_trigram (main_trigram) VALUES ('rebuild')")
+    conn.commit()
+    conn.close()
+    pool = SearchPool(sqlite_db, size=1)
+    yield pool
+    pool.close()
+
+def ids(result):
+    return sorted(row[0] for row in result[0])
+
+@pytest.mark.parametrize('query, expected', [
+    ('Санкт-Петербург', [1]),
+    ('gmail.com', [2]),
+    ('O"Brien', [2]),
+    ("O'Brien", [2]),
+    ('AND', [3]),
+    ('NOT', []),
+    ('ivan NEAR petrov', []),
+    ('-', []),
+    ('', []),
+])
+def test_word_search_treats_input_as_text(pool, query, expected):
+    assert ids(pool.search(query, substring=False, snippets=False)) == expected
+
+def test_match_expression_quotes_every_term():
+    assert match_expression('Иван  Петров') == '"Иван" "Петров"'
+    assert match_expression('O"Brien AND') == '"O""Brien" "AND"'
+    assert match_expression('  ') is None
+
+def test_raw_expression(pool):
+    assert ids(pool.search('Иван OR Andrew', substring=False, snippets=False, raw=True)) == [1, 3]
+    with pytest.raises(sqlite3.OperationalError):
+        pool.search('gmail.com', substring=False, snippets=False, raw=True)
+
+@pytest.mark.parametrize('query, substring', [
+    ('gmail.com', True),
+    ('ivanov.', True),
+    ('@gm', True),
+    ('123-45', True),
+    ('Санкт-Петербург', True),
+    ('Андр', False),
+    ('Иван Петров', False),
+    ('.r', False),
+])
+def test_routing(query, substring):
+    assert is_substring_query(query) == substring
+
+@pytest.mark.parametrize('query, expected', [
+    ('gmail.com', [2]),
+    ('ivan.', [2]),
+    ('555-12', [5]),
+    ('Римская-Корсакова', [5]),
+    ('Андр', [4]),
+    ('Андр Ив', [4]),
+    ('Иван', [1]),
+    ('Ив', [1, 4]),
+])
+def test_automatic_routing(pool, query, expected):
+    assert ids(pool.search(query, snippets=False)) == expected
+
+def test_prefix_off(pool):
+    assert ids(pool.search('Андр', snippets=False, prefix=False)) == []
+
+@pytest.mark.parametrize('query, expected', [('Ив', [1, 4]), ('900', [3, 5])])
+def test_pages_stay_in_one_index(pool, query, expected):
+    found, cursor = [], None
+    for _ in range(len(expected)):
+        rows, cursor = pool.search(query, limit=1, cursor=cursor, snippets=False)
+        found += [row[0] for row in rows]
+    assert cursor is None
+    assert sorted(found) == expected
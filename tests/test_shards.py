@@ -0,0 +1,30 @@
+import fts
+from utils.shards import ShardedSearch, find_shards
+
+FILES = {
+    'a.csv': 'name,city\nIvan Petrov,Moscow\nOlga Petrova,Moscow\n',
+    'b.csv': 'name,city\nIvan Sidorov,Omsk\n',
+    'c.csv': 'name,city\nIvan Ivanov,Kazan\n',
+}
+
+def load_shards(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name, text in FILES.items():
+        (tmp_path / name).write_text(text, encoding='utf-8')
+    fts.ingest_shard(['a.csv', 'b.csv'], 'meta_00.db', 'main_content', 'main', 2, 'native', 'incremental', None)
+    fts.ingest_shard(['c.csv'], 'meta_01.db', 'main_content', 'main', 2, 'native', 'incremental', None)
+    return ShardedSearch(find_shards('meta.db'))
+
+def names(matches):
+    return sorted(row[1] for _, row in matches)
+
+def test_sources_filter_rows(tmp_path, monkeypatch):
+    search = load_shards(tmp_path, monkeypatch)
+    try:
+        assert names(search.search('Ivan', snippets=False)) == ['Ivan Ivanov', 'Ivan Petrov', 'Ivan Sidorov']
+        assert names(search.search('Ivan', sources=['a.csv'], snippets=False)) == ['Ivan Petrov']
+        assert names(search.search('Ivan', sources=['b.csv', 'c.csv'], snippets=False)) == ['Ivan Ivanov', 'Ivan Sidorov']
+        assert search.select_shards(['c.csv']) == ['meta_01.db']
+        assert search.search('Ivan', sources=['missing.csv'], snippets=False) == []
+    finally:
+        search.close()
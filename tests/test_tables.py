@@ -0,0 +1,55 @@
+import sqlite3
+import pytest
+import fts
+from utils.normalize import lookup_rows
+from utils.tables import rename_content_table
+
+HEADER = 'name,phone,email\n'
+ROWS = ''.join(f'Ivan Petrov{i},+7900{i:07d},ivan{i}@mail.ru\n' for i in range(30))
+
+@pytest.fixture(params=['padded', 'compact'])
+def renamed(request, tmp_path, monkeypatch):
+    """meta.db loaded with every side table and statistics, then renamed main_content -> leak_content."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'a.csv').write_text(HEADER + ROWS, encoding='utf-8')
+    fts.ingest_files(['a.csv'], 'meta.db', 'main_content', 'main', 3, loader='native', trigram_columns=['col_3'],
+                     normalized_columns={'col_2': 'phone', 'col_3': 'email'}, storage=request.param, dedup=True)
+    conn = sqlite3.connect('meta.db')
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    rename_content_table('meta.db', 'main_content', 'leak_content')
+    return tmp_path
+
+def test_nothing_keeps_the_old_name(renamed):
+    conn = sqlite3.connect('meta.db')
+    assert conn.execute("PRAGMA integrity_check").fetchone()[0] == 'ok'
+    names = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'main_content%'")]
+    assert names == []
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE instr(sql, 'main_content') > 0").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_stat1 WHERE instr(tbl, 'main_content') > 0 "
+                        "OR instr(idx, 'main_content') > 0").fetchone()[0] == 0
+    assert conn.execute("SELECT DISTINCT table_name FROM normalized_columns").fetchall() == [('leak_content',)]
+    conn.close()
+
+def test_indexes_read_the_renamed_table(renamed):
+    conn = sqlite3.connect('meta.db')
+    # integrity-check reads the content= table, so it fails if the FTS schema still names the old one
+    for index_name in ('main', 'main_trigram'):
+        conn.execute(f"INSERT INTO {index_name} ({index_name}) VALUES ('integrity-check')")
+    assert conn.execute("SELECT col_1 FROM main WHERE main MATCH '\"Petrov5\"'").fetchall() == [('Ivan Petrov5',)]
+    assert conn.execute("SELECT COUNT(*) FROM main_trigram WHERE main_trigram MATCH '\"n5@ma\"'").fetchone()[0] == 1
+    assert [row[1] for row in lookup_rows(conn, 'leak_content', phone='89000000007')] == ['Ivan Petrov7']
+    conn.close()
+
+def test_loads_and_purges_use_the_renamed_tables(renamed):
+    (renamed / 'b.csv').write_text(HEADER + ROWS + 'Anna Smirnova,+79010000000,anna@mail.ru\n', encoding='utf-8')
+    fts.ingest_files(['b.csv'], 'meta.db', 'leak_content', 'main', 3, loader='native', dedup=True)
+    conn = sqlite3.connect('meta.db')
+    assert conn.execute("SELECT COUNT(*) FROM leak_content").fetchone()[0] == 31
+    conn.close()
+    assert fts.purge_source('a.csv', 'meta.db', 'leak_content', 'main') == 30
+    conn = sqlite3.connect('meta.db')
+    conn.execute("INSERT INTO main (main) VALUES ('integrity-check')")
+    assert conn.execute("SELECT col_1 FROM leak_content").fetchall() == [('Anna Smirnova',)]
+    conn.close()
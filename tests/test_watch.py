@@ -0,0 +1,64 @@
+import os
+import signal
+import sqlite3
+import time
+import pytest
+import fts
+import watch
+from utils.catalog import open_catalog
+
+CSV = 'name,phone,email\n' + ''.join(f'Ivan {i},+7900{i:07d},user{i}@mail.ru\n' for i in range(20))
+WIDE = 'name,phone,email,city\n' + ''.join(f'Anna {i},+7901{i:07d},anna{i}@mail.ru,Omsk\n' for i in range(20))
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGINT, signal.SIGTERM)}
+    (tmp_path / 'in').mkdir()
+    yield tmp_path / 'in'
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+
+def stored_rows():
+    conn = sqlite3.connect('meta.db')
+    count = conn.execute("SELECT COUNT(*) FROM main_content").fetchone()[0]
+    conn.close()
+    return count
+
+@pytest.mark.parametrize('loader', ['native', 'pandas'])
+def test_wider_file_is_rejected(folder, loader):
+    fts.create_content_tables('meta.db', 'main_content', 'main', 3, 'padded', None, None)
+    (folder / 'a.csv').write_text(CSV, encoding='utf-8')
+    (folder / 'wide.csv').write_text(WIDE, encoding='utf-8')
+    catalog = open_catalog()
+    assert watch.load_file(str(folder / 'a.csv'), 'meta.db', 'main_content', 'main', loader, None, None, catalog) == 20
+    with pytest.raises(ValueError, match='4 columns but main_content has 3'):
+        watch.load_file(str(folder / 'wide.csv'), 'meta.db', 'main_content', 'main', loader, None, None, catalog)
+    catalog.close()
+    assert stored_rows() == 20
+
+def run_watch(folder, **kwargs):
+    return watch.watch_folder(str(folder), 'meta.db', 'main_content', 'main', normalized_columns=None, max_columns=3,
+                              poll_seconds=0.1, settle_seconds=0, **kwargs)
+
+def test_dead_loader_fails_its_file_and_is_replaced(folder, monkeypatch):
+    load_file = watch.load_file
+    def dying_load_file(file_path, *args):
+        if file_path.endswith('bad.csv'):
+            os._exit(3)
+        return load_file(file_path, *args)
+    monkeypatch.setattr(watch, 'load_file', dying_load_file)
+    (folder / 'bad.csv').write_text(CSV[:40], encoding='utf-8')
+    (folder / 'good.csv').write_text(CSV, encoding='utf-8')
+    assert run_watch(folder, run_seconds=3) == (1, 1)
+    assert stored_rows() == 20
+
+def test_shutdown_does_not_wait_for_a_dead_loader(folder, monkeypatch):
+    def dying_load_file(*args):
+        time.sleep(1)
+        os._exit(3)
+    monkeypatch.setattr(watch, 'load_file', dying_load_file)
+    (folder / 'bad.csv').write_text(CSV, encoding='utf-8')
+    started = time.time()
+    assert run_watch(folder, run_seconds=0.5) == (0, 1)
+    assert time.time() - started < 5
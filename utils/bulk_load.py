@@ -0,0 +1,110 @@
+import csv
+import sys
+import time
+from utils.metrics import timer, timed
+
+BATCH_SIZE = 50000  # Rows per executemany/commit in the native loader
+# PRAGMAs applied to the connection for the duration of an ingest
+INGEST_PRAGMAS = {
+    'synchronous': 'OFF',
+    'journal_mode': 'WAL',
+    'cache_size': -262144,  # Negative means KiB, so 256 MiB of page cache
+    'temp_store': 'MEMORY',
+}
+
+csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+
+def apply_ingest_pragmas(conn, pragmas=None):
+    """Apply ingest-time PRAGMAs to an open connection."""
+    settings = dict(INGEST_PRAGMAS)
+    settings.update(pragmas or {})
+    for name, value in settings.items():
+        conn.execute(f"PRAGMA {name}={value}")
+
+def read_csv_header(text_file):
+    """Read the header record of an open CSV text stream, leaving the stream at the first data row."""
+    return next(csv.reader(text_file), None)
+
+def stream_csv_rows(text_file, header_width, column_count=None, on_skip=None):
+    """Yield the data rows of an open CSV text stream as tuples of exactly column_count values.
+
+    The header must already have been read (see read_csv_header). Rows with more fields
+    than the header are skipped (and passed to on_skip) and short rows are padded with
+    None, like pd.read_csv(on_bad_lines='skip').
+    """
+    column_count = header_width if column_count is None else column_count
+    padding = (None,) * column_count
+    for row in csv.reader(text_file):
+        if not row:
+            continue
+        if len(row) > header_width:
+            if on_skip is not None:
+                on_skip(row)
+            continue
+        values = [value if value != '' else None for value in row[:column_count]]
+        yield tuple(values) + padding[len(values):]
+
+def iter_batches(rows, batch_size=BATCH_SIZE):
+    """Group an iterable of rows into lists of at most batch_size rows."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def insert_query(table_name, column_names, constants=None):
+    """Build a prepared INSERT statement for the given columns.
+
+    constants ({column: integer}) sets more columns to the same value in every row,
+    written into the statement so rows need not carry it.
+    """
+    constants = constants or {}
+    quoted_columns = ", ".join(f'"{column}"' for column in list(column_names) + list(constants))
+    placeholders = ", ".join(["?" for _ in column_names] + [str(int(value)) for value in constants.values()])
+    return f"INSERT INTO {table_name} ({quoted_columns}) VALUES ({placeholders})"
+
+def load_rows(conn, table_name, column_names, rows, batch_size=BATCH_SIZE, on_batch=None, on_commit=None, source=None, prepare_batch=None, constants=None):
+    """Insert rows with executemany, committing once per batch.
+
+    prepare_batch(cursor, batch) returns what to insert for a batch: a subset (see
+    utils.dedup) or rows reshaped for the table. on_batch(cursor) is called after each
+    batch is inserted and before it is committed; on_commit(total_rows) is called after
+    each commit. Returns the number of rows read; total_rows counts read rows too,
+    whatever prepare_batch kept. constants are passed to insert_query.
+    Time spent producing rows, inserting, in on_batch and committing is recorded as the
+    parse, insert, index and commit stages of source (see utils.metrics).
+    """
+    query = insert_query(table_name, column_names, constants)
+    cursor = conn.cursor()
+    total_rows = 0
+    parse, insert, index, commit = (timer(stage, source) for stage in ('parse', 'insert', 'index', 'commit'))
+    for batch in timed(iter_batches(rows, batch_size), parse):
+        read_rows = len(batch)
+        if prepare_batch is not None:
+            batch = prepare_batch(cursor, batch)
+        with insert:
+            cursor.executemany(query, batch)
+        if on_batch is not None:
+            with index:
+                on_batch(cursor)
+        with commit:
+            conn.commit()
+        total_rows += read_rows
+        if on_commit is not None:
+            on_commit(total_rows)
+    parse.add(rows=total_rows)
+    insert.add(rows=total_rows)
+    for stage_timer in (parse, insert, index, commit):
+        if stage_timer is not index or on_batch is not None:
+            stage_timer.close()
+    return total_rows
+
+def report_throughput(loader, csv_file, row_count, started):
+    """Print rows/s for a finished file so loaders can be compared on the same input."""
+    elapsed = time.perf_counter() - started
+    rate = row_count / elapsed if elapsed > 0 else 0.0
+    print(f"[{loader}] {csv_file}: {row_count} rows in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+    return rate
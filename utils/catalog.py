@@ -0,0 +1,215 @@
+import hashlib
+import os
+import sqlite3
+import time
+
+CATALOG_DB = 'catalog.db'  # Ingest catalog shared by fts.py, migrate*.py, dump_csv.py and main.py
+FINGERPRINT_BYTES = 1024 * 1024  # Bytes hashed from the start and from the end of a file
+FILE_COLUMNS = "stage, path, target, size, mtime, fingerprint, status, rows_done, last_rowid, byte_offset, updated"
+
+def open_catalog(catalog_db=CATALOG_DB):
+    """Open (and create if needed) the catalog database."""
+    conn = sqlite3.connect(catalog_db, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # One entry per target, so loading a file into a second database does not find it done;
+    # '' is an entry without a known target (legacy logs), which counts for every target
+    files_table = """
+    CREATE TABLE IF NOT EXISTS files (
+        stage TEXT NOT NULL,
+        path TEXT NOT NULL,
+        target TEXT NOT NULL DEFAULT '',
+        size INTEGER,
+        mtime REAL,
+        fingerprint TEXT,
+        status TEXT NOT NULL,
+        rows_done INTEGER NOT NULL DEFAULT 0,
+        last_rowid INTEGER NOT NULL DEFAULT 0,
+        byte_offset INTEGER NOT NULL DEFAULT 0,
+        updated REAL,
+        PRIMARY KEY (stage, path, target)
+    );
+    """
+    keyed = [col[1] for col in conn.execute("PRAGMA table_info(files)") if col[5]]
+    if keyed and 'target' not in keyed:
+        # Catalogs written before entries were kept per target
+        with conn:
+            conn.execute("ALTER TABLE files RENAME TO files_untargeted")
+            conn.execute(files_table)
+            old_columns = FILE_COLUMNS.replace('target', "IFNULL(target, '')")
+            conn.execute(f"INSERT INTO files ({FILE_COLUMNS}) SELECT {old_columns} FROM files_untargeted")
+            conn.execute("DROP TABLE files_untargeted")
+    conn.execute(files_table)
+    # Encoding verdicts from utils.encoding, shared by every stage that reads a file
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS encodings (
+        path TEXT PRIMARY KEY,
+        size INTEGER,
+        mtime REAL,
+        encoding TEXT NOT NULL,
+        fallback TEXT,
+        fallback_bytes INTEGER NOT NULL DEFAULT 0,
+        replaced_bytes INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+    # Column mappings from utils.schema_cache, keyed by a fingerprint of the header and value shapes
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schemas (
+        kind TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        columns TEXT NOT NULL,
+        mapping TEXT NOT NULL,
+        hits INTEGER NOT NULL DEFAULT 0,
+        misses INTEGER NOT NULL DEFAULT 0,
+        created REAL,
+        used REAL,
+        PRIMARY KEY (kind, fingerprint)
+    );
+    """)
+    conn.commit()
+    return conn
+
+def catalog_path(path):
+    """Normalize a path so the same file always maps to the same catalog key."""
+    return os.path.normpath(path)
+
+def target_filter(target):
+    """SQL condition and parameters matching entries of a target, of any of a list of targets, or of any target (None).
+
+    Entries without a target ('') match every target.
+    """
+    if target is None:
+        return "", []
+    targets = [target] if isinstance(target, str) else list(target)
+    return f" AND target IN ('', {', '.join('?' for _ in targets)})", targets
+
+def file_fingerprint(path, size=None):
+    """Hash the file size plus its first and last FINGERPRINT_BYTES."""
+    size = os.path.getsize(path) if size is None else size
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_BYTES))
+        if size > FINGERPRINT_BYTES:
+            f.seek(max(FINGERPRINT_BYTES, size - FINGERPRINT_BYTES))
+            digest.update(f.read(FINGERPRINT_BYTES))
+    return digest.hexdigest()
+
+def get_entry(catalog, stage, path, target=None, status=None):
+    """Return the latest catalog entry for an unchanged file as a dict, or None.
+
+    target limits the entries to one target or a list of them (see target_filter),
+    status to entries in that status. A file counts as unchanged when its size and
+    mtime match; if only the mtime differs, the content fingerprint decides and the
+    stored mtime is refreshed.
+    """
+    key = catalog_path(path)
+    condition, params = target_filter(target)
+    if status is not None:
+        condition, params = condition + " AND status = ?", params + [status]
+    row = catalog.execute(f"""
+        SELECT target, size, mtime, fingerprint, status, rows_done, last_rowid, byte_offset FROM files
+        WHERE stage = ? AND path = ?{condition} ORDER BY updated DESC LIMIT 1
+    """, [stage, key] + params).fetchone()
+    if row is None or not os.path.exists(path):
+        return None
+    entry_target, size, mtime, fingerprint, status, rows_done, last_rowid, byte_offset = row
+    stat = os.stat(path)
+    if stat.st_size != size:
+        return None
+    if stat.st_mtime != mtime:
+        if fingerprint is None or file_fingerprint(path, stat.st_size) != fingerprint:
+            return None
+        catalog.execute("UPDATE files SET mtime = ? WHERE stage = ? AND path = ? AND target = ?",
+                        (stat.st_mtime, stage, key, entry_target))
+        catalog.commit()
+    return {'target': entry_target, 'status': status, 'rows_done': rows_done, 'last_rowid': last_rowid, 'byte_offset': byte_offset}
+
+def is_done(catalog, stage, path, target=None):
+    """Check if the given file has been fully processed by a stage (into target) and not changed since."""
+    return get_entry(catalog, stage, path, target, 'done') is not None
+
+def get_checkpoint(catalog, stage, path, target=None):
+    """Return the checkpoint of an interrupted, unchanged file, or None to start from the beginning."""
+    return get_entry(catalog, stage, path, target, 'in_progress')
+
+def start_file(catalog, stage, path, target=None, last_rowid=0):
+    """Record that a stage starts on a file, keeping its checkpoint if the file is unchanged.
+
+    last_rowid is the highest rowid in the target before the file is loaded, so rows
+    beyond it can be told apart if the run is interrupted before the first checkpoint.
+    Returns the checkpoint to resume from (None for a fresh start).
+    """
+    checkpoint = get_checkpoint(catalog, stage, path, target)
+    if checkpoint is not None:
+        return checkpoint
+    stat = os.stat(path)
+    catalog.execute("""
+        INSERT OR REPLACE INTO files (stage, path, target, size, mtime, fingerprint, status, last_rowid, updated)
+        VALUES (?, ?, ?, ?, ?, ?, 'in_progress', ?, ?)
+    """, (stage, catalog_path(path), target or '', stat.st_size, stat.st_mtime,
+          file_fingerprint(path, stat.st_size), last_rowid, time.time()))
+    catalog.commit()
+    return None
+
+def save_checkpoint(catalog, stage, path, rows_done=0, last_rowid=0, byte_offset=0, target=None):
+    """Store how far a stage has committed its work on a file (into target)."""
+    catalog.execute(
+        "UPDATE files SET rows_done = ?, last_rowid = ?, byte_offset = ?, updated = ? WHERE stage = ? AND path = ? AND target = ?",
+        (rows_done, last_rowid, byte_offset, time.time(), stage, catalog_path(path), target or ''))
+    catalog.commit()
+
+def mark_done(catalog, stage, path, target=None):
+    """Record that a stage has fully processed a file (into target), as the file is now.
+
+    The stored size, mtime and fingerprint are refreshed, so a stage that rewrites the
+    file itself (main.py renaming columns) does not find it changed on the next run.
+    """
+    key = catalog_path(path)
+    stat = os.stat(path)
+    fingerprint = file_fingerprint(path, stat.st_size)
+    updated = catalog.execute("""
+        UPDATE files SET status = 'done', size = ?, mtime = ?, fingerprint = ?, updated = ?
+        WHERE stage = ? AND path = ? AND target = ?
+    """, (stat.st_size, stat.st_mtime, fingerprint, time.time(), stage, key, target or '')).rowcount
+    if not updated:
+        catalog.execute("""
+            INSERT INTO files (stage, path, target, size, mtime, fingerprint, status, updated)
+            VALUES (?, ?, ?, ?, ?, ?, 'done', ?)
+        """, (stage, key, target or '', stat.st_size, stat.st_mtime, fingerprint, time.time()))
+    catalog.commit()
+
+def get_committed_rowid(catalog, target):
+    """Return the highest rowid of a target database recorded by any checkpoint (0 if none)."""
+    return catalog.execute(
+        "SELECT IFNULL(MAX(last_rowid), 0) FROM files WHERE target = ?", (target,)).fetchone()[0]
+
+def get_target(catalog, stage, path, targets=None):
+    """Return the target a stage last recorded for a file (one of targets if given), or None."""
+    condition, params = target_filter(targets)
+    row = catalog.execute(f"""
+        SELECT target FROM files WHERE stage = ? AND path = ? AND target != ''{condition} ORDER BY updated DESC LIMIT 1
+    """, [stage, catalog_path(path)] + params).fetchone()
+    return row[0] if row else None
+
+def get_in_progress(catalog, stage, target=None):
+    """Return the paths a stage started (into target) but did not finish."""
+    condition, params = target_filter(target)
+    return [row[0] for row in catalog.execute(
+        f"SELECT DISTINCT path FROM files WHERE stage = ? AND status = 'in_progress'{condition}", [stage] + params)]
+
+def import_text_log(catalog, stage, log_path):
+    """Import a legacy one-path-per-line log (migrated_files.txt etc.) as finished files."""
+    if not os.path.exists(log_path):
+        return 0
+    imported = 0
+    with open(log_path, 'r', encoding='utf-8') as log_file:
+        for line in log_file:
+            path = line.strip()
+            if not path or not os.path.exists(path):
+                continue
+            # Any entry of the file, whatever its target, supersedes the legacy log
+            exists = catalog.execute("SELECT 1 FROM files WHERE stage = ? AND path = ?",
+                                     (stage, catalog_path(path))).fetchone()
+            if exists is None:
+                mark_done(catalog, stage, path)
+                imported += 1
+    return imported
@@ -0,0 +1,106 @@
+import random
+import re
+from collections import Counter
+import pandas as pd
+
+SAMPLE_SIZE = 1000  # Rows sampled per table
+STRATA = 10  # Rowid ranges the sample is spread across
+MIN_CONFIDENCE = 0.5  # Share of non-empty values that must match a type
+COLUMN_TYPES = ('email', 'full_name', 'phone_number')
+
+# Regex patterns for different types
+name_pattern = re.compile(r'\b[AА][а-яА-ЯёЁ]+ [AА][а-яА-ЯёЁ]+\b')  # Basic name pattern
+email_pattern = re.compile(r'([A-Za-z0-9]+[.-_])*[A-Za-z0-9]+@[A-Za-z0-9-]+(\.[A-Z|a-z]{2,})+')  # Simple email regex
+phone_pattern = re.compile(r'\+?\d{1,3}[\s\-]?\(?\d{1,5}\)?[\s\-]?\d{1,4}[\s\-]?\d{1,4}[\s\-]?\d{1,4}')
+# One anchored pattern for the text types; email is tried before name as in the old per-value checks
+combined_pattern = re.compile(rf'(?P<email>{email_pattern.pattern})|(?P<full_name>{name_pattern.pattern})')
+
+non_digits = re.compile(r'\D')
+punctuation = re.compile(r'[^a-zA-Zа-яА-Я0-9\s]')
+
+def is_phone(value):
+    """The classifier's phone rule: a phone_pattern match, and 11 characters starting with 7 or 8
+    once punctuation is dropped.
+
+    Letters and spaces count towards the 11, so 'tel 8 (900) 123-45-67' or '+7 900 123 45 67'
+    are not phones here even though normalize_phone finds one in them.
+    """
+    value = str(value)
+    if phone_pattern.search(value) is None:
+        return False
+    stripped = punctuation.sub('', value)
+    return len(stripped) == 11 and stripped[0] in '78'
+
+def normalize_phone(value):
+    """RU phone normalization: keep digits, accept 11 digits starting with 7 or 8.
+
+    Returns the canonical '7XXXXXXXXXX' string, or None when the value is not a phone.
+    This is for lookups and is looser than is_phone, which decides column types.
+    """
+    digits = non_digits.sub('', str(value))
+    if len(digits) == 11 and digits[0] in '78':
+        return '7' + digits[1:]
+    return None
+
+def sample_table(conn, table_name, columns, sample_size=SAMPLE_SIZE, strata=STRATA, seed=None, key='rowid'):
+    """Take a stratified random sample of a table in one query.
+
+    The rowid span is split into `strata` ranges and a run of rows is read from a
+    random start inside each, so the sample is not just the first rows on disk.
+    Views have no rowid; pass the integer key column they expose as key.
+    """
+    min_rowid, max_rowid = conn.execute(f"SELECT MIN({key}), MAX({key}) FROM {table_name}").fetchone()
+    quoted_columns = ", ".join(f'"{column}"' for column in columns)
+    if min_rowid is None:
+        return pd.DataFrame(columns=columns)
+    rng = random.Random(seed)
+    per_stratum = max(1, sample_size // strata)
+    step = (max_rowid - min_rowid + 1) / strata
+    selects, params = [], []
+    for i in range(strata):
+        first = min_rowid + int(i * step)
+        last = min_rowid + int((i + 1) * step) - 1
+        if last < first:
+            continue
+        start = rng.randint(first, max(first, last - per_stratum + 1))
+        selects.append(f"SELECT * FROM (SELECT {quoted_columns} FROM {table_name} WHERE {key} BETWEEN ? AND ? LIMIT ?)")
+        params.extend([start, last, per_stratum])
+    rows = conn.execute(" UNION ALL ".join(selects), params).fetchall()
+    return pd.DataFrame.from_records(rows, columns=columns)
+
+def classify_frame(df, min_confidence=MIN_CONFIDENCE):
+    """Score every column of a DataFrame in one pass, with one combined regex per distinct value.
+
+    Returns {column: {'type': label or None, 'confidence': float, 'scores': {label: share}}},
+    where each share is the fraction of non-empty values in the column matching that type.
+    """
+    match = combined_pattern.match
+    counts = {column: dict.fromkeys(COLUMN_TYPES, 0) for column in df.columns}
+    totals = dict.fromkeys(df.columns, 0)
+    for column in df.columns:
+        column_counts = counts[column]
+        # Leak columns repeat values a lot, so each distinct value is classified once
+        values = Counter(str(value) for value in df[column].tolist() if value is not None and value == value)
+        for value, count in values.items():
+            if not value.strip():
+                continue
+            totals[column] += count
+            found = match(value)
+            if found is not None:
+                column_counts[found.lastgroup] += count
+            elif is_phone(value):
+                column_counts['phone_number'] += count
+
+    results = {}
+    for column in df.columns:
+        total = totals[column]
+        column_scores = {label: counts[column][label] / total if total else 0.0 for label in COLUMN_TYPES}
+        label = max(COLUMN_TYPES, key=column_scores.get)
+        confidence = column_scores[label]
+        results[column] = {'type': label if confidence >= min_confidence else None,
+                           'confidence': confidence, 'scores': column_scores}
+    return results
+
+def classify_table(conn, table_name, columns, sample_size=SAMPLE_SIZE, min_confidence=MIN_CONFIDENCE, key='rowid'):
+    """Sample a table once and classify all of its columns."""
+    return classify_frame(sample_table(conn, table_name, columns, sample_size, key=key), min_confidence)
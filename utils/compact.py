@@ -0,0 +1,53 @@
+import json
+import sqlite3
+from utils.sources import SOURCE_COLUMN, create_sources_tables
+
+PACKED_SUFFIX = '_packed'  # main_content -> main_content_packed, the table the rows are stored in
+STORAGE_LAYOUTS = ('padded', 'compact')
+
+def packed_table(table_name):
+    return table_name + PACKED_SUFFIX
+
+def create_compact_table(sqlite_db, table_name, column_count):
+    """Create the compact layout of a content table.
+
+    Rows live in {table}_packed as (id, source_id, data), data being a JSON array of
+    the row's fields with trailing empty fields dropped, so a 5-field row in a 23-column
+    database stores 5 values and no NULL slots. {table}_sources keeps the header of
+    every source file (see utils.sources). {table} itself is a view exposing the usual
+    id, col_1 ... col_N and source_id, so the FTS indexes (external content), search, lookups and exports read it unchanged.
+    """
+    conn = sqlite3.connect(sqlite_db)
+    cursor = conn.cursor()
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {packed_table(table_name)} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        source_id INTEGER NOT NULL,
+        data TEXT NOT NULL
+    );
+    """)
+    create_sources_tables(cursor, table_name)
+    columns_definition = ", ".join(f"json_extract(data, '$[{i}]') AS col_{i+1}" for i in range(column_count))
+    cursor.execute(f"CREATE VIEW IF NOT EXISTS {table_name} AS SELECT id, {columns_definition}, {SOURCE_COLUMN} FROM {packed_table(table_name)};")
+    conn.commit()
+    conn.close()
+
+def storage_table(cursor, table_name):
+    """Return the table rows of table_name are written to: its packed table in the compact layout."""
+    kind = cursor.execute("SELECT type FROM sqlite_master WHERE name = ?", (table_name,)).fetchone()
+    return packed_table(table_name) if kind and kind[0] == 'view' else table_name
+
+def is_compact(cursor, table_name):
+    return storage_table(cursor, table_name) != table_name
+
+def pack_row(values):
+    """JSON array of a row's values as text, with trailing empty values dropped."""
+    values = [None if value is None or value == '' else str(value) for value in values]
+    while values and values[-1] is None:
+        values.pop()
+    return json.dumps(values, ensure_ascii=False, separators=(',', ':'))
+
+def pack_rows(rows, source_id):
+    """Turn rows of values into (source_id, data) rows of the packed table."""
+    for row in rows:
+        yield source_id, pack_row(row)
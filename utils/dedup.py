@@ -0,0 +1,88 @@
+import hashlib
+import json
+import numpy as np
+from itertools import compress
+from utils.compact import storage_table
+from utils.sources import next_rowid
+from utils.tables import HASHES_SUFFIX, hashes_table
+
+def row_hashes(rows, fold_case=False):
+    """64-bit BLAKE2b hashes of normalized rows as an int64 array.
+
+    None and '' are the same and trailing empty fields are dropped, so a row hashes the
+    same whatever column count it was padded to. fold_case also lower-cases the row,
+    which about doubles the cost on Cyrillic text. Rows are tuples of str or None.
+    """
+    blake2b = hashlib.blake2b
+    keys = ['\x1f'.join([value or '' for value in row]).rstrip('\x1f') for row in rows]
+    if fold_case:
+        keys = [key.lower() for key in keys]
+    digests = [blake2b(key.encode(), digest_size=8).digest() for key in keys]
+    return np.frombuffer(b''.join(digests), dtype=np.int64)
+
+def discard_hashes_after(cursor, table_name, last_rowid):
+    """Forget the hashes of rows above last_rowid (rows discarded on resume)."""
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (hashes_table(table_name),)).fetchone()
+    if exists:
+        cursor.execute(f"DELETE FROM {hashes_table(table_name)} WHERE id > ?", (last_rowid,))
+
+def discard_hashes_of(cursor, table_name, rows, first_id, last_id):
+    """Forget the hashes of purged rows (tuples of stored values) taken between first_id and last_id.
+
+    Only hashes whose id lies in the range are dropped, so a row of another source
+    keeps protecting its duplicates. Rows are hashed both as loaded and case-folded,
+    as the load's fold_case is not recorded.
+    """
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (hashes_table(table_name),)).fetchone()
+    if not exists or not rows:
+        return
+    rows = [tuple(None if value is None else str(value) for value in row) for row in rows]
+    for fold_case in (False, True):
+        hashes = np.unique(row_hashes(rows, fold_case))
+        cursor.execute(f"""
+            DELETE FROM {hashes_table(table_name)}
+            WHERE hash IN (SELECT value FROM json_each(?)) AND id BETWEEN ? AND ?
+        """, (json.dumps(hashes.tolist()), first_id, last_id))
+
+class RowDedup:
+    """Drop rows already stored in a content table, or repeated earlier in the same load.
+
+    The hashes of stored rows are the INTEGER PRIMARY KEY of {table}_hashes, next to
+    the rows. Each batch's hashes are inserted with INSERT OR IGNORE ... RETURNING
+    before the batch itself, in the same transaction: the returned hashes are the new
+    rows, so the lookup and the insert are one b-tree probe and the set commits (or
+    rolls back) with the rows. Each hash carries the first id its batch can get, so the
+    hashes of rows above a checkpoint are exactly those with a higher id.
+
+    Use one instance per database for a whole load and call filter() (or keep_mask())
+    on each batch right before inserting it.
+    """
+    def __init__(self, cursor, table_name, fold_case=False):
+        self.table_name = table_name
+        self.hashes_table = hashes_table(table_name)
+        self.fold_case = fold_case
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {self.hashes_table} (hash INTEGER PRIMARY KEY, id INTEGER NOT NULL)")
+        cursor.connection.commit()
+        self.kept = self.dropped = 0  # Rows kept and dropped over the whole load
+
+    def keep_mask(self, cursor, rows):
+        """Boolean array of the rows to insert: first occurrences of hashes not stored yet."""
+        hashes = row_hashes(rows, self.fold_case)
+        unique, first = np.unique(hashes, return_index=True)
+        first_id = next_rowid(cursor, storage_table(cursor, self.table_name))
+        # Sorted keys keep the b-tree inserts local
+        new = [row[0] for row in cursor.execute(f"""
+            INSERT OR IGNORE INTO {self.hashes_table} (hash, id)
+            SELECT value, ? FROM json_each(?) RETURNING hash
+        """, (first_id, json.dumps(unique.tolist())))]
+        keep = np.zeros(len(hashes), dtype=bool)
+        keep[first[np.isin(unique, np.array(new, dtype=np.int64))]] = True
+        self.kept += len(new)
+        self.dropped += len(hashes) - len(new)
+        return keep
+
+    def filter(self, cursor, rows):
+        """Return the rows of a batch worth inserting."""
+        rows = list(rows)
+        keep = self.keep_mask(cursor, rows)
+        return rows if keep.all() else list(compress(rows, keep.tolist()))
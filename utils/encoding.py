@@ -0,0 +1,169 @@
+import codecs
+import io
+import os
+import threading
+import chardet
+from utils.formats import is_compressed, open_binary
+from utils.metrics import timer
+
+PROBE_WINDOWS = 8  # Byte windows probed, spread evenly from the start to the end of the file
+PROBE_WINDOW_SIZE = 64 * 1024
+FALLBACK_ENCODING = 'cp1251'  # Decodes the non-UTF-8 stretches of mixed Cyrillic files
+LEGACY_ENCODINGS = ('cp1251', 'koi8-r', 'cp866', 'mac-cyrillic', 'iso-8859-5')
+ERROR_HANDLER = 'ingest'  # The one codecs error handler of decode_stream; see handle_decode_error
+decoding = threading.local()  # .stats: DecodeStats of the stream this thread decodes right now
+
+class DecodeStats:
+    """Bytes a streaming decoder could not decode as the primary encoding."""
+    def __init__(self, fallback=None):
+        self.fallback = fallback  # Encoding of the undecodable byte runs, None to replace them
+        self.fallback_bytes = 0  # Decoded with the fallback encoding instead
+        self.replaced_bytes = 0  # Replaced with U+FFFD
+
+    def __repr__(self):
+        return f"DecodeStats(fallback_bytes={self.fallback_bytes}, replaced_bytes={self.replaced_bytes})"
+
+def read_windows(path, windows=PROBE_WINDOWS, window_size=PROBE_WINDOW_SIZE):
+    """Read up to `windows` byte windows spread across the file.
+
+    A compressed file cannot be seeked cheaply, so its probe is the start of the
+    decompressed stream, as many bytes as all windows together.
+    """
+    if is_compressed(path):
+        with open_binary(path) as f:
+            return [f.read(windows * window_size)]
+    size = os.path.getsize(path)
+    if size <= windows * window_size:
+        with open(path, 'rb') as f:
+            return [f.read()]
+    step = (size - window_size) / (windows - 1)
+    samples = []
+    with open(path, 'rb') as f:
+        for i in range(windows):
+            f.seek(int(i * step))
+            samples.append(f.read(window_size))
+    return samples
+
+def utf8_errors(window, first):
+    """Count bytes of a window that are not valid UTF-8, ignoring sequences cut at the window edges."""
+    if not first:
+        # Skip continuation bytes of a character that started before the window
+        start = 0
+        while start < min(3, len(window)) and 0x80 <= window[start] <= 0xBF:
+            start += 1
+        window = window[start:]
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    text = decoder.decode(window, final=False)
+    return text.count('\ufffd')
+
+def detect_encoding(path):
+    """Probe several windows of a file and return its encoding verdict.
+
+    Returns {'encoding', 'fallback'}: files whose windows are all valid UTF-8 are
+    'utf-8' (or 'utf-8-sig' with a BOM); mostly-UTF-8 files with some bad windows
+    get FALLBACK_ENCODING for the bad stretches; anything else gets the legacy
+    encoding chardet picks from the combined windows.
+    """
+    windows = read_windows(path)
+    utf8 = 'utf-8-sig' if windows[0].startswith(codecs.BOM_UTF8) else 'utf-8'
+    bad_windows = sum(1 for i, window in enumerate(windows) if utf8_errors(window, i == 0))
+    if bad_windows == 0:
+        return {'encoding': utf8, 'fallback': None}
+    if bad_windows < len(windows) or utf8 == 'utf-8-sig':
+        return {'encoding': utf8, 'fallback': FALLBACK_ENCODING}
+    guess = chardet.detect(b''.join(windows))['encoding']
+    guess = codecs.lookup(guess).name if guess else FALLBACK_ENCODING
+    if guess not in LEGACY_ENCODINGS and not guess.startswith(('cp', 'iso8859', 'windows')):
+        guess = FALLBACK_ENCODING
+    return {'encoding': guess, 'fallback': None}
+
+def get_encoding(path, catalog=None):
+    """Return the encoding verdict for a file, cached in the catalog while the file is unchanged."""
+    stat = os.stat(path)
+    if catalog is not None:
+        row = catalog.execute("SELECT size, mtime, encoding, fallback FROM encodings WHERE path = ?",
+                              (os.path.normpath(path),)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime:
+            return {'encoding': row[2], 'fallback': row[3]}
+    detect = timer('encoding', path)
+    with detect:
+        verdict = detect_encoding(path)
+    detect.add(bytes=min(stat.st_size, PROBE_WINDOWS * PROBE_WINDOW_SIZE))
+    detect.close()
+    if catalog is None:
+        return verdict
+    catalog.execute("""
+        INSERT OR REPLACE INTO encodings (path, size, mtime, encoding, fallback)
+        VALUES (?, ?, ?, ?, ?)
+    """, (os.path.normpath(path), stat.st_size, stat.st_mtime, verdict['encoding'], verdict['fallback']))
+    catalog.commit()
+    return verdict
+
+def record_decode_stats(catalog, path, stats):
+    """Store and print how many bytes of a file could not be decoded with its encoding."""
+    if stats.fallback_bytes or stats.replaced_bytes:
+        print(f"{path}: {stats.fallback_bytes} bytes decoded with fallback, {stats.replaced_bytes} bytes replaced.")
+    if catalog is not None:
+        catalog.execute("UPDATE encodings SET fallback_bytes = ?, replaced_bytes = ? WHERE path = ?",
+                        (stats.fallback_bytes, stats.replaced_bytes, os.path.normpath(path)))
+        catalog.commit()
+
+def open_text(path, verdict):
+    """Open a file as one streaming text decoder for its encoding verdict.
+
+    Compressed CSV files (.csv.gz, .csv.lz4, .csv.zst) are decompressed on the fly.
+    Returns (text_file, stats); see decode_stream.
+    """
+    return decode_stream(open_binary(path), verdict)
+
+def handle_decode_error(error):
+    """Decode an undecodable byte run with the current stream's fallback (or U+FFFD) and count it there."""
+    stats = decoding.stats
+    bad = error.object[error.start:error.end]
+    if stats.fallback:
+        stats.fallback_bytes += len(bad)
+        return bad.decode(stats.fallback, errors='replace'), error.end
+    stats.replaced_bytes += len(bad)
+    return '\ufffd', error.end
+
+# Registered once: codecs keeps every handler for good, so one per stream would grow without bound
+codecs.register_error(ERROR_HANDLER, handle_decode_error)
+
+class DecodeSource(io.BufferedIOBase):
+    """Binary stream under a text decoder that makes its DecodeStats current whenever the decoder reads.
+
+    TextIOWrapper decodes each chunk right after reading it, in the same thread, so the
+    error handler always finds the stats of the stream whose bytes it is handed.
+    """
+    def __init__(self, binary_file, stats):
+        self.binary_file = binary_file
+        self.stats = stats
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        decoding.stats = self.stats
+        return self.binary_file.read(size)
+
+    def read1(self, size=-1):
+        decoding.stats = self.stats
+        read1 = getattr(self.binary_file, 'read1', self.binary_file.read)
+        return read1(size)
+
+    def close(self):
+        if not self.closed:
+            self.binary_file.close()
+        super().close()
+
+def decode_stream(binary_file, verdict):
+    """Wrap a binary stream in a text decoder for an encoding verdict.
+
+    Undecodable bytes are decoded with the verdict's fallback encoding when there is
+    one and replaced with U+FFFD otherwise; either way they are counted in the
+    returned DecodeStats. Returns (text_file, stats).
+    """
+    stats = DecodeStats(verdict.get('fallback'))
+    text_file = io.TextIOWrapper(DecodeSource(binary_file, stats), encoding=verdict['encoding'],
+                                 errors=ERROR_HANDLER, newline='')
+    return text_file, stats
@@ -0,0 +1,158 @@
+import gzip
+import importlib
+import io
+import os
+
+# Export formats and the file suffix of each; every one of them can be loaded by fts.py
+EXPORT_FORMATS = {'csv': '.csv', 'csv.gz': '.csv.gz', 'csv.lz4': '.csv.lz4', 'csv.zst': '.csv.zst', 'parquet': '.parquet'}
+OPTIONAL_MODULES = {'csv.lz4': 'lz4.frame', 'csv.zst': 'zstandard', 'parquet': 'pyarrow.parquet'}  # Not in the standard library
+PIP_NAMES = {'lz4.frame': 'lz4', 'zstandard': 'zstandard', 'pyarrow.parquet': 'pyarrow'}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+PARQUET_ROW_GROUP_ROWS = 100000  # Rows per Parquet row group, the unit a reader decodes at once
+PARQUET_BATCH_ROWS = 5000  # Rows per record batch read back from a Parquet file
+
+def format_of(path):
+    """Return the export format of a file from its suffix, or None for other files."""
+    for export_format, suffix in EXPORT_FORMATS.items():
+        if path.endswith(suffix):
+            return export_format
+    return None
+
+def is_loadable(path):
+    return format_of(path) is not None
+
+def is_parquet(path):
+    return format_of(path) == 'parquet'
+
+def is_compressed(path):
+    return format_of(path) in ('csv.gz', 'csv.lz4', 'csv.zst')
+
+def export_path(path, export_format):
+    """Swap a .csv file name for the suffix of export_format."""
+    return os.path.splitext(path)[0] + EXPORT_FORMATS[export_format]
+
+def require_module(export_format):
+    """Import the optional module a format needs, with a hint when it is not installed."""
+    name = OPTIONAL_MODULES.get(export_format)
+    if name is None:
+        return None
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        raise ImportError(f"The {export_format} format needs the {PIP_NAMES[name]} module (pip install {PIP_NAMES[name]}).")
+
+def import_arrow():
+    """Return (pyarrow, pyarrow.parquet), the optional Parquet modules."""
+    pq = require_module('parquet')
+    return importlib.import_module('pyarrow'), pq
+
+def compress_chunk(data, export_format):
+    """Compress one encoded CSV chunk as a self-contained gzip member, lz4 frame or zstd frame.
+
+    Concatenated members (or frames) decompress as one stream, so chunks compressed in
+    parallel workers are simply appended in order and a file can be cut back to the
+    end of any chunk, which is what a resumed export does.
+    """
+    if export_format == 'csv.gz':
+        return gzip.compress(data, GZIP_LEVEL)
+    if export_format == 'csv.lz4':
+        return require_module(export_format).compress(data)
+    if export_format == 'csv.zst':
+        return require_module(export_format).ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return data
+
+def open_binary(path):
+    """Open a file for reading, decompressing .csv.gz, .csv.lz4 and .csv.zst on the fly."""
+    export_format = format_of(path)
+    if export_format == 'csv.gz':
+        return gzip.open(path, 'rb')
+    if export_format == 'csv.lz4':
+        return require_module(export_format).open(path, 'rb')
+    if export_format == 'csv.zst':
+        reader = require_module(export_format).ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True, closefd=True)
+        return io.BufferedReader(reader)
+    return open(path, 'rb')
+
+def encode_arrow_chunk(rows, column_names):
+    """Serialize rows as an Arrow IPC stream of string columns (runs in the export workers).
+
+    Values become text like csv.writer writes them and NULL stays null, so a Parquet
+    export holds what the CSV export would.
+    """
+    pa, _ = import_arrow()
+    columns = list(zip(*rows)) if rows else [()] * len(column_names)
+    arrays = [pa.array([None if value is None else str(value) for value in column], pa.string()) for column in columns]
+    batch = pa.record_batch(arrays, names=list(column_names))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+class ParquetSink:
+    """Write Arrow IPC chunks (see encode_arrow_chunk) to a Parquet file in fixed-size row groups.
+
+    At most one row group is buffered, so memory stays bounded whatever the table size.
+    Parquet files cannot be appended to; an interrupted export is written again.
+    """
+    def __init__(self, path, column_names, row_group_rows=PARQUET_ROW_GROUP_ROWS):
+        self.pa, pq = import_arrow()
+        self.schema = self.pa.schema([(name, self.pa.string()) for name in column_names])
+        self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+        self.row_group_rows = row_group_rows
+        self.pending = []
+        self.pending_rows = 0
+
+    def write(self, data):
+        table = self.pa.ipc.open_stream(data).read_all().rename_columns(self.schema.names)
+        self.pending.append(table)
+        self.pending_rows += table.num_rows
+        while self.pending_rows >= self.row_group_rows:
+            buffered = self.pa.concat_tables(self.pending)
+            self.writer.write_table(buffered.slice(0, self.row_group_rows), row_group_size=self.row_group_rows)
+            rest = buffered.slice(self.row_group_rows)
+            self.pending, self.pending_rows = [rest], rest.num_rows
+
+    def close(self):
+        if self.pending_rows:
+            self.writer.write_table(self.pa.concat_tables(self.pending), row_group_size=self.row_group_rows)
+        self.pending, self.pending_rows = [], 0
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+def read_parquet_header(path):
+    """Column names of a Parquet file, read from its footer."""
+    return require_module('parquet').read_schema(path).names
+
+def iter_parquet_batches(path, batch_rows=PARQUET_BATCH_ROWS):
+    """Yield the record batches of a Parquet file, one row group slice at a time."""
+    parquet_file = require_module('parquet').ParquetFile(path)
+    try:
+        yield from parquet_file.iter_batches(batch_size=batch_rows)
+    finally:
+        parquet_file.close()
+
+def stream_parquet_rows(path, column_count=None):
+    """Yield the rows of a Parquet file as tuples of exactly column_count values, like stream_csv_rows."""
+    pa, _ = import_arrow()
+    compute = importlib.import_module('pyarrow.compute')
+    null = pa.scalar(None, pa.string())
+    for batch in iter_parquet_batches(path):
+        width = batch.num_columns if column_count is None else column_count
+        # Empty fields become None in Arrow, which is cheaper than testing every value in Python
+        columns = [compute.if_else(compute.equal(column, ''), null, column).to_pylist() for column in batch.columns[:width]]
+        columns += [[None] * batch.num_rows] * (width - len(columns))
+        yield from zip(*columns)
+
+def read_parquet_chunks(path, chunk_size=PARQUET_BATCH_ROWS):
+    """Yield a Parquet file as DataFrames of chunk_size rows, like pd.read_csv(chunksize=...)."""
+    for batch in iter_parquet_batches(path, chunk_size):
+        frame = batch.to_pandas()
+        # Empty fields are missing values, as read_csv reads them
+        yield frame.mask(frame == '')
@@ -0,0 +1,172 @@
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Settings travel in environment variables so worker processes (spawned or forked) inherit them
+METRICS_ENV = 'CSV_SQLITE_METRICS'  # JSON lines file the stage records are appended to
+PROFILE_ENV = 'CSV_SQLITE_PROFILE'  # Base name of the one input file to run under cProfile
+PROFILE_TOP = 25  # Functions printed from a profile
+metrics_path = os.environ.get(METRICS_ENV) or None
+profile_name = os.environ.get(PROFILE_ENV) or None
+write_lock = threading.Lock()
+
+def configure(path=None, profile=None):
+    """Enable stage records to path and cProfile for one file name.
+
+    A setting left None is taken from its environment variable (METRICS_ENV,
+    PROFILE_ENV), so a run can be measured without editing the script; '' disables it.
+    """
+    global metrics_path, profile_name
+    path = os.environ.get(METRICS_ENV) if path is None else path
+    profile = os.environ.get(PROFILE_ENV) if profile is None else profile
+    metrics_path, profile_name = path or None, profile or None
+    for name, value in ((METRICS_ENV, metrics_path), (PROFILE_ENV, profile_name)):
+        if value:
+            os.environ[name] = os.path.abspath(value) if name == METRICS_ENV else value
+        else:
+            os.environ.pop(name, None)
+
+def record(stage, source=None, seconds=0.0, rows=0, bytes=0, wait_seconds=0.0, **counts):
+    """Append one stage record as a JSON line."""
+    if metrics_path is None:
+        return
+    entry = {'time': time.time(), 'pid': os.getpid(), 'stage': stage, 'source': source,
+             'seconds': seconds, 'rows': rows, 'bytes': bytes, 'wait_seconds': wait_seconds}
+    entry.update(counts)
+    line = json.dumps(entry, ensure_ascii=False) + '\n'
+    with write_lock, open(metrics_path, 'a', encoding='utf-8') as metrics_file:
+        metrics_file.write(line)
+
+class Timer:
+    """Accumulates time, rows, bytes and wait time of one stage until closed.
+
+    Use it as a context manager around each piece of work (it can be entered many
+    times), wrap blocking calls in waiting(), and call close() to write the record.
+    """
+    def __init__(self, stage, source=None):
+        self.stage = stage
+        self.source = source
+        self.seconds = 0.0
+        self.wait_seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.counts = {}
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds += time.perf_counter() - self.started
+        return False
+
+    @contextmanager
+    def waiting(self):
+        """Time a block spent waiting on a lock or a queue."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.wait_seconds += time.perf_counter() - started
+
+    def add(self, rows=0, bytes=0, **counts):
+        self.rows += rows
+        self.bytes += bytes
+        for name, value in counts.items():
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def close(self):
+        record(self.stage, self.source, self.seconds, self.rows, self.bytes, self.wait_seconds, **self.counts)
+
+class NullTimer:
+    """Stand-in returned while metrics are disabled; every method does nothing."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def waiting(self):
+        return nullcontext()
+
+    def add(self, rows=0, bytes=0, **counts):
+        pass
+
+    def close(self):
+        pass
+
+NULL_TIMER = NullTimer()
+
+def timer(stage, source=None):
+    """Return a Timer for a stage, or the shared NULL_TIMER when metrics are disabled."""
+    return NULL_TIMER if metrics_path is None else Timer(stage, source)
+
+def timed(iterable, stage_timer):
+    """Iterate over iterable, adding the time spent producing each item to stage_timer."""
+    if stage_timer is NULL_TIMER:
+        return iterable
+    return timed_items(iter(iterable), stage_timer)
+
+def timed_items(iterator, stage_timer):
+    done = object()
+    while True:
+        with stage_timer:
+            item = next(iterator, done)
+        if item is done:
+            return
+        yield item
+
+@contextmanager
+def profile(source):
+    """Run the block under cProfile when source is the file chosen with configure(profile=...).
+
+    The stats are saved next to the metrics file (or the working directory) as
+    <file name>.prof and the top functions are printed.
+    """
+    if profile_name is None or source is None or os.path.basename(source) != profile_name:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        out_dir = os.path.dirname(metrics_path) if metrics_path else '.'
+        stats_path = os.path.join(out_dir, os.path.basename(source) + '.prof')
+        profiler.dump_stats(stats_path)
+        print(f"Profile of {source} saved to {stats_path}.")
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(PROFILE_TOP)
+
+def summarize(path=None):
+    """Total the records of a metrics file by stage: {stage: {calls, seconds, rows, bytes, wait_seconds}}."""
+    path = path or metrics_path
+    totals = {}
+    if not path or not os.path.exists(path):
+        return totals
+    with open(path, 'r', encoding='utf-8') as metrics_file:
+        for line in metrics_file:
+            entry = json.loads(line)
+            stage = totals.setdefault(entry['stage'], {'calls': 0, 'seconds': 0.0, 'rows': 0, 'bytes': 0, 'wait_seconds': 0.0})
+            stage['calls'] += 1
+            for name in ('seconds', 'rows', 'bytes', 'wait_seconds'):
+                stage[name] += entry.get(name) or 0
+    return totals
+
+def print_summary(path=None):
+    """Print the per-stage totals of a metrics file as a table."""
+    totals = summarize(path)
+    if not totals:
+        return
+    print(f"{'stage':<12} {'calls':>6} {'seconds':>9} {'rows':>12} {'rows/s':>10} {'MB':>9} {'MB/s':>7} {'wait s':>8}")
+    for stage, total in totals.items():
+        seconds = total['seconds']
+        rate = total['rows'] / seconds if seconds else 0.0
+        megabytes = total['bytes'] / 1024 / 1024
+        mb_rate = megabytes / seconds if seconds else 0.0
+        print(f"{stage:<12} {total['calls']:>6} {seconds:>9.2f} {total['rows']:>12} {rate:>10,.0f} "
+              f"{megabytes:>9.1f} {mb_rate:>7.1f} {total['wait_seconds']:>8.2f}")
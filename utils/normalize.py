@@ -0,0 +1,156 @@
+import sqlite3
+import time
+from utils.classify import classify_table, normalize_phone
+from utils.metrics import record
+from utils.sources import content_columns
+from utils.tables import NORMALIZED_TABLE, lookup_table, get_normalized_columns
+
+NORMALIZED_TYPES = {'phone_number': 'phone', 'email': 'email'}  # Detected type -> lookup kind
+NORMALIZE_BATCH_ROWS = 1000000  # Content rows normalized per INSERT ... SELECT
+
+def normalize_email(value):
+    """Lower-case, trimmed address, or None when the value is not an email."""
+    value = str(value).strip().lower()
+    return value if '@' in value else None
+
+def register_functions(conn):
+    """Make normalize_phone and normalize_email callable from SQL on a connection."""
+    conn.create_function('normalize_phone', 1, normalize_phone, deterministic=True)
+    conn.create_function('normalize_email', 1, normalize_email, deterministic=True)
+
+def normalized_select(table_name, kind, column):
+    """SELECT producing (value, id) pairs of a column's normalized values for a rowid range.
+
+    Phones go through utils.classify.normalize_phone ('7XXXXXXXXXX') and emails through
+    normalize_email, both called by SQLite inside the statement, so no rows travel
+    through Python and stored values match the lookups exactly (SQL lower() and trim()
+    would leave Cyrillic letters and tabs as they are).
+    """
+    if kind == 'phone':
+        return f"""
+            SELECT value, id FROM (
+                SELECT normalize_phone("{column}") AS value, id FROM {table_name}
+                WHERE id > ? AND id <= ? AND "{column}" IS NOT NULL
+            ) WHERE value IS NOT NULL
+        """
+    return f"""
+        SELECT value, id FROM (
+            SELECT normalize_email("{column}") AS value, id FROM {table_name}
+            WHERE id > ? AND id <= ? AND instr("{column}", '@') > 0
+        ) WHERE value IS NOT NULL
+    """
+
+def add_normalized_columns(cursor, table_name, columns):
+    """Register content columns ({column: kind}) and create their lookup tables.
+
+    A lookup table is a WITHOUT ROWID b-tree keyed (value, id): the index is the table,
+    so an exact lookup is one seek that never reads the content rows.
+    """
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {NORMALIZED_TABLE} (
+        table_name TEXT NOT NULL,
+        column_name TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        filled_rowid INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (table_name, column_name)
+    );
+    """)
+    for column, kind in columns.items():
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {lookup_table(table_name, kind)} (
+            value TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            PRIMARY KEY (value, id)
+        ) WITHOUT ROWID;
+        """)
+        cursor.execute(f"INSERT OR IGNORE INTO {NORMALIZED_TABLE} (table_name, column_name, kind) VALUES (?, ?, ?)",
+                       (table_name, column, kind))
+
+def fill_normalized_columns(cursor, table_name, batch_rows=NORMALIZE_BATCH_ROWS):
+    """Normalize content rows above each column's watermark in rowid-range batches. Returns rows added."""
+    register_functions(cursor.connection)
+    max_rowid = cursor.execute(f"SELECT IFNULL(MAX(id), 0) FROM {table_name}").fetchone()[0]
+    added = 0
+    for column, kind, filled_rowid in get_normalized_columns(cursor, table_name):
+        while filled_rowid < max_rowid:
+            upper_rowid = min(filled_rowid + batch_rows, max_rowid)
+            # Sorted inserts keep the (value, id) b-tree appends local
+            cursor.execute(f"""
+                INSERT OR IGNORE INTO {lookup_table(table_name, kind)} (value, id)
+                SELECT value, id FROM ({normalized_select(table_name, kind, column)}) ORDER BY value, id
+            """, (filled_rowid, upper_rowid))
+            added += cursor.rowcount
+            filled_rowid = upper_rowid
+        cursor.execute(f"UPDATE {NORMALIZED_TABLE} SET filled_rowid = ? WHERE table_name = ? AND column_name = ?",
+                       (filled_rowid, table_name, column))
+    return added
+
+def discard_normalized_after(cursor, table_name, last_rowid):
+    """Drop lookup entries of content rows above last_rowid (rows discarded on resume)."""
+    for column, kind, filled_rowid in get_normalized_columns(cursor, table_name):
+        if filled_rowid > last_rowid:
+            # The (value, id) key cannot seek by id, so this scans; it only runs after a crash
+            cursor.execute(f"DELETE FROM {lookup_table(table_name, kind)} WHERE id > ?", (last_rowid,))
+            cursor.execute(f"UPDATE {NORMALIZED_TABLE} SET filled_rowid = ? WHERE table_name = ? AND column_name = ?",
+                           (last_rowid, table_name, column))
+
+def discard_normalized_ids(cursor, table_name, id_table, first_id, last_id):
+    """Drop the lookup entries of purged content rows: the ids listed in id_table, all between first_id and last_id.
+
+    The rows' values are normalized again, so every entry is deleted by its (value, id) key.
+    """
+    register_functions(cursor.connection)
+    for column, kind, filled_rowid in get_normalized_columns(cursor, table_name):
+        upper_rowid = min(last_id, filled_rowid)
+        if upper_rowid < first_id:
+            continue
+        cursor.execute(f"""
+            DELETE FROM {lookup_table(table_name, kind)} WHERE (value, id) IN (
+                SELECT value, id FROM ({normalized_select(table_name, kind, column)}) WHERE id IN (SELECT id FROM {id_table})
+            )
+        """, (first_id - 1, upper_rowid))
+
+def select_normalized_columns(conn, table_name):
+    """Pick the content columns detected as phone or email: {column: kind}."""
+    results = classify_table(conn, table_name, content_columns(conn, table_name), key='id')
+    return {column: NORMALIZED_TYPES[result['type']] for column, result in results.items()
+            if result['type'] in NORMALIZED_TYPES}
+
+def build_normalized_columns(sqlite_db, table_name, columns='auto', batch_rows=NORMALIZE_BATCH_ROWS):
+    """Register phone/email columns (detected with columns='auto', or {column: kind}) and fill their lookup tables.
+
+    Columns already registered are kept; only rows above their watermark are normalized.
+    """
+    conn = sqlite3.connect(sqlite_db)
+    cursor = conn.cursor()
+    started = time.perf_counter()
+    if columns == 'auto':
+        columns = {} if get_normalized_columns(cursor, table_name) else select_normalized_columns(conn, table_name)
+        if columns:
+            print(f"Normalized lookup columns detected: {columns}")
+    if columns:
+        add_normalized_columns(cursor, table_name, columns)
+    added = fill_normalized_columns(cursor, table_name, batch_rows)
+    conn.commit()
+    conn.close()
+    elapsed = time.perf_counter() - started
+    record('normalize', f"{sqlite_db}:{table_name}", elapsed, rows=added)
+    if added:
+        print(f"Normalized {added} phone/email values in {elapsed:.2f}s.")
+    return added
+
+def lookup_rows(conn, table_name, phone=None, email=None, limit=100):
+    """Return content rows whose normalized phone or email equals the given value exactly."""
+    lookups = []
+    if phone is not None and normalize_phone(phone) is not None:
+        lookups.append(('phone', normalize_phone(phone)))
+    if email is not None and normalize_email(email) is not None:
+        lookups.append(('email', normalize_email(email)))
+    kinds = {kind for _, kind, _ in get_normalized_columns(conn.cursor(), table_name)}
+    selects = [f"SELECT id FROM {lookup_table(table_name, kind)} WHERE value = ?" for kind, _ in lookups if kind in kinds]
+    if not selects:
+        return []
+    params = [value for kind, value in lookups if kind in kinds]
+    return conn.execute(f"""
+        SELECT * FROM {table_name} WHERE id IN ({" UNION ".join(selects)}) ORDER BY id LIMIT ?
+    """, params + [limit]).fetchall()
@@ -0,0 +1,156 @@
+import csv
+import io
+import mmap
+import os
+from collections import deque
+from multiprocessing import Pool, cpu_count, current_process
+from utils.bulk_load import stream_csv_rows
+from utils.encoding import decode_stream
+
+RANGE_BYTES = 16 * 1024 * 1024  # Target size of one byte range; each range ends on the next record boundary
+IN_FLIGHT_PER_PROCESS = 2  # Parsed ranges waiting to be consumed, per worker process
+REPORTED_RANGES = 10  # Ranges listed with their skipped line counts; the rest are summed up
+SENTINEL = '\x1e'  # Record appended to a range to tell whether the range ends outside quotes
+
+def record_end(mm, offset, quoted=False):
+    """Return the offset just past the first line break at or after offset that ends a record.
+
+    quoted tells whether offset lies inside a quoted field. Quotes are counted, not
+    parsed: in RFC 4180 CSV a field's quotes come in pairs ("" inside a quoted field),
+    so a line break ends a record when an even number of quotes precedes it. A stray
+    quote in an unquoted field breaks the count; parse_range detects the ranges that
+    then end inside a quoted field, and they are parsed again joined to the next.
+    """
+    while True:
+        newline = mm.find(b'\n', offset)
+        if newline < 0:
+            return len(mm)
+        if mm[offset:newline].count(b'"') % 2:
+            quoted = not quoted
+        if not quoted:
+            return newline + 1
+        offset = newline + 1
+
+def split_byte_ranges(mm, start, range_bytes=RANGE_BYTES):
+    """Split mm[start:] into [(start, end), ...] of about range_bytes each, every range ending on a record boundary."""
+    ranges = []
+    while start < len(mm):
+        target = start + range_bytes
+        if target >= len(mm):
+            end = len(mm)
+        else:
+            # start is a record boundary, so the quotes between it and target give the state at target
+            end = record_end(mm, target, mm[start:target].count(b'"') % 2 == 1)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+def open_csv_ranges(path, verdict, range_bytes=RANGE_BYTES):
+    """Read the header of a CSV file and split the rest into byte ranges.
+
+    Returns (header, ranges): the header fields (None for an empty file) and
+    [(start, end), ...] byte offsets covering every data row exactly once.
+    """
+    if os.path.getsize(path) == 0:
+        return None, []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        header_end = record_end(mm, 0)
+        text_file, _ = decode_stream(io.BytesIO(mm[:header_end]), verdict)
+        header = next(csv.reader(text_file), None)
+        return header, split_byte_ranges(mm, header_end, range_bytes)
+
+def parse_range(args):
+    """Parse one byte range of a CSV file (runs in the worker processes).
+
+    Returns (range_index, rows, skipped, fallback_bytes, replaced_bytes, clean): the
+    range's rows as stream_csv_rows yields them, the bad lines it skipped, its decode
+    stats and whether it ends on a record boundary. Every range but the last gets a
+    SENTINEL record appended: it comes back as a row of its own only when the range
+    does not end inside a quoted field.
+    """
+    path, range_index, start, end, verdict, header_width, column_count = args
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        data = mm[start:end]
+        final = end >= len(mm)
+    if not final:
+        data += SENTINEL.encode('ascii') + b'\n'
+    text_file, stats = decode_stream(io.BytesIO(data), verdict)
+    skipped = []
+    rows = list(stream_csv_rows(text_file, header_width, column_count, on_skip=skipped.append))
+    clean = final or (bool(rows) and rows[-1][0] == SENTINEL and not any(rows[-1][1:]))
+    if not final and clean:
+        rows.pop()
+    return range_index, rows, len(skipped), stats.fallback_bytes, stats.replaced_bytes, clean
+
+def iter_parsed_ranges(path, verdict, ranges, header_width, column_count=None, processes=None):
+    """Parse byte ranges in a process pool and yield parse_range results in range order.
+
+    A range that does not end on a record boundary is parsed again in this process
+    together with the next one (and the next, until the join ends on one); the joined
+    result carries the first range's index. At most IN_FLIGHT_PER_PROCESS ranges per
+    process are parsed ahead of the consumer, so memory stays bounded whatever the file
+    size. With one process, or inside a daemonic process (a shard worker, which may
+    not start children), every range is parsed in this process: shipping rows back
+    from a worker costs about a third of parsing them.
+    """
+    tasks = [(path, range_index, start, end, verdict, header_width, column_count)
+             for range_index, (start, end) in enumerate(ranges)]
+    joined = None  # Task of the ranges to parse again as one, while they end inside quotes
+
+    def settle(result, task):
+        nonlocal joined
+        if joined is not None:
+            joined = joined[:3] + (task[3],) + joined[4:]
+            result = parse_range(joined)
+        if result[-1]:
+            joined = None
+            return result
+        joined = joined or task
+        return None
+
+    processes = processes or cpu_count()
+    if processes == 1 or current_process().daemon:
+        results = ((parse_range(task), task) for task in tasks)
+    else:
+        results = parse_in_pool(tasks, processes)
+    for result, task in results:
+        result = settle(result, task)
+        if result is not None:
+            yield result
+
+def parse_in_pool(tasks, processes):
+    """Yield (parse_range result, task) in task order, with a bounded number of tasks in flight."""
+    pending = deque()
+    with Pool(processes) as pool:
+        for task in tasks:
+            # Backpressure: hand back the oldest range before submitting more work
+            if len(pending) >= processes * IN_FLIGHT_PER_PROCESS:
+                task_done, result = pending.popleft()
+                yield result.get(), task_done
+            pending.append((task, pool.apply_async(parse_range, (task,))))
+        while pending:
+            task_done, result = pending.popleft()
+            yield result.get(), task_done
+
+def stream_csv_rows_parallel(path, verdict, ranges, header_width, column_count=None, processes=None, decode_stats=None):
+    """Yield the data rows of a CSV file in file order, like stream_csv_rows, parsing byte ranges in parallel.
+
+    ranges come from open_csv_ranges. Bad lines are skipped like
+    pd.read_csv(on_bad_lines='skip') and counted per range; ranges with skipped lines
+    are printed at the end (the first REPORTED_RANGES of them). Undecodable bytes are added to decode_stats.
+    """
+    skipped = {}
+    for range_index, rows, range_skipped, fallback_bytes, replaced_bytes, _ in iter_parsed_ranges(
+            path, verdict, ranges, header_width, column_count, processes):
+        if range_skipped:
+            skipped[range_index] = range_skipped
+        if decode_stats is not None:
+            decode_stats.fallback_bytes += fallback_bytes
+            decode_stats.replaced_bytes += replaced_bytes
+        yield from rows
+    total = sum(skipped.values())
+    if total > 0:
+        counts = ", ".join(f"range {range_index}: {count}" for range_index, count in sorted(skipped.items())[:REPORTED_RANGES])
+        if len(skipped) > REPORTED_RANGES:
+            counts += f", {len(skipped) - REPORTED_RANGES} more ranges"
+        print(f"{path}: skipped {total} bad lines in {len(skipped)} of {len(ranges)} ranges ({counts}).")
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import re
+import time
+from bisect import bisect_right
+
+SCHEMA_VERSION = 1  # Part of every fingerprint; bump it when a classifier changes so cached mappings are re-derived
+LENGTH_BUCKETS = (1, 4, 8, 16, 32, 64)  # Value length histogram edges; empty values are the first bucket
+SHAPE_STEP = 0.25  # Histogram shares are rounded to this, so samples of one layout agree
+CHAR_CLASSES = (
+    re.compile(r'\d'),
+    re.compile(r'[A-Za-z]'),
+    re.compile(r'[а-яА-ЯёЁ]'),
+    re.compile(r'\s'),
+    re.compile(r'[@.]'),
+)  # Digits, Latin, Cyrillic, whitespace, email punctuation; everything else is counted as other
+
+def rounded_share(count, total):
+    return round(count / total / SHAPE_STEP) * SHAPE_STEP if total else 0.0
+
+def column_shape(values):
+    """Length and character-class histograms of a column's values, as rounded shares."""
+    texts = ['' if value is None or value != value else str(value).strip() for value in values]
+    lengths = [0] * (len(LENGTH_BUCKETS) + 1)
+    for text in texts:
+        lengths[bisect_right(LENGTH_BUCKETS, len(text))] += 1
+    joined = ''.join(texts)
+    classes = [len(pattern.findall(joined)) for pattern in CHAR_CLASSES]
+    classes.append(len(joined) - sum(classes))
+    return ([rounded_share(count, len(texts)) for count in lengths],
+            [rounded_share(count, len(joined)) for count in classes])
+
+def schema_fingerprint(df, key_columns=()):
+    """Hash the header of a sample DataFrame together with the value shape of each column.
+
+    Files of one family (same header, same kinds of values) share a fingerprint even
+    though their rows differ; a header reused for different data does not. Key columns
+    (rowids) are hashed by name only, since their values just grow with the table.
+    """
+    digest = hashlib.blake2b(str(SCHEMA_VERSION).encode(), digest_size=16)
+    for column in df.columns:
+        shape = None if column in key_columns else column_shape(df[column].tolist())
+        digest.update(json.dumps([str(column), shape]).encode())
+    return digest.hexdigest()
+
+def get_mapping(catalog, kind, fingerprint):
+    """Return the column mapping cached for a fingerprint, counting the hit, or None."""
+    row = catalog.execute("SELECT mapping FROM schemas WHERE kind = ? AND fingerprint = ?", (kind, fingerprint)).fetchone()
+    if row is None:
+        return None
+    catalog.execute("UPDATE schemas SET hits = hits + 1, used = ? WHERE kind = ? AND fingerprint = ?",
+                    (time.time(), kind, fingerprint))
+    catalog.commit()
+    return json.loads(row[0])
+
+def save_mapping(catalog, kind, fingerprint, columns, mapping):
+    """Cache the column mapping classified for a fingerprint, counting the miss."""
+    catalog.execute("""
+        INSERT INTO schemas (kind, fingerprint, columns, mapping, misses, created, used)
+        VALUES (?, ?, ?, ?, 1, ?, ?)
+        ON CONFLICT (kind, fingerprint) DO UPDATE SET mapping = excluded.mapping, misses = misses + 1, used = excluded.used
+    """, (kind, fingerprint, json.dumps([str(column) for column in columns], ensure_ascii=False),
+          json.dumps(mapping, ensure_ascii=False), time.time(), time.time()))
+    catalog.commit()
+
+def hit_counts(catalog, kind):
+    """Return (hits, misses) of a kind over all runs."""
+    return catalog.execute("SELECT IFNULL(SUM(hits), 0), IFNULL(SUM(misses), 0) FROM schemas WHERE kind = ?",
+                           (kind,)).fetchone()
+
+def print_hit_rate(catalog, kind, before=(0, 0)):
+    """Print the hits and misses of a kind since before, an earlier hit_counts() result."""
+    hits, misses = hit_counts(catalog, kind)
+    hits, misses = hits - before[0], misses - before[1]
+    if hits + misses:
+        print(f"Schema cache ({kind}): {hits} of {hits + misses} file(s) matched a known layout "
+              f"({hits / (hits + misses):.0%}); {misses} classified.")
+    return hits, misses
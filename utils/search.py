@@ -0,0 +1,243 @@
+import os
+import queue
+import sqlite3
+import threading
+from utils.normalize import lookup_rows
+from utils.sources import SOURCE_COLUMN
+from collections import OrderedDict
+from contextlib import contextmanager
+
+POOL_SIZE = 4  # Read-only connections shared by concurrent callers
+MMAP_SIZE = 1024 * 1024 * 1024  # Bytes of the database file each connection maps instead of reading
+CACHE_SIZE = 1024  # Result pages kept in the LRU cache
+CACHED_STATEMENTS = 256  # Prepared statements kept per connection
+SNIPPET_TOKENS = 12  # Tokens around the match in snippet()
+TRIGRAM_SUFFIX = '_trigram'  # Same naming as fts.py: the substring index of {fts_table_name}
+SERVING_TABLE = 'serving_settings'  # Written by finalize.py into a copy finalized for read-only serving
+pools = {}
+pools_lock = threading.Lock()
+
+def is_substring_query(query):
+    """Queries of 3+ characters with a digit, '@', '.' or '-' (partial phones, email fragments) are substring searches."""
+    return len(query) >= 3 and (any(ch.isdigit() for ch in query) or any(ch in query for ch in '@.-'))
+
+def quote_phrase(query):
+    """Quote a query as one FTS5 phrase so the trigram index matches it as a literal substring."""
+    return '"' + query.replace('"', '""') + '"'
+
+def match_expression(query, prefix=False):
+    """FTS5 expression matching every whitespace-separated term of a user query, each as a quoted phrase.
+
+    Quoted, '-', '.', quotes and AND/OR/NOT/NEAR are plain text for the tokenizer:
+    'Санкт-Петербург' is the phrase санкт петербург, not a column filter. With prefix
+    the last word of each term also matches longer words ('Андр' -> Андрей). Returns
+    None for a query without terms.
+    """
+    terms = query.split()
+    return " ".join(quote_phrase(term) + (" *" if prefix else "") for term in terms) if terms else None
+
+def read_serving_settings(sqlite_db):
+    """Return the settings finalize.py recorded for serving a database ({} for other databases)."""
+    conn = sqlite3.connect(f"file:{sqlite_db}?mode=ro", uri=True)
+    try:
+        return dict(conn.execute(f"SELECT key, value FROM {SERVING_TABLE}").fetchall())
+    except sqlite3.OperationalError:
+        return {}
+    finally:
+        conn.close()
+
+def open_reader(sqlite_db, mmap_size=None):
+    """Open a read-only connection that can be handed between threads.
+
+    A database finalized for serving is opened immutable (no locking or change checks)
+    and, unless mmap_size is given, mapped with its recommended mmap_size; others get MMAP_SIZE.
+    """
+    settings = read_serving_settings(sqlite_db)
+    immutable = "&immutable=1" if settings.get('immutable') else ""
+    conn = sqlite3.connect(f"file:{sqlite_db}?mode=ro{immutable}", uri=True, check_same_thread=False,
+                           cached_statements=CACHED_STATEMENTS)
+    if mmap_size is None:
+        mmap_size = settings.get('mmap_size', MMAP_SIZE)
+    conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+    return conn
+
+class SearchPool:
+    """Ranked FTS5 search over a pool of read-only connections, with an LRU result cache.
+
+    Word searches are ordered by bm25, substring searches on the trigram index by rowid;
+    both are paged with keyset cursors: pass the cursor returned with one page to get the next. The cache is dropped whenever another connection
+    commits to the database (PRAGMA data_version), so pages never outlive an index change.
+    """
+    def __init__(self, sqlite_db, fts_table_name='main', table_name='main_content',
+                 size=POOL_SIZE, cache_size=CACHE_SIZE, mmap_size=None):
+        self.sqlite_db = sqlite_db
+        self.fts_table_name = fts_table_name
+        self.table_name = table_name
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.data_versions = {}
+        self.has_trigram = None
+        self.connections = queue.Queue()
+        for _ in range(size):
+            conn = open_reader(sqlite_db, mmap_size)
+            # data_version counts per connection, so each one is compared with its own value from here on
+            self.data_versions[id(conn)] = conn.execute("PRAGMA data_version").fetchone()[0]
+            self.connections.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection, blocking while all of them are in use."""
+        conn = self.connections.get()
+        try:
+            yield conn
+        finally:
+            self.connections.put(conn)
+
+    def check_version(self, conn):
+        """Drop cached results if the database changed since this connection last looked."""
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        with self.lock:
+            if self.data_versions[id(conn)] != data_version:
+                self.cache.clear()
+                self.has_trigram = None
+            self.data_versions[id(conn)] = data_version
+
+    def trigram_available(self, conn):
+        if self.has_trigram is None:
+            self.has_trigram = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?",
+                                            (self.fts_table_name + TRIGRAM_SUFFIX,)).fetchone() is not None
+        return self.has_trigram
+
+    def search(self, query, limit=50, cursor=None, substring=None, snippets=True, with_rank=False, raw=False, prefix=None,
+               source_ids=None):
+        """Return (rows, next_cursor) for one page of bm25-ranked matches.
+
+        Each row is the content row followed by a snippet of the best matching column
+        (omitted with snippets=False) and, with with_rank, the bm25 rank (None for
+        substring searches). next_cursor is None on the last page; pass it back with
+        the same arguments for the next one. Word searches match the query's terms as
+        plain text (see match_expression); raw=True passes the query through as an
+        FTS5 expression instead.
+
+        substring=None routes partial phones, email fragments and other input with a
+        digit, '@', '.' or '-' to the trigram index when it exists, and falls back to
+        the word index when that finds nothing. prefix=None retries a word search that
+        matches no whole word as a prefix search, so a partial name ('Андр') finds the
+        names it starts. source_ids limits matches to rows loaded from those sources
+        (see utils.sources).
+        """
+        source_ids = tuple(source_ids) if source_ids is not None else None
+        if not raw and not query.split():
+            return [], None
+        if substring is None:
+            # Later pages stay in the index of the first one: only substring pages have no rank
+            substring = cursor[0] is None if cursor is not None else not raw and is_substring_query(query)
+            if substring and cursor is None:
+                result = self.search_page(query, limit, cursor, True, False, snippets, with_rank, raw, source_ids)
+                if result[0]:
+                    return result
+                substring = False
+        if prefix is None:
+            prefix = False
+            if not substring and not raw:
+                # A word search that matches anything never needs the prefix form, on any page
+                result = self.search_page(query, limit, cursor, False, False, snippets, with_rank, raw, source_ids)
+                if result[0]:
+                    return result
+                prefix = True
+        return self.search_page(query, limit, cursor, substring, prefix, snippets, with_rank, raw, source_ids)
+
+    def search_page(self, query, limit, cursor, substring, prefix, snippets, with_rank, raw, source_ids=None):
+        """One page of search() in the index chosen by substring, with prefix matching as given."""
+        if source_ids is not None and not source_ids:
+            return [], None
+        key = (query, limit, cursor, substring, prefix, snippets, with_rank, raw, source_ids)
+        with self.connection() as conn:
+            self.check_version(conn)
+            with self.lock:
+                if key in self.cache:
+                    self.cache.move_to_end(key)
+                    return self.cache[key]
+            snippet = ""
+            if substring and self.trigram_available(conn):
+                # Substring hits have no useful relevance order, and bm25 would read the whole
+                # doclist of common trigrams; rowid order lets FTS5 stop after one page
+                index_name, match = self.fts_table_name + TRIGRAM_SUFFIX, quote_phrase(query)
+                rank, order = "NULL", "f.rowid"
+            else:
+                index_name, match = self.fts_table_name, query if raw else match_expression(query, prefix)
+                rank, order = "f.rank", "f.rank, f.rowid"
+            if snippets:
+                snippet = f", snippet({index_name}, -1, '[', ']', '...', {SNIPPET_TOKENS})"
+            # Keyset paging: later pages start after the cursor instead of re-reading skipped rows
+            after, params = "", [match]
+            if source_ids:
+                # One rowid lookup per match, so no index on source_id is needed
+                after = (f"AND (SELECT {SOURCE_COLUMN} FROM {self.table_name} WHERE id = f.rowid) "
+                         f"IN ({', '.join('?' for _ in source_ids)})")
+                params += list(source_ids)
+            if cursor is not None and order == "f.rowid":
+                after, params = after + " AND f.rowid > ?", params + [cursor[1]]
+            elif cursor is not None:
+                after += " AND (f.rank > ? OR (f.rank = ? AND f.rowid > ?))"
+                params += [cursor[0], cursor[0], cursor[1]]
+            if snippets:
+                rows = conn.execute(f"""
+                    SELECT c.*{snippet}, {rank}, f.rowid FROM {index_name} f JOIN {self.table_name} c ON c.id = f.rowid
+                    WHERE {index_name} MATCH ? {after}
+                    ORDER BY {order} LIMIT ?
+                """, params + [limit + 1]).fetchall()
+            else:
+                # Pick the page from the index alone, then read just those content rows;
+                # joining first reads (and in the compact layout unpacks) every match
+                rows = conn.execute(f"""
+                    SELECT c.*, f.rank, f.rowid FROM (
+                        SELECT {rank} AS rank, f.rowid AS rowid FROM {index_name} f
+                        WHERE {index_name} MATCH ? {after}
+                        ORDER BY {order} LIMIT ?
+                    ) f JOIN {self.table_name} c ON c.id = f.rowid
+                    ORDER BY {order}
+                """, params + [limit + 1]).fetchall()
+        next_cursor = rows[limit - 1][-2:] if len(rows) > limit else None
+        kept = -1 if with_rank else -2
+        result = ([row[:kept] for row in rows[:limit]], next_cursor)
+        with self.lock:
+            self.cache[key] = result
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return result
+
+    def lookup(self, phone=None, email=None, limit=100):
+        """Exact phone/email lookup through the normalized lookup tables (see utils.normalize)."""
+        with self.connection() as conn:
+            return lookup_rows(conn, self.table_name, phone, email, limit)
+
+    def close(self):
+        while not self.connections.empty():
+            self.connections.get().close()
+
+def file_identity(sqlite_db):
+    stat = os.stat(sqlite_db)
+    return stat.st_dev, stat.st_ino
+
+def get_search_pool(sqlite_db, fts_table_name='main', table_name='main_content'):
+    """Return the process-wide SearchPool for a database, creating it on first use.
+
+    A pool opened on a file that has since been replaced (another inode at the same
+    path) is closed and opened again.
+    """
+    key = (sqlite_db, fts_table_name, table_name)
+    identity = file_identity(sqlite_db)
+    with pools_lock:
+        if key in pools and pools[key][0] != identity:
+            pools.pop(key)[1].close()
+        if key not in pools:
+            pools[key] = (identity, SearchPool(sqlite_db, fts_table_name, table_name))
+        return pools[key][1]
+
+def close_search_pools(sqlite_db=None):
+    """Close the process-wide pools of a database (all of them with None), e.g. before replacing the file."""
+    with pools_lock:
+        for key in [key for key in pools if sqlite_db is None or key[0] == sqlite_db]:
+            pools.pop(key)[1].close()
@@ -0,0 +1,116 @@
+import glob
+import heapq
+import os
+import sqlite3
+from itertools import islice
+from multiprocessing.pool import ThreadPool
+from utils.catalog import catalog_path, get_target
+from utils.search import SearchPool
+from utils.sources import get_source_id
+
+SHARD_SOURCES_TABLE = 'shard_sources'  # Source files loaded into a shard, read by the query layer for pruning
+
+def shard_paths(sqlite_db, shards):
+    """Name the shard databases of sqlite_db: meta.db -> meta_00.db, meta_01.db, ..."""
+    base, ext = os.path.splitext(sqlite_db)
+    return [f"{base}_{i:02d}{ext}" for i in range(shards)]
+
+def find_shards(sqlite_db):
+    """Return the existing shard databases of sqlite_db in shard order."""
+    base, ext = os.path.splitext(sqlite_db)
+    return sorted(glob.glob(glob.escape(base) + "_[0-9][0-9]" + ext))
+
+def assign_shards(file_paths, shard_dbs, catalog, stage):
+    """Spread files over shards, balancing bytes; returns {shard_db: [file_path, ...]}.
+
+    A file a stage already started keeps its recorded shard so an interrupted load
+    resumes where its rows are. The rest go largest first to the shard with the
+    fewest bytes so far, counting what the shard database already holds.
+    """
+    assignments = {shard_db: [] for shard_db in shard_dbs}
+    load = {shard_db: os.path.getsize(shard_db) if os.path.exists(shard_db) else 0 for shard_db in shard_dbs}
+    unassigned = []
+    for file_path in file_paths:
+        target = get_target(catalog, stage, file_path, shard_dbs)
+        if target in assignments:
+            assignments[target].append(file_path)
+            load[target] += os.path.getsize(file_path)
+        else:
+            unassigned.append(file_path)
+    for file_path in sorted(unassigned, key=os.path.getsize, reverse=True):
+        shard_db = min(shard_dbs, key=load.get)
+        assignments[shard_db].append(file_path)
+        load[shard_db] += os.path.getsize(file_path)
+    return assignments
+
+def record_shard_sources(shard_db, file_paths):
+    """Remember which source files a shard holds."""
+    conn = sqlite3.connect(shard_db)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {SHARD_SOURCES_TABLE} (path TEXT PRIMARY KEY)")
+    conn.executemany(f"INSERT OR IGNORE INTO {SHARD_SOURCES_TABLE} (path) VALUES (?)",
+                     [(catalog_path(file_path),) for file_path in file_paths])
+    conn.commit()
+    conn.close()
+
+class ShardedSearch:
+    """Search every shard in parallel threads and merge the per-shard top-k by bm25.
+
+    bm25 statistics are per shard, so merged ranks are comparable as long as files are
+    spread evenly, which assign_shards does. Shards are pruned by their metadata: empty
+    shards are skipped, and with sources only shards holding one of those files are searched,
+    for rows of those files only.
+    """
+    def __init__(self, shard_dbs, fts_table_name='main', table_name='main_content', threads=None):
+        self.shard_dbs = list(shard_dbs)
+        self.pools = {shard_db: SearchPool(shard_db, fts_table_name, table_name) for shard_db in self.shard_dbs}
+        self.threads = ThreadPool(threads or len(self.shard_dbs))
+        self.info = {}
+        self.refresh()
+
+    def refresh(self):
+        """Reload the per-shard metadata (row estimate and source files)."""
+        for shard_db, pool in self.pools.items():
+            with pool.connection() as conn:
+                max_rowid = conn.execute(f"SELECT IFNULL(MAX(id), 0) FROM {pool.table_name}").fetchone()[0]
+                try:
+                    sources = {row[0] for row in conn.execute(f"SELECT path FROM {SHARD_SOURCES_TABLE}")}
+                except sqlite3.OperationalError:
+                    sources = set()
+            self.info[shard_db] = {'rows': max_rowid, 'sources': sources}
+
+    def select_shards(self, sources=None):
+        """Return the shards that can hold matches, given an optional set of source files."""
+        wanted = {catalog_path(source) for source in sources} if sources else None
+        return [shard_db for shard_db in self.shard_dbs
+                if self.info[shard_db]['rows'] and (wanted is None or wanted & self.info[shard_db]['sources'])]
+
+    def shard_source_ids(self, shard_db, sources):
+        """Return the source_ids a shard gave the given files (None when sources is empty: no filter)."""
+        if not sources:
+            return None
+        pool = self.pools[shard_db]
+        with pool.connection() as conn:
+            source_ids = [get_source_id(conn, pool.table_name, source) for source in sources]
+        return [source_id for source_id in source_ids if source_id is not None]
+
+    def search(self, query, limit=50, substring=None, sources=None, snippets=True):
+        """Return the best limit matches over all shards as (shard_db, row) pairs.
+
+        Rows are shaped as in SearchPool.search. Substring searches have no rank and
+        are filled from the shards in shard order. With sources (file paths) only rows
+        loaded from those files are returned.
+        """
+        shard_dbs = self.select_shards(sources)
+        source_ids = {shard_db: self.shard_source_ids(shard_db, sources) for shard_db in shard_dbs}
+        results = self.threads.map(
+            lambda shard_db: self.pools[shard_db].search(query, limit, substring=substring, snippets=snippets,
+                                                          with_rank=True, source_ids=source_ids[shard_db])[0],
+            shard_dbs)
+        tagged = [[(shard_db, row) for row in rows] for shard_db, rows in zip(shard_dbs, results)]
+        merged = heapq.merge(*tagged, key=lambda match: match[1][-1] or 0)
+        return [(shard_db, row[:-1]) for shard_db, row in islice(merged, limit)]
+
+    def close(self):
+        self.threads.close()
+        for pool in self.pools.values():
+            pool.close()
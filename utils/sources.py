@@ -0,0 +1,110 @@
+import json
+from utils.catalog import catalog_path
+
+SOURCES_SUFFIX = '_sources'  # main_content -> main_content_sources, the header of every source file
+RANGES_SUFFIX = '_source_ranges'  # main_content -> main_content_source_ranges, the rowid range of every load
+SOURCE_COLUMN = 'source_id'  # Column tagging every stored row with the source it was loaded from
+
+def sources_table(table_name):
+    return table_name + SOURCES_SUFFIX
+
+def ranges_table(table_name):
+    return table_name + RANGES_SUFFIX
+
+def create_sources_tables(cursor, table_name):
+    """Create the sources table of a content table and the rowid ranges of its loads.
+
+    A source's rows are appended in one go, so each load of a file covers one
+    contiguous rowid range; purging a source reads just its ranges.
+    """
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {sources_table(table_name)} (
+        source_id INTEGER PRIMARY KEY,
+        path TEXT NOT NULL UNIQUE,
+        columns TEXT NOT NULL
+    );
+    """)
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {ranges_table(table_name)} (
+        source_id INTEGER NOT NULL,
+        first_id INTEGER NOT NULL,
+        last_id INTEGER,
+        PRIMARY KEY (source_id, first_id)
+    ) WITHOUT ROWID;
+    """)
+
+def add_source_column(cursor, table_name):
+    """Add the source_id column to a content table created without it; older rows keep NULL."""
+    columns = [col[1] for col in cursor.execute(f"PRAGMA table_info({table_name})").fetchall()]
+    if SOURCE_COLUMN not in columns:
+        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {SOURCE_COLUMN} INTEGER")
+
+def content_columns(conn, table_name):
+    """Names of the data columns of a content table: everything but id and source_id."""
+    return [col[1] for col in conn.execute(f"PRAGMA table_info({table_name})").fetchall()
+            if col[1] not in ('id', SOURCE_COLUMN)]
+
+def next_rowid(cursor, table_name):
+    """Rowid the next row of an AUTOINCREMENT table gets, even after its last rows were deleted."""
+    return cursor.execute(f"""
+        SELECT MAX(IFNULL((SELECT seq FROM sqlite_sequence WHERE name = ?), 0), IFNULL((SELECT MAX(id) FROM {table_name}), 0)) + 1
+    """, (table_name,)).fetchone()[0]
+
+def register_source(cursor, table_name, path, header):
+    """Record a source file's header (a list of column names) and return its source_id.
+
+    A file loaded again keeps its source_id; its header is refreshed.
+    """
+    create_sources_tables(cursor, table_name)
+    cursor.execute(f"""
+        INSERT INTO {sources_table(table_name)} (path, columns) VALUES (?, ?)
+        ON CONFLICT (path) DO UPDATE SET columns = excluded.columns
+    """, (catalog_path(path), json.dumps(list(header), ensure_ascii=False)))
+    return cursor.execute(f"SELECT source_id FROM {sources_table(table_name)} WHERE path = ?",
+                          (catalog_path(path),)).fetchone()[0]
+
+def get_source_id(conn, table_name, path):
+    """Return the source_id of a file, or None if it was never loaded."""
+    try:
+        row = conn.execute(f"SELECT source_id FROM {sources_table(table_name)} WHERE path = ?",
+                           (catalog_path(path),)).fetchone()
+    except Exception:
+        return None
+    return row[0] if row else None
+
+def get_source_columns(conn, table_name, path):
+    """Map the logical columns of a source file to its header: {'col_1': 'email', ...}."""
+    row = conn.execute(f"SELECT columns FROM {sources_table(table_name)} WHERE path = ?", (catalog_path(path),)).fetchone()
+    if row is None:
+        return {}
+    return {f'col_{i+1}': name for i, name in enumerate(json.loads(row[0]))}
+
+def open_source_range(cursor, table_name, storage_name, source_id, resume=False):
+    """Start (or with resume, continue) the rowid range of a source's load.
+
+    A range left open by an earlier interrupted load is closed where the table ends
+    now, unless the load resumes it. Rows are told apart by source_id, so a closed
+    range that also spans other sources' rows is still purged exactly.
+    """
+    ranges = ranges_table(table_name)
+    first_id = next_rowid(cursor, storage_name)
+    open_range = cursor.execute(f"SELECT first_id FROM {ranges} WHERE source_id = ? AND last_id IS NULL",
+                                (source_id,)).fetchone()
+    if open_range is not None and resume:
+        return
+    if open_range is not None:
+        cursor.execute(f"UPDATE {ranges} SET last_id = ? WHERE source_id = ? AND first_id = ?",
+                       (first_id - 1, source_id, open_range[0]))
+    cursor.execute(f"INSERT OR REPLACE INTO {ranges} (source_id, first_id, last_id) VALUES (?, ?, NULL)", (source_id, first_id))
+
+def close_source_range(cursor, table_name, storage_name, source_id):
+    """End a source's open rowid range at the last row written; a load that wrote no rows leaves no range."""
+    ranges = ranges_table(table_name)
+    last_id = next_rowid(cursor, storage_name) - 1
+    cursor.execute(f"UPDATE {ranges} SET last_id = ? WHERE source_id = ? AND last_id IS NULL", (last_id, source_id))
+    cursor.execute(f"DELETE FROM {ranges} WHERE source_id = ? AND last_id < first_id", (source_id,))
+
+def get_source_ranges(conn, table_name, source_id):
+    """Return [(first_id, last_id), ...] of a source's loads; an open range ends at the table's end."""
+    return conn.execute(f"SELECT first_id, last_id FROM {ranges_table(table_name)} WHERE source_id = ? ORDER BY first_id",
+                        (source_id,)).fetchall()
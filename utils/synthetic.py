@@ -0,0 +1,81 @@
+import csv
+import random
+import sqlite3
+from utils.bulk_load import iter_batches, insert_query
+
+# Name parts start with a Cyrillic or Latin capital A so full names match utils.classify.name_pattern
+FIRST_NAMES = ('Александр', 'Алексей', 'Анатолий', 'Андрей', 'Антон', 'Аркадий', 'Артём',
+               'Анна', 'Алина', 'Алёна', 'Алла', 'Анастасия', 'Ангелина', 'Арина')
+LAST_NAMES = ('Абрамов', 'Агапов', 'Азаров', 'Аксёнов', 'Александров', 'Алексеев', 'Андреев',
+              'Анисимов', 'Антонов', 'Артемьев', 'Архипов', 'Афанасьев', 'Ахмедов', 'Аверина')
+LATIN_NAMES = ('John Smith', 'Maria Garcia', 'Ivan Petrov', 'Olga Smirnova', 'David Brown')
+EMAIL_DOMAINS = ('mail.ru', 'yandex.ru', 'gmail.com', 'bk.ru', 'inbox.ru', 'rambler.ru')
+CITIES = ('Москва', 'Санкт-Петербург', 'Новосибирск', 'Екатеринбург', 'Казань', 'Samara', 'Omsk')
+COLUMNS = ('email', 'phone', 'full_name', 'city', 'comment')
+LATIN_NAME_RATE = 0.1  # Share of full names in plain Latin, which name_pattern does not match
+RAGGED_RATE = 0.05  # Share of rows missing their trailing columns
+BAD_LINE_RATE = 0.001  # Share of lines with more fields than the header (skipped by the loaders)
+
+def full_name(rng):
+    if rng.random() < LATIN_NAME_RATE:
+        return rng.choice(LATIN_NAMES)
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    if rng.random() < 0.2:
+        # Latin 'A' homoglyph, common in scraped data
+        first = 'A' + first[1:]
+    return f"{first} {last}"
+
+def phone(rng):
+    """A RU mobile number in one of the formats seen in leaks."""
+    code, number = rng.randrange(900, 1000), rng.randrange(10 ** 7)
+    digits = f"{number:07d}"
+    style = rng.randrange(4)
+    if style == 0:
+        return f"+7 ({code}) {digits[:3]}-{digits[3:5]}-{digits[5:]}"
+    if style == 1:
+        return f"8{code}{digits}"
+    if style == 2:
+        return f"7{code}{digits}"
+    return f"+7-{code}-{digits[:3]}-{digits[3:5]}-{digits[5:]}"
+
+def email(rng, i):
+    return f"user{i}.{rng.randrange(10 ** 4)}@{rng.choice(EMAIL_DOMAINS)}"
+
+def generate_rows(row_count, seed=0, ragged_rate=RAGGED_RATE, bad_line_rate=BAD_LINE_RATE):
+    """Yield row_count deterministic leak-like rows for a seed.
+
+    Rows follow COLUMNS; ragged rows are cut short and bad lines carry extra fields.
+    """
+    rng = random.Random(seed)
+    for i in range(row_count):
+        row = [email(rng, i), phone(rng), full_name(rng), rng.choice(CITIES), f"запись {rng.randrange(10 ** 6)}"]
+        roll = rng.random()
+        if roll < bad_line_rate:
+            row += ['extra', 'fields']
+        elif roll < bad_line_rate + ragged_rate:
+            row = row[:rng.randrange(1, len(row))]
+        yield row
+
+def write_csv(path, row_count, seed=0, **rates):
+    """Write a synthetic CSV file with a COLUMNS header. Returns the number of lines written."""
+    with open(path, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(COLUMNS)
+        for batch in iter_batches(generate_rows(row_count, seed, **rates)):
+            writer.writerows(batch)
+    return row_count
+
+def write_sqlite(path, table_name, row_count, seed=0):
+    """Write a synthetic table with generic col_N columns, as the loaders create them."""
+    column_names = [f"col_{i + 1}" for i in range(len(COLUMNS))]
+    conn = sqlite3.connect(path)
+    conn.execute(f"""CREATE TABLE IF NOT EXISTS {table_name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, {", ".join(f"{column} TEXT" for column in column_names)})""")
+    rows = (tuple(row) + (None,) * (len(COLUMNS) - len(row))
+            for row in generate_rows(row_count, seed, bad_line_rate=0))
+    query = insert_query(table_name, column_names)
+    for batch in iter_batches(rows):
+        conn.executemany(query, batch)
+    conn.commit()
+    conn.close()
+    return row_count
@@ -0,0 +1,74 @@
+import re
+import sqlite3
+from utils.compact import PACKED_SUFFIX, is_compact
+from utils.sources import SOURCES_SUFFIX, RANGES_SUFFIX
+
+HASHES_SUFFIX = '_hashes'  # main_content -> main_content_hashes, the hashes of every stored row (utils.dedup)
+NORMALIZED_TABLE = 'normalized_columns'  # Which content columns feed which lookup table, and how far (utils.normalize)
+TABLE_SUFFIXES = (PACKED_SUFFIX, SOURCES_SUFFIX, RANGES_SUFFIX, HASHES_SUFFIX)  # Tables named after the content table
+
+def hashes_table(table_name):
+    return table_name + HASHES_SUFFIX
+
+def lookup_table(table_name, kind):
+    """Name of the lookup table of a kind: main_content -> main_content_phone."""
+    return f"{table_name}_{kind}"
+
+def get_normalized_columns(cursor, table_name):
+    """Return [(column, kind, filled_rowid), ...] registered for a content table."""
+    try:
+        return cursor.execute(f"SELECT column_name, kind, filled_rowid FROM {NORMALIZED_TABLE} WHERE table_name = ?",
+                              (table_name,)).fetchall()
+    except sqlite3.OperationalError:
+        return []
+
+def rename_content_table(sqlite_db, table_name, new_table_name):
+    """Rename a content table along with everything named after it or pointing at it.
+
+    ALTER TABLE renames a table and the views using it, but not the tables named after
+    it (packed rows, sources, row ranges, dedup hashes, phone/email lookups), the
+    normalized_columns registry, ANALYZE statistics or the content= option of FTS5
+    tables indexing it, which would then read a table that no longer exists. Those are
+    renamed here too; the FTS5 definitions are edited in the schema, which leaves the
+    indexes intact. In the compact layout the view is recreated under the new name.
+    """
+    conn = sqlite3.connect(sqlite_db)
+    cursor = conn.cursor()
+    compact = is_compact(cursor, table_name)
+    kinds = sorted({kind for _, kind, _ in get_normalized_columns(cursor, table_name)})
+    renames = [(table_name + suffix, new_table_name + suffix) for suffix in TABLE_SUFFIXES]
+    renames += [(lookup_table(table_name, kind), lookup_table(new_table_name, kind)) for kind in kinds]
+    if not compact:
+        renames.insert(0, (table_name, new_table_name))
+    tables = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    renames = [(old_name, new_name) for old_name, new_name in renames if old_name in tables]
+    for old_name, new_name in renames:
+        cursor.execute(f"ALTER TABLE {old_name} RENAME TO {new_name}")
+    if compact:
+        # Views cannot be renamed; the packed table in its SELECT was renamed above
+        view_sql = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'view' AND name = ?", (table_name,)).fetchone()[0]
+        cursor.execute(f"DROP VIEW {table_name}")
+        cursor.execute(re.sub(rf"^CREATE VIEW {table_name}\b", f"CREATE VIEW {new_table_name}", view_sql))
+    if kinds:
+        cursor.execute(f"UPDATE {NORMALIZED_TABLE} SET table_name = ? WHERE table_name = ?", (new_table_name, table_name))
+    if 'sqlite_stat1' in tables:
+        for old_name, new_name in renames:
+            cursor.execute("UPDATE sqlite_stat1 SET tbl = ? WHERE tbl = ?", (new_name, old_name))
+            # WITHOUT ROWID tables list their primary key under the table's own name
+            cursor.execute("UPDATE sqlite_stat1 SET idx = ? WHERE idx = ?", (new_name, old_name))
+            cursor.execute("UPDATE sqlite_stat1 SET idx = 'sqlite_autoindex_' || ? || substr(idx, ?) WHERE idx LIKE ? ESCAPE '\\'",
+                           (new_name, len('sqlite_autoindex_' + old_name) + 1,
+                            'sqlite\\_autoindex\\_' + old_name.replace('_', '\\_') + '\\_%'))
+    content_option = f"content='{table_name}'"
+    fts_tables = [row[0] for row in cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND sql LIKE 'CREATE VIRTUAL TABLE%' AND instr(sql, ?) > 0",
+        (content_option,))]
+    if fts_tables:
+        cursor.execute("PRAGMA writable_schema = ON")
+        cursor.executemany("UPDATE sqlite_master SET sql = replace(sql, ?, ?) WHERE type = 'table' AND name = ?",
+                           [(content_option, f"content='{new_table_name}'", name) for name in fts_tables])
+        cursor.execute("PRAGMA writable_schema = OFF")
+    conn.commit()
+    # The edited FTS5 definitions are read by the next connection
+    conn.close()
+    print(f"Renamed {table_name} to {new_table_name} ({len(renames)} table(s), {len(fts_tables)} FTS index(es)).")
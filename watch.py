@@ -0,0 +1,341 @@
+import json
+import os
+import signal
+import sqlite3
+import time
+from collections import deque
+from multiprocessing import Process, Queue, current_process
+from queue import Empty
+import fts
+from utils.catalog import open_catalog, import_text_log, is_done, get_checkpoint, get_in_progress, get_target, catalog_path
+from utils.dedup import RowDedup
+from utils.formats import is_loadable
+from utils.metrics import configure, record, print_summary
+from utils.search import TRIGRAM_SUFFIX
+from utils.shards import shard_paths, record_shard_sources
+from utils.sources import content_columns, get_source_id
+
+POLL_SECONDS = 2.0  # Interval between two scans of the input folder
+SETTLE_SECONDS = 5.0  # A file is ready once unmodified this long and its size did not change since the last scan
+PRIORITIES = ('smallest', 'oldest', 'newest', 'fifo')  # Order of the ready files; see JobQueue
+MAX_WAIT_SECONDS = 600.0  # Queued this long, a file goes before every file of a better priority
+LATENCY_WINDOW = 100  # Recently loaded files the status latencies are computed over
+
+class JobQueue:
+    """Files ready to load, handed out by priority.
+
+    'smallest' serves small files first (quick turnaround for most arrivals), 'oldest'
+    and 'newest' go by modification time, 'fifo' by when the file was noticed. Files an
+    earlier run left half-loaded always go first, since their uncheckpointed rows must
+    still be the newest in their table; files waiting over max_wait_seconds come next,
+    so a steady stream of small files cannot starve a large one. Queues stay short, so
+    each pop scans the list instead of keeping a heap that aging would invalidate.
+    """
+    def __init__(self, priority='smallest', max_wait_seconds=MAX_WAIT_SECONDS):
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {PRIORITIES}, not {priority!r}")
+        self.priority = priority
+        self.max_wait_seconds = max_wait_seconds
+        self.jobs = {}
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def push(self, job):
+        self.jobs[job['path']] = job
+
+    def key(self, job, now):
+        order = {'smallest': job['size'], 'oldest': job['mtime'], 'newest': -job['mtime'], 'fifo': job['noticed']}[self.priority]
+        return (not job['interrupted'], now - job['queued'] < self.max_wait_seconds, order, job['noticed'])
+
+    def pop(self, eligible=None):
+        """Remove and return the best job for which eligible(job) holds, or None."""
+        now = time.time()
+        jobs = [job for job in self.jobs.values() if eligible is None or eligible(job)]
+        if not jobs:
+            return None
+        return self.jobs.pop(min(jobs, key=lambda job: self.key(job, now))['path'])
+
+class FolderWatcher:
+    """Poll a folder and report the loadable files that are new or changed and have stopped growing.
+
+    A file is ready when its mtime is at least settle_seconds old and its size is the
+    same as at the previous scan, so files still being copied in are left alone.
+    Files the catalog has as loaded are skipped until they change; only stat() is called
+    on them after their first check.
+    """
+    def __init__(self, folder_path, catalog, targets, settle_seconds=SETTLE_SECONDS):
+        self.folder_path = folder_path
+        self.catalog = catalog
+        self.targets = targets  # Databases a file counts as loaded into
+        self.settle_seconds = settle_seconds
+        self.seen = {}  # path -> (size, mtime, noticed) of the last scan
+        self.settled = {}  # path -> (size, mtime) already queued, loaded or failed
+
+    def scan(self):
+        """Return [(path, size, mtime, noticed), ...] of the files that became ready since the last scan."""
+        now = time.time()
+        ready, current = [], {}
+        with os.scandir(self.folder_path) as entries:
+            for entry in entries:
+                if not entry.is_file() or not is_loadable(entry.name):
+                    continue
+                path = catalog_path(os.path.join(self.folder_path, entry.name))
+                stat = entry.stat()
+                size, mtime = stat.st_size, stat.st_mtime
+                previous = self.seen.get(path)
+                noticed = previous[2] if previous and previous[:2] == (size, mtime) else now
+                current[path] = (size, mtime, noticed)
+                if self.settled.get(path) == (size, mtime):
+                    continue
+                if previous is None or previous[0] != size or now - mtime < self.settle_seconds:
+                    continue
+                self.settled[path] = (size, mtime)
+                if not is_done(self.catalog, fts.CATALOG_STAGE, path, self.targets):
+                    ready.append((path, size, mtime, noticed))
+        self.seen = current
+        for path in list(self.settled):
+            if path not in current:
+                del self.settled[path]
+        return ready
+
+    def forget(self, path):
+        """Check a file again at the next scan (it changed while queued)."""
+        self.settled.pop(path, None)
+
+def load_file(file_path, sqlite_db, table_name, fts_table_name, loader, trigram_columns, normalized_columns, catalog, row_dedup=None):
+    """Load one file into sqlite_db (content tables created) and index it as it lands. Returns the rows read.
+
+    A file loaded before and changed since is replaced: its old rows are purged first
+    (fts.purge_source). A file an earlier run interrupted resumes from its checkpoint.
+    Indexes chosen by detected type ('auto') are built after the first file, and every
+    later file feeds them as it loads. A file with more columns than the table is
+    rejected with a ValueError before anything is loaded: the FTS table's columns are
+    fixed, so the extra columns could be neither stored nor searched.
+    """
+    conn = sqlite3.connect(sqlite_db)
+    column_count = len(content_columns(conn, table_name))
+    replaced = get_source_id(conn, table_name, file_path) is not None and get_checkpoint(catalog, fts.CATALOG_STAGE, file_path, sqlite_db) is None
+    conn.close()
+    file_columns = fts.get_column_count(file_path, catalog)
+    if file_columns > column_count:
+        raise ValueError(f"{file_path} has {file_columns} columns but {table_name} has {column_count}; "
+                         f"the file was not loaded. Load it into a database created with max_columns >= {file_columns}.")
+    if replaced:
+        print(f"[{current_process().name}] {file_path} changed; replacing its rows.")
+        fts.purge_source(file_path, sqlite_db, table_name, fts_table_name)
+    row_count = fts.migrate_csv_to_sqlite(file_path, sqlite_db, table_name, fts_table_name, column_count, loader=loader,
+                                          fts_mode='incremental', catalog=catalog, dedup=row_dedup)
+    if trigram_columns == 'auto':
+        conn = sqlite3.connect(sqlite_db)
+        exists = fts.get_fts_columns(conn.cursor(), fts_table_name + TRIGRAM_SUFFIX) is not None
+        conn.close()
+        if not exists:
+            fts.build_trigram_index(sqlite_db, fts_table_name, table_name, 'auto')
+    if normalized_columns == 'auto':
+        # Detects the columns once; later calls find nothing left to fill
+        fts.build_normalized_columns(sqlite_db, table_name, 'auto')
+    return row_count
+
+def load_worker(sqlite_db, sharded, job_queue, result_queue, table_name, fts_table_name, max_columns, loader, storage,
+                trigram_columns, normalized_columns, dedup):
+    """Loader process of one database: load the files it is given until a None sentinel arrives.
+
+    Signals are left to the main process, which lets the file in progress finish.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    catalog = open_catalog()
+    fts.create_content_tables(sqlite_db, table_name, fts_table_name, max_columns, storage, trigram_columns, normalized_columns)
+    row_dedup = None
+    if dedup:
+        conn = sqlite3.connect(sqlite_db)
+        row_dedup = RowDedup(conn.cursor(), table_name)
+        conn.close()
+    while True:
+        file_path = job_queue.get()
+        if file_path is None:
+            break
+        started = time.time()
+        try:
+            if sharded:
+                record_shard_sources(sqlite_db, [file_path])
+            row_count = load_file(file_path, sqlite_db, table_name, fts_table_name, loader, trigram_columns, normalized_columns,
+                                  catalog, row_dedup)
+            result_queue.put(('done', sqlite_db, file_path, row_count, started, time.time()))
+        except Exception as e:
+            print(f"[{current_process().name}] FAILED {file_path}: {e}")
+            result_queue.put(('failed', sqlite_db, file_path, str(e), started, time.time()))
+    catalog.close()
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else None
+
+def write_status(status_file, status):
+    """Replace the status file in one rename, so readers never see a partial write."""
+    temp_path = status_file + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(status, f, ensure_ascii=False, indent=1)
+    os.replace(temp_path, status_file)
+
+def watch_folder(folder_path, sqlite_db, table_name, fts_table_name, loader='native', storage='padded', trigram_columns=None,
+                 normalized_columns='auto', dedup=False, shards=1, max_columns=None, priority='smallest',
+                 poll_seconds=POLL_SECONDS, settle_seconds=SETTLE_SECONDS, max_wait_seconds=MAX_WAIT_SECONDS,
+                 status_file=None, run_seconds=None):
+    """Load new and changed files of a folder into sqlite_db as they arrive, until SIGINT or SIGTERM.
+
+    Ready files (see FolderWatcher) are queued by priority (see JobQueue) and loaded one
+    at a time per database, so each file is searchable as soon as it is in. With shards > 1
+    there is one loader process per shard database (meta_00.db, ... as fts.py names them);
+    a file that already went to a shard goes there again. On SIGINT or SIGTERM no more
+    files are started and the files in progress are finished before exiting.
+
+    Every loaded file is recorded as a 'watch' metrics record: seconds loading, wait_seconds
+    queued, and latency_seconds from the time the file was noticed to the time it was
+    searchable; the queue depth is recorded as 'watch_queue' whenever it changes. With
+    status_file, the same figures are written there as JSON after every scan. Files with
+    more columns than the table (max_columns, from the folder at start) fail (see load_file).
+    A loader process that dies fails the file it had and is started again.
+    run_seconds stops the service after that long (None runs until signalled).
+    """
+    catalog = open_catalog()
+    import_text_log(catalog, fts.CATALOG_STAGE, fts.MIGRATED_FILES_LOG)
+    if max_columns is None:
+        max_columns = fts.get_max_columns(folder_path, catalog)
+    shard_dbs = shard_paths(sqlite_db, shards) if shards > 1 else [sqlite_db]
+    interrupted = set(get_in_progress(catalog, fts.CATALOG_STAGE, shard_dbs))
+    watcher = FolderWatcher(folder_path, catalog, shard_dbs, settle_seconds)
+    jobs = JobQueue(priority, max_wait_seconds)
+    result_queue = Queue()
+    workers = {}
+    def start_worker(shard_db):
+        job_queue = Queue()
+        process = Process(target=load_worker, args=(shard_db, shards > 1, job_queue, result_queue, table_name, fts_table_name,
+                                                    max_columns, loader, storage, trigram_columns, normalized_columns, dedup))
+        process.start()
+        workers[shard_db] = {'process': process, 'jobs': job_queue, 'job': None}
+    for shard_db in shard_dbs:
+        start_worker(shard_db)
+
+    stopping = False
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    started = time.time()
+    latencies = deque(maxlen=LATENCY_WINDOW)
+    loaded = failed = 0
+    depth = None
+    print(f"Watching {folder_path} for files to load into {', '.join(shard_dbs)} (priority: {priority}).")
+
+    def finish(result):
+        nonlocal loaded, failed
+        kind, shard_db, file_path, detail, load_started, load_finished = result
+        job = workers[shard_db]['job']
+        workers[shard_db]['job'] = None
+        queue_wait = load_started - job['queued']
+        latency = load_finished - job['noticed']
+        if kind == 'done':
+            loaded += 1
+            latencies.append(latency)
+            record('watch', file_path, load_finished - load_started, rows=detail, bytes=job['size'],
+                   wait_seconds=queue_wait, latency_seconds=latency)
+            print(f"Loaded {file_path} into {shard_db}: {detail} rows, searchable {latency:.1f}s after it was noticed "
+                  f"({queue_wait:.1f}s queued, {load_finished - load_started:.1f}s loading).")
+        else:
+            failed += 1
+            # The watcher keeps it settled, so it is tried again once it changes
+            record('watch_failed', file_path, load_finished - load_started, bytes=job['size'], wait_seconds=queue_wait)
+
+    def reap(restart=True):
+        # A loader that died never reports its file; fail the file and replace the process
+        for shard_db, worker in list(workers.items()):
+            if worker['process'].is_alive():
+                continue
+            job = worker['job']
+            print(f"Loader of {shard_db} exited with code {worker['process'].exitcode}"
+                  + (f" while loading {job['path']}." if job is not None else "."))
+            if job is not None:
+                finish(('failed', shard_db, job['path'], 'loader exited', job['dispatched'], time.time()))
+            if restart:
+                start_worker(shard_db)
+            else:
+                del workers[shard_db]
+
+    def dispatch():
+        # Idle databases holding the least go first, like utils.shards.assign_shards
+        idle = [shard_db for shard_db, worker in workers.items() if worker['job'] is None]
+        for shard_db in sorted(idle, key=lambda shard_db: os.path.getsize(shard_db) if os.path.exists(shard_db) else 0):
+            job = jobs.pop(lambda job: job['target'] in (None, shard_db))
+            if job is None:
+                continue
+            stat = os.stat(job['path']) if os.path.exists(job['path']) else None
+            if stat is None or (stat.st_size, stat.st_mtime) != (job['size'], job['mtime']):
+                # Changed (or gone) while queued: the watcher settles it again
+                watcher.forget(job['path'])
+                continue
+            job['target'] = shard_db
+            job['dispatched'] = time.time()
+            workers[shard_db]['job'] = job
+            workers[shard_db]['jobs'].put(job['path'])
+
+    while not stopping and (run_seconds is None or time.time() - started < run_seconds):
+        for file_path, size, mtime, noticed in watcher.scan():
+            jobs.push({'path': file_path, 'size': size, 'mtime': mtime, 'noticed': noticed, 'queued': time.time(),
+                       'interrupted': file_path in interrupted, 'target': get_target(catalog, fts.CATALOG_STAGE, file_path, shard_dbs)})
+        dispatch()
+        in_progress = [worker['job']['path'] for worker in workers.values() if worker['job'] is not None]
+        if (len(jobs), len(in_progress)) != depth:
+            depth = (len(jobs), len(in_progress))
+            record('watch_queue', folder_path, queued=len(jobs), in_progress=len(in_progress))
+        if status_file:
+            write_status(status_file, {
+                'time': time.time(), 'queued': len(jobs), 'in_progress': in_progress, 'loaded': loaded, 'failed': failed,
+                'latency_p50_seconds': percentile(latencies, 0.5), 'latency_p95_seconds': percentile(latencies, 0.95)})
+        # A finished file wakes the loop at once, so the next one starts without waiting for a scan
+        try:
+            result = result_queue.get(timeout=poll_seconds)
+        except Empty:
+            reap()
+            continue
+        finish(result)
+
+    busy = [worker['job']['path'] for worker in workers.values() if worker['job'] is not None]
+    if busy:
+        print(f"Stopping: finishing {len(busy)} file(s) in progress ({len(jobs)} queued files are left for the next start).")
+    while any(worker['job'] is not None for worker in workers.values()):
+        try:
+            finish(result_queue.get(timeout=poll_seconds))
+        except Empty:
+            reap(restart=False)
+    for worker in workers.values():
+        worker['jobs'].put(None)
+    for worker in workers.values():
+        worker['process'].join()
+    catalog.close()
+    print(f"Stopped after loading {loaded} file(s), {failed} failed.")
+    return loaded, failed
+
+if __name__ == "__main__":
+    csv_folder = 'csv_output'  # Folder watched for new and changed CSV (and compressed CSV or Parquet) files
+    sqlite_db = 'meta.db'
+    table_name = 'main_content'
+    fts_table_name = 'main'
+    loader = 'native'  # 'pandas', 'native' or 'parallel', as in fts.py
+    storage = 'padded'  # 'padded' or 'compact', as in fts.py
+    trigram_columns = None  # Substring index: list of column names, 'auto' (by detected type) or None
+    normalized_columns = 'auto'  # Exact phone/email lookup tables: {column: 'phone' or 'email'}, 'auto' or None
+    dedup = False  # Skip rows already loaded from another file
+    shards = 1  # Loader processes; more than 1 loads meta_00.db, meta_01.db, ... side by side, as fts.py does
+    priority = 'smallest'  # 'smallest', 'oldest', 'newest' or 'fifo'
+    poll_seconds = POLL_SECONDS
+    settle_seconds = SETTLE_SECONDS
+    status_file = 'watch_status.json'  # Queue depth and latencies after every scan; None disables it
+    metrics_file = None  # JSON lines of per-stage timings, e.g. 'metrics.jsonl'
+    configure(metrics_file)
+    watch_folder(csv_folder, sqlite_db, table_name, fts_table_name, loader, storage, trigram_columns, normalized_columns, dedup,
+                 shards, priority=priority, poll_seconds=poll_seconds, settle_seconds=settle_seconds, status_file=status_file)
+    print_summary()